@@ -0,0 +1,72 @@
+from ag95.General.async_db_executor import AsyncDbExecutor
+from ag95.DuckDbDatabase.DuckDbWrapper import DuckDbWrapper
+from typing import AnyStr
+
+class AsyncDuckDbWrapper(AsyncDbExecutor):
+    """
+    asyncio facade for DuckDbWrapper: the same methods, as awaitables.
+
+    The connection is owned by a dedicated thread and the requests of all the awaiting coroutines are pipelined to it.
+    The requests are executed one by one: the DuckDbWrapper methods open their own transactions and DuckDb
+    does not support nested ones, so there is no group commit here.
+    The extra keyword arguments are passed to DuckDbWrapper.
+
+    Recommended Usage:
+    async with AsyncDuckDbWrapper(database_path='database.duckdb') as DB:
+        await asyncio.gather(*[DB.append_in_table(...) for _ in range(100)])
+        records = await DB.return_records(...)
+    """
+
+    def __init__(self,
+                 database_path: AnyStr = 'database.duckdb',
+                 max_batch_size: int = 256,
+                 **wrapper_kwargs):
+        super().__init__(wrapper_factory=lambda: DuckDbWrapper(database_path=database_path,
+                                                               **wrapper_kwargs),
+                         max_batch_size=max_batch_size)
+
+if __name__ == '__main__':
+    from ag95.DuckDbDatabase.DuckDbMigration import DuckDbMigration
+    import asyncio
+    import os
+    import shutil
+    # a dedicated db, independent of the other tests
+    shutil.rmtree('async_duckdb_test', ignore_errors=True)
+    os.makedirs('async_duckdb_test')
+    DuckDbMigration(database_path='async_duckdb_test/database.duckdb').migrate()
+
+    async def test():
+        async with AsyncDuckDbWrapper(database_path='async_duckdb_test/database.duckdb') as DB:
+            # TEST concurrent appends are all written
+            await asyncio.gather(*[DB.append_in_table(table_name='my_db_table_name',
+                                                      column_names=['my_column_name1', 'my_column_name2'],
+                                                      column_values=[i, i]) for i in range(50)])
+            result = len(await DB.return_records(table_name='my_db_table_name'))
+            expected = 50
+            assert result == expected, f'wrong value returned ! expected  {expected}, got {result}'
+
+            # TEST an error propagates to the awaiting caller
+            error = None
+            try:
+                await DB.append_in_table(table_name='missing_table',
+                                         column_names=['my_column_name1'],
+                                         column_values=[100])
+            except Exception as e:
+                error = e
+            assert error is not None, 'the error was not propagated'
+
+            # TEST a failing request does not affect the other requests
+            results = await asyncio.gather(DB.append_in_table(table_name='my_db_table_name',
+                                                              column_names=['my_column_name1'],
+                                                              column_values=[100]),
+                                           DB.return_records(table_name='missing_table'),
+                                           return_exceptions=True)
+            assert results[0] is None and isinstance(results[1], Exception), f'wrong value returned ! got {results}'
+            result = len(await DB.return_records(table_name='my_db_table_name'))
+            expected = 51
+            assert result == expected, f'wrong value returned ! expected  {expected}, got {result}'
+
+    asyncio.run(test())
+    shutil.rmtree('async_duckdb_test', ignore_errors=True)
+
+    print('All tests are PASSED !')
@@ -36,6 +36,12 @@ class DuckDbMigration:
                             DB.add_column(table_name=table_def['table_name'],
                                           column_def=column_def)
 
+                # create the missing rollups (optional 'rollups_def': [DuckRollupDef(...)]), back-filled from the existing raw data
+                # !!! THE COLUMNS/ AGGREGATES OF AN EXISTING ROLLUP ARE NOT UPDATED, USE A NEW rollup_name FOR THAT !!!
+                for rollup_def in table_def.get('rollups_def', []):
+                    DB.create_rollup(table_name=table_def['table_name'],
+                                     rollup_def=rollup_def)
+
 if __name__ == '__main__':
     DuckDbMigration().migrate()
 
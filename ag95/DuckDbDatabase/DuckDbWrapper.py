@@ -1,11 +1,28 @@
-from duckdb import connect
+from duckdb import (connect,
+                    CatalogException)
 from typing import List,\
     AnyStr,\
     Dict,\
-    Literal
+    Iterable,\
+    Iterator,\
+    Literal,\
+    Optional,\
+    Tuple,\
+    Union
 from datetime import datetime,\
     timedelta
-from time import sleep
+from ag95.General.query_instrumentation import (QueryInstrumentation,
+                                                TracedConnection,
+                                                instrumented)
+from ag95.General.sql_where_builder import compile_where_filters
+import base64
+import json
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+all_aggregates = Literal['avg', 'min', 'max', 'sum', 'count', 'first', 'last']
 
 class DuckColumnDef:
     def __init__(self,
@@ -14,13 +31,52 @@ class DuckColumnDef:
         self.column_name = column_name
         self.column_type = column_type
 
+all_rollup_aggregates = Literal['avg', 'min', 'max', 'count', 'sum']
+class DuckRollupDef:
+    def __init__(self,
+                 bucket_s: int,
+                 columns: List[AnyStr],
+                 aggregates: List[all_rollup_aggregates] = ['avg', 'min', 'max', 'count'],
+                 rollup_name: Optional[AnyStr] = None):
+        self.bucket_s = int(bucket_s)
+        self.columns = columns
+        self.aggregates = aggregates
+        self.rollup_name = rollup_name or {60: '1m', 60*60: '1h', 24*60*60: '1d'}.get(self.bucket_s, f'{self.bucket_s}s')
+
+    def get_rollup_table_name(self,
+                              table_name: AnyStr) -> AnyStr:
+        return f'{table_name}_rollup_{self.rollup_name}'
+
+    def get_rollup_columns(self) -> List[AnyStr]:
+        # count and sum are always kept, the running avg is computed from them
+        rollup_columns = []
+        for column_name in self.columns:
+            for aggregate in ['count', 'sum', 'min', 'max', 'avg']:
+                if aggregate in ('count', 'sum') or aggregate in self.aggregates:
+                    rollup_columns.append(f'{column_name}_{aggregate}')
+
+        return rollup_columns
+
+# DuckDb has no triggers, so the rollups are registered in this table and updated by the wrapper on every append
+ROLLUPS_TABLE_NAME = 'ag95_rollups'
+
 class DuckDbWrapper():
     def __init__(self,
                  database_path: AnyStr = 'database.duckdb',
-                 timeout: int = 60):
+                 timeout: int = 60,
+                 instrumentation: Optional[QueryInstrumentation] = None):
         self.database_path = database_path
         self.con = connect(database_path)
 
+        # optional latency instrumentation, see the @instrumented methods
+        self.instrumentation = instrumentation
+        self._op_depth = 0
+        self._op_sql = None
+        self._op_lock_wait_s = 0.0
+        if instrumentation:
+            self.con = TracedConnection(connection=self.con,
+                                        trace_callback=self._trace_sql)
+
     def __enter__(self):
         return self
 
@@ -28,15 +84,25 @@ class DuckDbWrapper():
         self.con.commit()
         self.con.close()
 
-    def get_tables_columns(self) -> Dict:
-        tables_columns = {}
-        cursorObj = self.con.cursor()
+    def _trace_sql(self,
+                   sql: str):
+        # keeps the first statement of the current instrumented operation, for the slow-query log
+        if self._op_sql is None and self._op_depth:
+            self._op_sql = sql
 
-        # get a list of all the table names
+    def _get_all_table_names(self) -> List[AnyStr]:
+        cursorObj = self.con.cursor()
         cursorObj.execute("""SELECT table_name 
                              FROM information_schema.tables 
                              WHERE table_schema = 'main';  -- 'main' is the default schema in DuckDB""")
-        all_table_names = [_[0] for _ in cursorObj.fetchall()]
+        return [_[0] for _ in cursorObj.fetchall()]
+
+    def get_tables_columns(self) -> Dict:
+        tables_columns = {}
+        cursorObj = self.con.cursor()
+
+        # get a list of all the table names, except the rollups registry (internal to the wrapper)
+        all_table_names = [_ for _ in self._get_all_table_names() if _ != ROLLUPS_TABLE_NAME]
 
         for table_name in all_table_names:
 
@@ -46,6 +112,7 @@ class DuckDbWrapper():
 
         return tables_columns
 
+    @instrumented
     def create_table(self,
                      table_name: AnyStr,
                      columns_definition: List[DuckColumnDef]):
@@ -62,12 +129,123 @@ class DuckDbWrapper():
 
         self.con.execute(sql_statement)
 
+    def _get_rollups(self,
+                     table_name: AnyStr) -> List:
+        # [(rollup table name, bucket_s, rollup columns)]; read on every append (not cached), so the rollups
+        # created/ dropped by another wrapper on the same database are maintained too.
+        # NOTE: called outside of the append transaction, a failed statement would abort it
+        try:
+            rollups = self.con.execute(f'SELECT rollup_table_name, bucket_s, rollup_columns FROM {ROLLUPS_TABLE_NAME} '
+                                       f'WHERE table_name = ?', [table_name]).fetchall()
+        except CatalogException:
+            # no rollup was ever created on this database
+            return []
+
+        return [(rollup_table_name, bucket_s, rollup_columns.split(',')) for rollup_table_name, bucket_s, rollup_columns in rollups]
+
+    @instrumented
+    def create_rollup(self,
+                      table_name: AnyStr,
+                      rollup_def: DuckRollupDef):
+
+        # a rollup is a regular table (queryable through return_records), one row per bucket, with TIMESTAMP = the bucket start
+        # it is kept up to date incrementally by append_in_table/ append_many_in_table, in the same transaction as the insert;
+        # the raw deletes (clear_old_records) are not propagated, so the rollups survive the retention of the raw data
+        rollup_table_name = rollup_def.get_rollup_table_name(table_name)
+        rollup_columns = rollup_def.get_rollup_columns()
+        if rollup_table_name in self.get_tables_columns():
+            return
+
+        self.con.execute(f'CREATE TABLE IF NOT EXISTS {ROLLUPS_TABLE_NAME} '
+                         f'(table_name VARCHAR, rollup_table_name VARCHAR, bucket_s INTEGER, rollup_columns VARCHAR)')
+        self.create_table(table_name=rollup_table_name,
+                          columns_definition=[DuckColumnDef(column_name=_,
+                                                            column_type='BIGINT' if _.endswith('_count') else 'DOUBLE')
+                                              for _ in rollup_columns])
+        self.con.execute(f'CREATE UNIQUE INDEX idx_{rollup_table_name}_TIMESTAMP ON {rollup_table_name} (TIMESTAMP)')
+
+        # back-fill the new rollup from the raw data already present
+        backfill_selects = []
+        for rollup_column in rollup_columns:
+            column_name, aggregate = rollup_column.rsplit('_', 1)
+            backfill_selects.append(f'{aggregate.upper()}({column_name})')
+        self.con.execute(f"INSERT INTO {rollup_table_name}(TIMESTAMP,{','.join(rollup_columns)}) "
+                         f"SELECT CAST(TIMESTAMP AS BIGINT) // {rollup_def.bucket_s} * {rollup_def.bucket_s} AS BUCKET,{','.join(backfill_selects)} "
+                         f"FROM {table_name} GROUP BY BUCKET")
+
+        self.con.execute(f'INSERT INTO {ROLLUPS_TABLE_NAME} VALUES (?, ?, ?, ?)',
+                         [table_name, rollup_table_name, rollup_def.bucket_s, ','.join(rollup_columns)])
+
+    @instrumented
+    def drop_rollup(self,
+                    table_name: AnyStr,
+                    rollup_def: DuckRollupDef):
+
+        rollup_table_name = rollup_def.get_rollup_table_name(table_name)
+        self._unregister_rollups(table_name=rollup_table_name)
+        self.con.execute(f"DROP TABLE IF EXISTS {rollup_table_name}")
+        # the ID sequence of the rollup table, so the rollup can be created again
+        self.con.execute(f"DROP SEQUENCE IF EXISTS seq_{rollup_table_name}")
+
+    def _unregister_rollups(self,
+                            table_name: AnyStr):
+        # the rollups of table_name and the rollup table_name itself, otherwise the next appends fail on the missing table
+        if ROLLUPS_TABLE_NAME in self._get_all_table_names():
+            self.con.execute(f'DELETE FROM {ROLLUPS_TABLE_NAME} WHERE table_name = ? OR rollup_table_name = ?',
+                             [table_name, table_name])
+
+    def _update_rollups(self,
+                        rollups: List,
+                        column_names: List,
+                        all_values: List[List]):
+
+        # the partial aggregates of each bucket are computed here and merged into the rollup rows with an upsert
+        timestamp_index = column_names.index('TIMESTAMP')
+        for rollup_table_name, bucket_s, rollup_columns in rollups:
+            buckets = {}
+            for values in all_values:
+                buckets.setdefault(int(values[timestamp_index]) // bucket_s * bucket_s, []).append(values)
+
+            update_statements = []
+            for rollup_column in rollup_columns:
+                column_name, aggregate = rollup_column.rsplit('_', 1)
+                running_sum = f'COALESCE({column_name}_sum + excluded.{column_name}_sum, {column_name}_sum, excluded.{column_name}_sum)'
+                running_count = f'{column_name}_count + excluded.{column_name}_count'
+                update_statements.append({'count': f'{rollup_column} = {running_count}',
+                                          'sum': f'{rollup_column} = {running_sum}',
+                                          'avg': f'{rollup_column} = {running_sum} / NULLIF({running_count}, 0)',
+                                          # LEAST/ GREATEST ignore the NULL values
+                                          'min': f'{rollup_column} = LEAST({rollup_column}, excluded.{rollup_column})',
+                                          'max': f'{rollup_column} = GREATEST({rollup_column}, excluded.{rollup_column})'}[aggregate])
+
+            all_parameters = []
+            for bucket, bucket_rows in buckets.items():
+                parameters = [bucket]
+                for rollup_column in rollup_columns:
+                    column_name, aggregate = rollup_column.rsplit('_', 1)
+                    column_index = column_names.index(column_name) if column_name in column_names else None
+                    column_values = [_[column_index] for _ in bucket_rows if _[column_index] is not None] if column_index is not None else []
+                    parameters.append({'count': len(column_values),
+                                       'sum': sum(column_values) if column_values else None,
+                                       'avg': sum(column_values) / len(column_values) if column_values else None,
+                                       'min': min(column_values) if column_values else None,
+                                       'max': max(column_values) if column_values else None}[aggregate])
+                all_parameters.append(parameters)
+
+            self.con.executemany(f"INSERT INTO {rollup_table_name}(TIMESTAMP,{','.join(rollup_columns)}) "
+                                 f"VALUES({','.join(['?']*(len(rollup_columns)+1))}) "
+                                 f"ON CONFLICT (TIMESTAMP) DO UPDATE SET {','.join(update_statements)}",
+                                 all_parameters)
+
+    @instrumented
     def drop_table(self,
                    table_name: AnyStr):
 
+        self._unregister_rollups(table_name=table_name)
         cursorObj = self.con.cursor()
         cursorObj.execute(f"DROP TABLE {table_name}")
 
+    @instrumented
     def delete_record(self,
                     table_name: AnyStr,
                     record_ID: int):
@@ -76,6 +254,20 @@ class DuckDbWrapper():
         set_statement = f"DELETE FROM {table_name} WHERE ID = (?)"
         cursorObj.execute(set_statement, [record_ID, ])
 
+    @instrumented
+    def delete_records(self,
+                       table_name: AnyStr,
+                       record_IDs: List[int]) -> int:
+
+        if not record_IDs:
+            return 0
+
+        cursorObj = self.con.cursor()
+        set_statement = f"DELETE FROM {table_name} WHERE ID IN ({','.join(['?']*len(record_IDs))})"
+        # DuckDb returns the number of deleted rows as the result of the statement
+        return cursorObj.execute(set_statement, list(record_IDs)).fetchone()[0]
+
+    @instrumented
     def add_column(self,
                    table_name: AnyStr,
                    column_def: DuckColumnDef):
@@ -83,6 +275,7 @@ class DuckDbWrapper():
         cursorObj = self.con.cursor()
         cursorObj.execute(f"ALTER TABLE {table_name} ADD {column_def.column_name} {column_def.column_type}")
 
+    @instrumented
     def append_in_table(self,
                         table_name: AnyStr,
                         column_names: List,
@@ -93,16 +286,69 @@ class DuckDbWrapper():
 
         sql = f"INSERT INTO {table_name}({','.join(column_names)}) VALUES({','.join(['?']*len(column_values))})"
 
-        cursorObj = self.con.cursor()
-        cursorObj.execute(sql, column_values)
+        rollups = self._get_rollups(table_name)
+        if not rollups:
+            cursorObj = self.con.cursor()
+            cursorObj.execute(sql, column_values)
+            return
+
+        # the rollups are updated in the same transaction as the insert
+        self.con.begin()
+        try:
+            self.con.execute(sql, column_values)
+            self._update_rollups(rollups=rollups,
+                                 column_names=column_names,
+                                 all_values=[column_values])
+        except:
+            self.con.rollback()
+            raise
+        self.con.commit()
 
-    def return_records(self,
-                       table_name: AnyStr,
-                       select_values: List[AnyStr] = None,
-                       where_statement: AnyStr = None,
-                       order: Literal['DESC', 'ASC'] = None,
-                       order_by: AnyStr = 'ID',
-                       limit: int = None) -> List[List]:
+    @instrumented
+    def append_many_in_table(self,
+                             table_name: AnyStr,
+                             column_names: List,
+                             rows: Iterable[List],
+                             timestamp_per_row: bool = False) -> int:
+
+        if 'TIMESTAMP' in column_names:
+            # the caller provides its own timestamps (back-filling, buffered writes, etc.)
+            all_values = [list(row) for row in rows]
+        elif timestamp_per_row:
+            column_names = ['TIMESTAMP'] + column_names
+            all_values = [[int(datetime.now().timestamp())] + list(row) for row in rows]
+        else:
+            column_names = ['TIMESTAMP'] + column_names
+            timestamp = int(datetime.now().timestamp())
+            all_values = [[timestamp] + list(row) for row in rows]
+
+        if not all_values:
+            return 0
+
+        sql = f"INSERT INTO {table_name}({','.join(column_names)}) VALUES({','.join(['?']*len(column_names))})"
+
+        rollups = self._get_rollups(table_name)
+        # NOTE: self.con is used directly, a DuckDb cursor is a separate connection with its own transaction
+        self.con.begin()
+        try:
+            self.con.executemany(sql, all_values)
+            self._update_rollups(rollups=rollups,
+                                 column_names=column_names,
+                                 all_values=all_values)
+        except:
+            self.con.rollback()
+            raise
+        self.con.commit()
+
+        return len(all_values)
+
+    def _select_sql(self,
+                    table_name: AnyStr,
+                    select_values: List[AnyStr],
+                    where_statement: AnyStr,
+                    order: Literal['DESC', 'ASC'],
+                    order_by: AnyStr,
+                    limit: int) -> str:
 
         sql_command = f'SELECT '
         if select_values:
@@ -117,9 +363,200 @@ class DuckDbWrapper():
         if limit:
             sql_command += f' LIMIT {limit}'
 
+        return sql_command
+
+    @instrumented
+    def return_records(self,
+                       table_name: AnyStr,
+                       select_values: List[AnyStr] = None,
+                       where_statement: AnyStr = None,
+                       order: Literal['DESC', 'ASC'] = None,
+                       order_by: AnyStr = 'ID',
+                       limit: int = None,
+                       output_format: Literal['rows', 'columns'] = 'rows',
+                       where_filters: Optional[List[Tuple]] = None) -> Union[List[List], Dict]:
+
+        # where_filters: [(column, operator, value), ...], compiled to placeholders, see compile_where_filters
+        where_sql, where_parameters = compile_where_filters(where_filters=where_filters,
+                                                            where_statement=where_statement)
+        sql_command = self._select_sql(table_name=table_name,
+                                       select_values=select_values,
+                                       where_statement=where_sql,
+                                       order=order,
+                                       order_by=order_by,
+                                       limit=limit)
+
+        cursorObj = self.con.cursor()
+        cursorObj.execute(sql_command, where_parameters)
+        if output_format == 'rows':
+            return cursorObj.fetchall()
+
+        # columnar output: column name -> array
+        # DuckDb is columnar internally, fetchnumpy hands over its vectors without building any row
+        if numpy is not None:
+            return cursorObj.fetchnumpy()
+
+        column_names = [_[0] for _ in cursorObj.description]
+        return dict(zip(column_names, [list(_) for _ in zip(*cursorObj.fetchall())] or [[] for _ in column_names]))
+
+    def iter_records(self,
+                     table_name: AnyStr,
+                     select_values: List[AnyStr] = None,
+                     where_statement: AnyStr = None,
+                     order: Literal['DESC', 'ASC'] = None,
+                     order_by: AnyStr = 'ID',
+                     limit: int = None,
+                     chunk_size: int = 1000,
+                     yield_chunks: bool = False,
+                     where_filters: Optional[List[Tuple]] = None) -> Iterator:
+
+        # same as return_records, but the rows are fetched in chunks of chunk_size
+        # and yielded one by one (or chunk by chunk), so the peak memory stays flat
+        where_sql, where_parameters = compile_where_filters(where_filters=where_filters,
+                                                            where_statement=where_statement)
+        sql_command = self._select_sql(table_name=table_name,
+                                       select_values=select_values,
+                                       where_statement=where_sql,
+                                       order=order,
+                                       order_by=order_by,
+                                       limit=limit)
+
+        cursorObj = self.con.cursor()
+        cursorObj.execute(sql_command, where_parameters)
+        try:
+            while True:
+                chunk = cursorObj.fetchmany(chunk_size)
+                if not chunk:
+                    break
+                if yield_chunks:
+                    yield chunk
+                else:
+                    yield from chunk
+        finally:
+            cursorObj.close()
+
+    @instrumented
+    def return_records_page(self,
+                            table_name: AnyStr,
+                            select_values: List[AnyStr] = None,
+                            where_statement: AnyStr = None,
+                            order: Literal['DESC', 'ASC'] = 'ASC',
+                            order_by: AnyStr = 'ID',
+                            page_size: int = 1000,
+                            page_cursor: Optional[str] = None,
+                            where_filters: Optional[List[Tuple]] = None) -> Tuple[List, Optional[str]]:
+
+        where_sql, where_parameters = compile_where_filters(where_filters=where_filters,
+                                                            where_statement=where_statement)
+
+        # keyset (seek) pagination: instead of skipping the previous pages, the next page continues
+        # right after the last (order_by, ID) seen => constant cost per page
+        # returns the page and the cursor of the next page (None when there are no more pages)
+        seek_operator = '>' if order == 'ASC' else '<'
+        extra_columns = ['ID'] if order_by == 'ID' else [order_by, 'ID']
+
+        sql_command = f'SELECT '
+        if select_values:
+            sql_command += ', '.join(select_values)
+        else:
+            sql_command += '*'
+        sql_command += f", {', '.join(extra_columns)} FROM {table_name}"
+
+        where_conditions = []
+        parameters = list(where_parameters)
+        if where_sql:
+            where_conditions.append(f'({where_sql})')
+        if page_cursor:
+            last_order_value, last_ID = json.loads(base64.urlsafe_b64decode(page_cursor.encode()))
+            if order_by == 'ID':
+                where_conditions.append(f'ID {seek_operator} ?')
+                parameters += [last_ID]
+            elif last_order_value is None:
+                # the NULLs are sorted first (ASC)/ last (DESC) and never match a comparison
+                # => the rest of the NULLs, then (ASC) all the non NULL values
+                where_conditions.append(f'(({order_by} IS NULL AND ID {seek_operator} ?)'
+                                        + (f' OR {order_by} IS NOT NULL)' if order == 'ASC' else ')'))
+                parameters += [last_ID]
+            else:
+                where_conditions.append(f'({order_by} {seek_operator} ? OR ({order_by} = ? AND ID {seek_operator} ?)'
+                                        + (f' OR {order_by} IS NULL)' if order == 'DESC' else ')'))
+                parameters += [last_order_value, last_order_value, last_ID]
+        if where_conditions:
+            sql_command += f" WHERE {' AND '.join(where_conditions)}"
+
+        sql_command += f' ORDER BY {order_by} {order}'
+        if order_by != 'ID':
+            # same NULLs placement as SQLite (NULL is the smallest value)
+            sql_command += f" NULLS {'FIRST' if order == 'ASC' else 'LAST'}, ID {order}"
+        sql_command += f' LIMIT {page_size}'
+
+        cursorObj = self.con.cursor()
+        rows = cursorObj.execute(sql_command, parameters).fetchall()
+
+        next_page_cursor = None
+        if len(rows) == page_size:
+            last_row = rows[-1]
+            next_page_cursor = base64.urlsafe_b64encode(json.dumps([last_row[-len(extra_columns)],
+                                                                   last_row[-1]]).encode()).decode()
+
+        # strip the extra columns used for seeking
+        return [row[:-len(extra_columns)] for row in rows], next_page_cursor
+
+    @instrumented
+    def return_aggregated(self,
+                          table_name: AnyStr,
+                          columns: List[AnyStr],
+                          bucket_s: int,
+                          agg: List[all_aggregates] = ['avg', 'min', 'max', 'last'],
+                          since: Optional[int] = None,
+                          until: Optional[int] = None,
+                          where_statement: AnyStr = None,
+                          timestamp_column_name: AnyStr = 'TIMESTAMP') -> List[List]:
+
+        # time bucketed aggregation (downsampling) pushed down to SQL
+        # each returned row is (bucket start timestamp, column1 agg1, column1 agg2, ..., column2 agg1, ...)
+        # since (inclusive)/ until (exclusive) are unix timestamps, like the values of the TIMESTAMP column
+        # NOTE: first/ last are the values of the records with the min/ max ID of the bucket
+        bucket_s = int(bucket_s)
+        bucket_sql = f'CAST({timestamp_column_name} AS BIGINT) // {bucket_s} * {bucket_s}'
+
+        inner_selects = [f'{bucket_sql} AS BUCKET', 'MIN(ID) AS FIRST_ID', 'MAX(ID) AS LAST_ID']
+        outer_selects = ['b.BUCKET']
+        for column_name in columns:
+            for aggregate in agg:
+                if aggregate not in all_aggregates.__args__:
+                    raise ValueError(f'Unknown aggregate {aggregate}, available: {all_aggregates.__args__}')
+                if aggregate in ('first', 'last'):
+                    outer_selects.append(f'{aggregate}_record.{column_name}')
+                else:
+                    inner_selects.append(f'{aggregate.upper()}({column_name}) AS {column_name}_{aggregate}')
+                    outer_selects.append(f'b.{column_name}_{aggregate}')
+
+        where_conditions = []
+        parameters = []
+        if since is not None:
+            where_conditions.append(f'{timestamp_column_name} >= (?)')
+            parameters.append(since)
+        if until is not None:
+            where_conditions.append(f'{timestamp_column_name} < (?)')
+            parameters.append(until)
+        if where_statement:
+            where_conditions.append(f'({where_statement})')
+
+        sql_command = f"SELECT {', '.join(outer_selects)} FROM (SELECT {', '.join(inner_selects)} FROM {table_name}"
+        if where_conditions:
+            sql_command += f" WHERE {' AND '.join(where_conditions)}"
+        sql_command += ' GROUP BY BUCKET) b'
+        if 'first' in agg:
+            sql_command += f' LEFT JOIN {table_name} AS first_record ON first_record.ID = b.FIRST_ID'
+        if 'last' in agg:
+            sql_command += f' LEFT JOIN {table_name} AS last_record ON last_record.ID = b.LAST_ID'
+        sql_command += ' ORDER BY b.BUCKET'
+
         cursorObj = self.con.cursor()
-        return cursorObj.execute(sql_command).fetchall()
+        return cursorObj.execute(sql_command, parameters).fetchall()
 
+    @instrumented
     def clear_old_records(self,
                           table_name: AnyStr,
                           since_time_in_past_s: int,
@@ -131,52 +568,88 @@ class DuckDbWrapper():
         cursorObj = self.con.cursor()
         cursorObj.execute(sql)
 
+    @staticmethod
+    def _update_record_sql(table_name: AnyStr,
+                           column_names: tuple) -> str:
+        # a single statement that only rewrites the given columns and only if at least one value differs,
+        # "IS DISTINCT FROM" is the NULL-safe "!=" of DuckDb
+        return (f"UPDATE {table_name} SET {','.join([f'{key} = (?)' for key in column_names])} "
+                f"WHERE ID = (?) AND ({' OR '.join([f'{key} IS DISTINCT FROM (?)' for key in column_names])})")
+
+    @staticmethod
+    def _update_record_data(data: Dict,
+                            skip_new_empty_entries: bool) -> Dict:
+        # remove empty entries from the dict, the existing values are kept for them
+        if skip_new_empty_entries:
+            data = dict(filter(lambda _:_[1], data.items()))
+
+        # we do not want to overwrite the ID column
+        data.pop('ID', None)
+
+        return data
+
+    @instrumented
     def update_record(self,
                       table_name: AnyStr,
                       record_ID: int,
                       data: Dict,
-                      skip_new_empty_entries: bool = False):
+                      skip_new_empty_entries: bool = False) -> int:
 
-        # extract the existing data (column names and values) as a dict
-        cursorObj = self.con.cursor()
-        column_names = [_[0] for _ in cursorObj.execute(f"""SELECT column_name 
-                                                        FROM information_schema.columns 
-                                                        WHERE table_name = '{table_name}';""").fetchall()]
-        column_values = cursorObj.execute(f'SELECT * FROM {table_name} WHERE ID = (?)', [str(record_ID),]).fetchall()
-
-        existing_data = dict([[key, value] for key, value in zip(column_names, column_values[0])])
-
-        # only proceed if data is != existing_data
-        different = False
-        for key, value in data.items():
-            if data[key] != existing_data[key]:
-                different = True
-                break
-        if different:
+        data = self._update_record_data(data=dict(data),
+                                        skip_new_empty_entries=skip_new_empty_entries)
+        if not data:
+            return 0
 
-            # update the dict with the new data passed as an argument
-            existing_data.update(data)
+        set_statement_values = list(data.values())
+        sql = self._update_record_sql(table_name=table_name,
+                                      column_names=tuple(data.keys()))
 
-            # remove empty entries from the dict
-            if skip_new_empty_entries:
-                existing_data = dict(filter(lambda _:_[1], existing_data.items()))
+        cursorObj = self.con.cursor()
+        # DuckDb returns the number of updated rows as the result of the statement
+        # 1 if the record was updated, 0 if it is missing or if nothing changed
+        return cursorObj.execute(sql, set_statement_values + [record_ID] + set_statement_values).fetchone()[0]
 
-            # finally update the row inside the db
-            # NOTE: [1:] is used because we do not want to overwrite the ID column
-            # assumption that should be true: the ID is ALWAYs the first value
-            set_statement_keys = ','.join([f"{key} = (?)" for key, value in list(existing_data.items())[1:]])
-            set_statement_values = list(existing_data.values())[1:]
-            # set_statement = ','.join([f"{key} = '{value}'" for key, value in existing_data.items()])
-            sql = f"UPDATE {table_name} SET {set_statement_keys} WHERE ID = (?)"
+    @instrumented
+    def update_records(self,
+                       table_name: AnyStr,
+                       records: Dict[int, Dict],
+                       skip_new_empty_entries: bool = False) -> int:
+
+        records_updated = 0
+
+        # NOTE: self.con is used directly, a DuckDb cursor is a separate connection with its own transaction
+        self.con.begin()
+        try:
+            for record_ID, data in records.items():
+                data = self._update_record_data(data=dict(data),
+                                                skip_new_empty_entries=skip_new_empty_entries)
+                if data:
+                    set_statement_values = list(data.values())
+                    records_updated += self.con.execute(self._update_record_sql(table_name=table_name,
+                                                                                column_names=tuple(data.keys())),
+                                                        set_statement_values + [record_ID] + set_statement_values).fetchone()[0]
+        except:
+            self.con.rollback()
+            raise
+        self.con.commit()
 
-            cursorObj.execute(sql, set_statement_values + [str(existing_data['ID'])])
+        return records_updated
 
 if __name__ == '__main__':
-    print('There is no DB available by default for this test.'
-          ' Please create one before running this test. Use DbMigration for that.')
-    sleep(2)
+    import os
+    import shutil
+    # a dedicated db, independent of the other tests
+    shutil.rmtree('duckdb_wrapper_test', ignore_errors=True)
+    os.makedirs('duckdb_wrapper_test')
+    database_path = 'duckdb_wrapper_test/database.duckdb'
+
+    with DuckDbWrapper(database_path=database_path) as DB:
+        DB.create_table(table_name='my_db_table_name',
+                        columns_definition=[DuckColumnDef(column_name='my_column_name1',
+                                                          column_type='INTEGER'),
+                                            DuckColumnDef(column_name='my_column_name2',
+                                                          column_type='INTEGER')])
 
-    with DuckDbWrapper() as DB:
         # TEST correct column names query
         result = str(DB.get_tables_columns())
         expected = str({'my_db_table_name': ['ID', 'TIMESTAMP', 'my_column_name1', 'my_column_name2']})
@@ -212,4 +685,161 @@ if __name__ == '__main__':
         expected = str([(1, timestamp, 10, 5)])
         assert result == expected, f'wrong value returned ! expected  {expected}, got {result}'
 
+        # TEST the pagination on a nullable column keeps the NULL rows, in both orders
+        DB.create_table(table_name='my_paging_table',
+                        columns_definition=[DuckColumnDef(column_name='b',
+                                                          column_type='DOUBLE')])
+        DB.append_many_in_table(table_name='my_paging_table',
+                                column_names=['b'],
+                                rows=[[1.0], [None], [3.0], [5.0], [None]])
+        for order, expected in (('ASC', [2, 5, 1, 3, 4]), ('DESC', [4, 3, 1, 5, 2])):
+            result, page_cursor = [], None
+            while True:
+                page, page_cursor = DB.return_records_page(table_name='my_paging_table',
+                                                           select_values=['ID'],
+                                                           order=order,
+                                                           order_by='b',
+                                                           page_size=2,
+                                                           page_cursor=page_cursor)
+                result += [_[0] for _ in page]
+                if not page_cursor:
+                    break
+            assert result == expected, f'wrong value returned ! expected  {expected}, got {result}'
+        DB.drop_table(table_name='my_paging_table')
+
+        # TEST the single statement update only counts the records actually changed
+        result = DB.update_record(table_name='my_db_table_name',
+                                  record_ID=1,
+                                  data={'my_column_name1': 10})
+        expected = 0
+        assert result == expected, f'wrong value returned ! expected  {expected}, got {result}'
+        result = DB.update_records(table_name='my_db_table_name',
+                                   records={1: {'my_column_name2': 6}, 100: {'my_column_name2': 6}})
+        expected = 1
+        assert result == expected, f'wrong value returned ! expected  {expected}, got {result}'
+        DB.update_record(table_name='my_db_table_name',
+                         record_ID=1,
+                         data={'my_column_name2': 5})
+
+        # TEST correct bulk data append
+        timestamp = int(datetime.now().timestamp())
+        result = DB.append_many_in_table(table_name='my_db_table_name',
+                                         column_names=['my_column_name1', 'my_column_name2'],
+                                         rows=[[1, 2], [3, 4]])
+        expected = 2
+        assert result == expected, f'wrong value returned ! expected  {expected}, got {result}'
+        result = str(DB.return_records(table_name='my_db_table_name',
+                                       where_statement='ID > 1'))
+        expected = str([(2, timestamp, 1, 2), (3, timestamp, 3, 4)])
+        assert result == expected, f'wrong value returned ! expected  {expected}, got {result}'
+
+        # TEST the where filters are bound as parameters
+        result = DB.return_records(table_name='my_db_table_name',
+                                   select_values=['ID'],
+                                   where_filters=[('ID', 'IN', [2, 3, 100]), ('my_column_name2', '>=', 4)])
+        expected = [(3,)]
+        assert result == expected, f'wrong value returned ! expected  {expected}, got {result}'
+
+        # TEST correct chunked data return
+        result = list(DB.iter_records(table_name='my_db_table_name',
+                                      select_values=['my_column_name1'],
+                                      order='ASC',
+                                      chunk_size=2,
+                                      yield_chunks=True))
+        expected = [[(10,), (1,)], [(3,)]]
+        assert result == expected, f'wrong value returned ! expected  {expected}, got {result}'
+
+        # TEST correct paginated data return
+        result, page_cursor = [], None
+        while True:
+            page, page_cursor = DB.return_records_page(table_name='my_db_table_name',
+                                                       select_values=['ID'],
+                                                       page_size=2,
+                                                       page_cursor=page_cursor)
+            result += page
+            if not page_cursor:
+                break
+        expected = [(1,), (2,), (3,)]
+        assert result == expected, f'wrong value returned ! expected  {expected}, got {result}'
+
+        # TEST the columnar output
+        result = DB.return_records(table_name='my_db_table_name',
+                                   select_values=['ID', 'my_column_name1'],
+                                   output_format='columns')
+        result = {column_name: list(values) for column_name, values in result.items()}
+        expected = {'ID': [1, 2, 3], 'my_column_name1': [10, 1, 3]}
+        assert result == expected, f'wrong value returned ! expected  {expected}, got {result}'
+
+        # TEST the time bucketed aggregation, first/ last by ID
+        result = DB.return_aggregated(table_name='my_db_table_name',
+                                      columns=['my_column_name1'],
+                                      bucket_s=10**10,
+                                      agg=['min', 'max', 'count', 'first', 'last'])
+        expected = [(0, 1, 10, 3, 10, 3)]
+        assert result == expected, f'wrong value returned ! expected  {expected}, got {result}'
+
+        # TEST the rollups are back-filled on creation and then maintained on every append, NULLs ignored
+        DB.create_table(table_name='my_rollup_source',
+                        columns_definition=[DuckColumnDef(column_name='v',
+                                                          column_type='DOUBLE')])
+        DB.append_many_in_table(table_name='my_rollup_source',
+                                column_names=['TIMESTAMP', 'v'],
+                                rows=[[0, 1.0]])
+        DB.create_rollup(table_name='my_rollup_source',
+                         rollup_def=DuckRollupDef(bucket_s=60,
+                                                  columns=['v']))
+        DB.append_many_in_table(table_name='my_rollup_source',
+                                column_names=['TIMESTAMP', 'v'],
+                                rows=[[30, 3.0], [60, 5.0], [61, None]])
+        result = DB.return_records(table_name='my_rollup_source_rollup_1m',
+                                   select_values=['TIMESTAMP', 'v_count', 'v_sum', 'v_min', 'v_max', 'v_avg'],
+                                   order='ASC',
+                                   order_by='TIMESTAMP')
+        expected = [(0, 2, 4.0, 1.0, 3.0, 2.0), (60, 1, 5.0, 5.0, 5.0, 5.0)]
+        assert result == expected, f'wrong value returned ! expected  {expected}, got {result}'
+        assert ROLLUPS_TABLE_NAME not in DB.get_tables_columns(), 'the rollups registry is listed as a table'
+
+        # TEST a rollup created by another wrapper on the same database is maintained
+        with DuckDbWrapper(database_path=database_path) as other_DB:
+            other_DB.create_rollup(table_name='my_rollup_source',
+                                   rollup_def=DuckRollupDef(bucket_s=3600,
+                                                            columns=['v']))
+        DB.append_many_in_table(table_name='my_rollup_source',
+                                column_names=['TIMESTAMP', 'v'],
+                                rows=[[90, 2.0]])
+        result = DB.return_records(table_name='my_rollup_source_rollup_1h',
+                                   select_values=['TIMESTAMP', 'v_count'])
+        expected = [(0, 4)]
+        assert result == expected, f'wrong value returned ! expected  {expected}, got {result}'
+
+        # TEST the appends still work after a rollup is dropped, with drop_rollup or drop_table
+        DB.drop_rollup(table_name='my_rollup_source',
+                       rollup_def=DuckRollupDef(bucket_s=3600,
+                                                columns=['v']))
+        DB.drop_table(table_name='my_rollup_source_rollup_1m')
+        DB.append_in_table(table_name='my_rollup_source',
+                           column_names=['v'],
+                           column_values=[1.0])
+        result = list(DB.get_tables_columns().keys())
+        expected = ['my_db_table_name', 'my_rollup_source']
+        assert result == expected, f'wrong value returned ! expected  {expected}, got {result}'
+
+    # TEST the instrumentation records the operations, the rows and the SQL of the slow queries
+    instrumentation = QueryInstrumentation(slow_query_threshold_s=0)
+    with DuckDbWrapper(database_path=database_path, instrumentation=instrumentation) as DB:
+        DB.return_records(table_name='my_db_table_name')
+        DB.append_many_in_table(table_name='my_db_table_name',
+                                column_names=['my_column_name1', 'my_column_name2'],
+                                rows=[[5, 6]])
+
+    result = instrumentation.get_stats()
+    assert result['return_records']['my_db_table_name']['count'] == 1, f'wrong stats returned ! got {result}'
+    assert result['return_records']['my_db_table_name']['rows_total'] == 3, f'wrong stats returned ! got {result}'
+    assert result['append_many_in_table']['my_db_table_name']['rows_total'] == 1, f'wrong stats returned ! got {result}'
+    result = instrumentation.get_slow_queries()[0]['sql']
+    expected = 'SELECT * FROM my_db_table_name'
+    assert result == expected, f'wrong value returned ! expected  {expected}, got {result}'
+
+    shutil.rmtree('duckdb_wrapper_test', ignore_errors=True)
+
     print('All tests are PASSED !')
\ No newline at end of file
@@ -0,0 +1,228 @@
+from threading import (Thread,
+                       Event)
+from typing import (Callable,
+                    Dict,
+                    List)
+import asyncio
+import inspect
+import queue
+
+# queue marker, handled by the executor thread
+_STOP = object()
+
+class _DbRequest():
+    __slots__ = ('loop', 'future', 'method_name', 'args', 'kwargs')
+
+    def __init__(self, loop, future, method_name, args, kwargs):
+        self.loop = loop
+        self.future = future
+        self.method_name = method_name
+        self.args = args
+        self.kwargs = kwargs
+
+def _resolve(future: asyncio.Future,
+             result,
+             error):
+    # runs in the event loop thread
+    if future.cancelled():
+        return
+    if error is not None:
+        future.set_exception(error)
+    else:
+        future.set_result(result)
+
+class AsyncDbExecutor():
+    """
+    asyncio facade over a (blocking) database wrapper.
+
+    The wrapper is created by wrapper_factory in a dedicated thread that owns the connection; every public
+    method of the wrapper becomes an awaitable with the same signature. The awaiting coroutines only put
+    their request in a queue (no lock), the thread drains the queue and runs up to max_batch_size requests
+    back to back (pipelining), then resolves their futures on their event loop.
+    The subclasses can override _run_batch to run a drained batch in a single transaction (group commit).
+    """
+
+    def __init__(self,
+                 wrapper_factory: Callable,
+                 max_batch_size: int = 256):
+        self.max_batch_size = max_batch_size
+
+        self._wrapper_class = None
+        self._queue = queue.SimpleQueue()
+        self._stats = {'requests': 0,
+                       'batches': 0,
+                       'batch_size_max': 0}
+
+        self._ready = Event()
+        self._startup_error = None
+        self._thread = Thread(target=self._executor_loop,
+                              args=(wrapper_factory,),
+                              daemon=True)
+        self._thread.start()
+
+        # the connection is opened in the executor thread, its errors are raised here
+        self._ready.wait()
+        if self._startup_error is not None:
+            raise self._startup_error
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, exc_traceback):
+        await self.close()
+
+    async def close(self):
+        # the requests queued before close are still executed, then the connection is closed
+        if not self._thread.is_alive():
+            return
+        self._queue.put(_STOP)
+        await asyncio.get_running_loop().run_in_executor(None, self._thread.join)
+
+    def get_stats(self) -> Dict:
+        stats = dict(self._stats)
+        stats['batch_size_avg'] = stats['requests'] / stats['batches'] if stats['batches'] else 0.0
+        stats['queue_size'] = self._queue.qsize()
+        return stats
+
+    def __getattr__(self, method_name: str):
+        method = getattr(self._wrapper_class, method_name, None) if not method_name.startswith('_') else None
+        if method is None or not callable(method):
+            raise AttributeError(f'{type(self).__name__} has no method {method_name}')
+        if inspect.isgeneratorfunction(method):
+            # a generator would have to be consumed in the executor thread
+            raise AttributeError(f'{method_name} is a generator, it can not be awaited; use return_records/ return_records_page instead')
+
+        async def call(*args, **kwargs):
+            loop = asyncio.get_running_loop()
+            future = loop.create_future()
+            self._queue.put(_DbRequest(loop, future, method_name, args, kwargs))
+            return await future
+
+        call.__name__ = method_name
+        call.__doc__ = method.__doc__
+        return call
+
+    def _run_request(self,
+                     db,
+                     request: _DbRequest):
+        try:
+            return getattr(db, request.method_name)(*request.args, **request.kwargs), None
+        except Exception as e:
+            return None, e
+
+    def _run_batch(self,
+                   db,
+                   requests: List[_DbRequest]) -> List:
+        # [(result, error)] in the order of the requests
+        return [self._run_request(db, request) for request in requests]
+
+    def _executor_loop(self,
+                       wrapper_factory: Callable):
+        try:
+            db = wrapper_factory()
+            self._wrapper_class = type(db)
+        except Exception as e:
+            self._startup_error = e
+            return
+        finally:
+            self._ready.set()
+
+        stop = False
+        while not stop:
+            requests = []
+            item = self._queue.get()
+            while True:
+                if item is _STOP:
+                    stop = True
+                    break
+                requests.append(item)
+                if len(requests) >= self.max_batch_size:
+                    break
+                try:
+                    item = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+
+            if requests:
+                self._stats['requests'] += len(requests)
+                self._stats['batches'] += 1
+                self._stats['batch_size_max'] = max(self._stats['batch_size_max'], len(requests))
+
+                for request, (result, error) in zip(requests, self._run_batch(db, requests)):
+                    try:
+                        request.loop.call_soon_threadsafe(_resolve, request.future, result, error)
+                    except RuntimeError:
+                        # the event loop of the caller is already closed
+                        pass
+
+        db.__exit__(None, None, None)
+
+if __name__ == '__main__':
+    class _MemoryWrapper():
+        # minimal blocking wrapper, no DB needed for this test
+        def __init__(self):
+            self.records = []
+            self.closed = False
+
+        def __exit__(self, exc_type, exc_value, exc_traceback):
+            self.closed = True
+
+        def append_in_table(self, value):
+            self.records.append(value)
+
+        def return_records(self):
+            return list(self.records)
+
+        def iter_records(self):
+            yield from self.records
+
+        def _hidden(self):
+            return self.records
+
+    async def test():
+        async with AsyncDbExecutor(wrapper_factory=_MemoryWrapper) as DB:
+            # TEST a write then a read are executed in order
+            await DB.append_in_table(7)
+            result = await DB.return_records()
+            expected = [7]
+            assert result == expected, f'wrong value returned ! expected  {expected}, got {result}'
+
+            # TEST the concurrent requests are all executed
+            await asyncio.gather(*[DB.append_in_table(i) for i in range(10)])
+            result = len(await DB.return_records())
+            expected = 11
+            assert result == expected, f'wrong value returned ! expected  {expected}, got {result}'
+            result = DB.get_stats()
+            assert result['requests'] == 13 and 1 <= result['batches'] <= 13, f'wrong stats returned ! got {result}'
+
+            # TEST an error raised in the executor thread propagates to the awaiting caller
+            error = None
+            try:
+                await DB.append_in_table()
+            except TypeError as e:
+                error = e
+            assert error is not None, 'the error was not propagated'
+
+            # TEST the generators and the private methods can not be awaited
+            for method_name in ['iter_records', '_hidden', 'missing_method']:
+                error = None
+                try:
+                    getattr(DB, method_name)
+                except AttributeError as e:
+                    error = e
+                assert error is not None, f'{method_name} was exposed'
+
+        # TEST a failing wrapper_factory raises in the constructor
+        def failing_factory():
+            raise ValueError('no connection')
+
+        error = None
+        try:
+            AsyncDbExecutor(wrapper_factory=failing_factory)
+        except ValueError as e:
+            error = e
+        assert error is not None, 'the startup error was not propagated'
+
+    asyncio.run(test())
+
+    print('All tests are PASSED !')
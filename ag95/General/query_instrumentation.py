@@ -0,0 +1,274 @@
+from collections import deque
+from functools import wraps
+from logging import getLogger
+from math import (ceil,
+                  log)
+from threading import Lock
+from time import perf_counter
+from datetime import datetime
+from typing import (AnyStr,
+                    Dict,
+                    List,
+                    Optional)
+
+# log-scale latency buckets, each bucket is ~19% wider than the previous one, starting at 1us
+_BUCKET_BASE = 2 ** 0.25
+_BUCKET_START_S = 1e-6
+_MAX_SQL_LENGTH = 2000
+
+class _OperationStats():
+    __slots__ = ('count', 'errors', 'duration_s_total', 'duration_s_max',
+                 'buckets', 'rows_total', 'lock_wait_s_total', 'lock_wait_s_max')
+
+    def __init__(self):
+        self.count = 0
+        self.errors = 0
+        self.duration_s_total = 0.0
+        self.duration_s_max = 0.0
+        # bucket index -> number of samples
+        self.buckets = {}
+        self.rows_total = 0
+        self.lock_wait_s_total = 0.0
+        self.lock_wait_s_max = 0.0
+
+    def percentile(self,
+                   percent: float) -> float:
+        # upper bound of the bucket holding the percentile, capped to the slowest sample
+        if not self.count:
+            return 0.0
+
+        rank = ceil(self.count * percent / 100)
+        seen = 0
+        for bucket_index in sorted(self.buckets):
+            seen += self.buckets[bucket_index]
+            if seen >= rank:
+                return min(_BUCKET_START_S * _BUCKET_BASE ** bucket_index, self.duration_s_max)
+
+        return self.duration_s_max
+
+class QueryInstrumentation():
+    """
+    In-memory latency instrumentation for the database wrappers.
+
+    Each operation (return_records, append_in_table, etc.) is recorded per table: count, errors,
+    latency histogram (p50/p95/p99), rows returned/ affected and the time spent waiting for a lock.
+    The operations slower than slow_query_threshold_s are kept, with their SQL, in a bounded slow-query log.
+    The same instance can be shared by several wrappers/ threads.
+
+    Recommended Usage:
+    instrumentation = QueryInstrumentation(slow_query_threshold_s=0.5)
+    with SqLiteDbWrapper(instrumentation=instrumentation) as DB:
+        DB.return_records(...)
+    print(instrumentation.get_stats())
+    print(instrumentation.to_prometheus())
+    """
+
+    def __init__(self,
+                 slow_query_threshold_s: Optional[float] = 0.5,
+                 slow_query_log_size: int = 100,
+                 log_slow_queries: bool = False):
+        self._log = getLogger()
+
+        self.slow_query_threshold_s = slow_query_threshold_s
+        self.log_slow_queries = log_slow_queries
+
+        self._lock = Lock()
+        # (operation, table name) -> _OperationStats
+        self._operations = {}
+        self._slow_queries = deque(maxlen=slow_query_log_size)
+
+    def record(self,
+               operation: AnyStr,
+               table_name: Optional[AnyStr],
+               duration_s: float,
+               rows: Optional[int] = None,
+               lock_wait_s: float = 0.0,
+               sql: Optional[AnyStr] = None,
+               error: bool = False):
+        bucket_index = max(0, ceil(log(duration_s / _BUCKET_START_S, _BUCKET_BASE))) if duration_s > _BUCKET_START_S else 0
+
+        with self._lock:
+            operation_stats = self._operations.get((operation, table_name))
+            if operation_stats is None:
+                operation_stats = self._operations[(operation, table_name)] = _OperationStats()
+
+            operation_stats.count += 1
+            operation_stats.errors += error
+            operation_stats.duration_s_total += duration_s
+            operation_stats.duration_s_max = max(operation_stats.duration_s_max, duration_s)
+            operation_stats.buckets[bucket_index] = operation_stats.buckets.get(bucket_index, 0) + 1
+            operation_stats.rows_total += rows or 0
+            operation_stats.lock_wait_s_total += lock_wait_s
+            operation_stats.lock_wait_s_max = max(operation_stats.lock_wait_s_max, lock_wait_s)
+
+            if self.slow_query_threshold_s is not None and duration_s >= self.slow_query_threshold_s:
+                sql = sql[:_MAX_SQL_LENGTH] if sql else sql
+                self._slow_queries.append({'timestamp': int(datetime.now().timestamp()),
+                                           'operation': operation,
+                                           'table_name': table_name,
+                                           'duration_s': duration_s,
+                                           'rows': rows,
+                                           'lock_wait_s': lock_wait_s,
+                                           'error': error,
+                                           'sql': sql})
+                if self.log_slow_queries:
+                    self._log.warning(f'Slow {operation} on {table_name}: {duration_s:.3f}s'
+                                      f' (lock wait {lock_wait_s:.3f}s, rows {rows}): {sql}')
+
+    def get_stats(self) -> Dict:
+        # {operation: {table name: stats}}
+        stats = {}
+        with self._lock:
+            for (operation, table_name), operation_stats in self._operations.items():
+                stats.setdefault(operation, {})[table_name] = {
+                    'count': operation_stats.count,
+                    'errors': operation_stats.errors,
+                    'p50_s': operation_stats.percentile(50),
+                    'p95_s': operation_stats.percentile(95),
+                    'p99_s': operation_stats.percentile(99),
+                    'avg_s': operation_stats.duration_s_total / operation_stats.count,
+                    'max_s': operation_stats.duration_s_max,
+                    'rows_total': operation_stats.rows_total,
+                    'lock_wait_s_total': operation_stats.lock_wait_s_total,
+                    'lock_wait_s_max': operation_stats.lock_wait_s_max}
+
+        return stats
+
+    def get_slow_queries(self) -> List[Dict]:
+        with self._lock:
+            return list(self._slow_queries)
+
+    def reset(self):
+        with self._lock:
+            self._operations = {}
+            self._slow_queries.clear()
+
+    def to_prometheus(self,
+                      prefix: AnyStr = 'ag95_db') -> str:
+        lines = {'duration': [f'# TYPE {prefix}_operation_duration_seconds summary'],
+                 'errors': [f'# TYPE {prefix}_operation_errors_total counter'],
+                 'rows': [f'# TYPE {prefix}_operation_rows_total counter'],
+                 'lock_wait': [f'# TYPE {prefix}_operation_lock_wait_seconds_total counter']}
+
+        for operation, tables_stats in self.get_stats().items():
+            for table_name, stats in tables_stats.items():
+                labels = f'operation="{operation}",table="{table_name or ""}"'
+                for quantile, percentile in (('0.5', 'p50_s'), ('0.95', 'p95_s'), ('0.99', 'p99_s')):
+                    lines['duration'].append(f'{prefix}_operation_duration_seconds{{{labels},quantile="{quantile}"}} {stats[percentile]}')
+                lines['duration'].append(f'{prefix}_operation_duration_seconds_sum{{{labels}}} {stats["avg_s"] * stats["count"]}')
+                lines['duration'].append(f'{prefix}_operation_duration_seconds_count{{{labels}}} {stats["count"]}')
+                lines['errors'].append(f'{prefix}_operation_errors_total{{{labels}}} {stats["errors"]}')
+                lines['rows'].append(f'{prefix}_operation_rows_total{{{labels}}} {stats["rows_total"]}')
+                lines['lock_wait'].append(f'{prefix}_operation_lock_wait_seconds_total{{{labels}}} {stats["lock_wait_s_total"]}')
+
+        return '\n'.join(line for group in lines.values() for line in group) + '\n'
+
+class TracedConnection():
+    """
+    Connection proxy passing the SQL of every execute/ executemany to trace_callback,
+    for the drivers without a native trace callback (DuckDb); cursor() returns a traced cursor as well.
+    """
+
+    def __init__(self,
+                 connection,
+                 trace_callback):
+        self._connection = connection
+        self._trace_callback = trace_callback
+
+    def execute(self, sql, *args, **kwargs):
+        self._trace_callback(sql)
+        return self._connection.execute(sql, *args, **kwargs)
+
+    def executemany(self, sql, *args, **kwargs):
+        self._trace_callback(sql)
+        return self._connection.executemany(sql, *args, **kwargs)
+
+    def cursor(self):
+        return TracedConnection(connection=self._connection.cursor(),
+                                trace_callback=self._trace_callback)
+
+    def __getattr__(self, name):
+        return getattr(self._connection, name)
+
+def _count_rows(result) -> Optional[int]:
+    # rows returned (lists, pages, columns) or affected (int)
+    if isinstance(result, bool) or result is None:
+        return None
+    if isinstance(result, int):
+        return result
+    if isinstance(result, tuple) and len(result) == 2 and isinstance(result[0], list):
+        return len(result[0])
+    if isinstance(result, dict):
+        return len(next(iter(result.values()), []))
+    try:
+        return len(result)
+    except TypeError:
+        return None
+
+def instrumented(fn):
+    """
+    Records the decorated wrapper method in self.instrumentation, if set.
+
+    The wrapper must provide the instrumentation, _op_depth, _op_sql and _op_lock_wait_s attributes;
+    only the outermost instrumented call is recorded, the nested ones are part of it.
+    """
+
+    operation = fn.__name__
+
+    @wraps(fn)
+    def wrapper(self, *args, **kwargs):
+        if self.instrumentation is None or self._op_depth:
+            return fn(self, *args, **kwargs)
+
+        self._op_depth = 1
+        self._op_sql = None
+        result = None
+        error = False
+        start = perf_counter()
+        try:
+            result = fn(self, *args, **kwargs)
+            return result
+        except:
+            error = True
+            raise
+        finally:
+            duration_s = perf_counter() - start
+            self._op_depth = 0
+            table_name = kwargs.get('table_name', args[0] if args and isinstance(args[0], str) else None)
+            self.instrumentation.record(operation=operation,
+                                        table_name=table_name,
+                                        duration_s=duration_s,
+                                        rows=None if error else _count_rows(result),
+                                        lock_wait_s=self._op_lock_wait_s,
+                                        sql=self._op_sql,
+                                        error=error)
+            self._op_lock_wait_s = 0.0
+
+    return wrapper
+
+if __name__ == '__main__':
+    instrumentation = QueryInstrumentation(slow_query_threshold_s=0.05)
+    for i in range(100):
+        instrumentation.record(operation='return_records',
+                               table_name='my_db_table_name',
+                               duration_s=0.001 * (i + 1),
+                               rows=10)
+
+    # TEST the percentiles, within the resolution of the histogram buckets
+    result = instrumentation.get_stats()['return_records']['my_db_table_name']
+    assert result['count'] == 100 and result['rows_total'] == 1000, f'wrong stats returned ! got {result}'
+    for percent in (50, 95, 99):
+        expected = 0.001 * percent
+        assert expected <= result[f'p{percent}_s'] <= expected * _BUCKET_BASE, f'wrong p{percent} returned ! expected ~{expected}, got {result}'
+
+    # TEST the slow-query log
+    result = len(instrumentation.get_slow_queries())
+    expected = 51
+    assert result == expected, f'wrong value returned ! expected  {expected}, got {result}'
+
+    # TEST the prometheus output
+    result = instrumentation.to_prometheus()
+    assert 'ag95_db_operation_duration_seconds_count{operation="return_records",table="my_db_table_name"} 100' in result, \
+        f'wrong prometheus output ! got {result}'
+
+    print('All tests are PASSED !')
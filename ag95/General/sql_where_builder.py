@@ -0,0 +1,93 @@
+from typing import (List,
+                    Literal,
+                    Optional,
+                    Sequence,
+                    Tuple)
+import re
+
+all_filter_operators = Literal['=', '!=', '<>', '<', '<=', '>', '>=', 'LIKE', 'NOT LIKE',
+                               'IN', 'NOT IN', 'BETWEEN', 'IS NULL', 'IS NOT NULL']
+_VALUE_OPERATORS = {'=', '!=', '<>', '<', '<=', '>', '>=', 'LIKE', 'NOT LIKE'}
+_IDENTIFIER = re.compile(r'^[A-Za-z_][A-Za-z0-9_]*$')
+
+def compile_where_filters(where_filters: Optional[Sequence[Sequence]],
+                          where_statement: Optional[str] = None) -> Tuple[Optional[str], List]:
+    """
+    Compiles a list of (column, operator, value) filters, AND-ed together, to a where clause with placeholders.
+
+    The values are never part of the SQL text, they are returned as the bound parameters; so the same
+    filter shape always compiles to the same SQL text and the prepared statement can be reused across calls.
+    ('=', None)/ ('!=', None) compile to IS NULL/ IS NOT NULL, 'IN'/ 'NOT IN' take a list of values,
+    'BETWEEN' a (low, high) pair and 'IS NULL'/ 'IS NOT NULL' no value.
+    An optional raw where_statement is AND-ed with the filters.
+
+    Usage:
+    where_sql, parameters = compile_where_filters([('my_column_name1', '>', 5), ('my_column_name2', 'IN', [1, 2])])
+    # where_sql: 'my_column_name1 > ? AND my_column_name2 IN (?,?)', parameters: [5, 1, 2]
+    """
+
+    conditions = []
+    parameters = []
+    if where_statement:
+        # parenthesized, the raw statement may contain ORs
+        conditions.append(f'({where_statement})' if where_filters else where_statement)
+
+    for where_filter in where_filters or []:
+        column_name, operator, value = (list(where_filter) + [None])[:3]
+        if not isinstance(column_name, str) or not _IDENTIFIER.match(column_name):
+            raise ValueError(f'Invalid filter column {column_name}')
+        operator = str(operator).strip().upper()
+
+        if operator in _VALUE_OPERATORS:
+            if value is None and operator in ('=', '!=', '<>'):
+                conditions.append(f"{column_name} {'IS NULL' if operator == '=' else 'IS NOT NULL'}")
+            else:
+                conditions.append(f'{column_name} {operator} ?')
+                parameters.append(value)
+
+        elif operator in ('IN', 'NOT IN'):
+            value = list(value)
+            if value:
+                conditions.append(f"{column_name} {operator} ({','.join(['?']*len(value))})")
+                parameters.extend(value)
+            else:
+                # an empty IN list matches nothing, an empty NOT IN list matches everything
+                conditions.append('0 = 1' if operator == 'IN' else '1 = 1')
+
+        elif operator == 'BETWEEN':
+            low, high = value
+            conditions.append(f'{column_name} BETWEEN ? AND ?')
+            parameters.extend([low, high])
+
+        elif operator in ('IS NULL', 'IS NOT NULL'):
+            conditions.append(f'{column_name} {operator}')
+
+        else:
+            raise ValueError(f'Unknown filter operator {operator}')
+
+    return ' AND '.join(conditions) if conditions else None, parameters
+
+if __name__ == '__main__':
+    # TEST the values are bound, not embedded in the SQL
+    result = compile_where_filters([('my_column_name1', '>', 5),
+                                    ('my_column_name2', 'in', [1, 2]),
+                                    ('my_column_name3', '=', None),
+                                    ('TIMESTAMP', 'BETWEEN', (10, 20))])
+    expected = ('my_column_name1 > ? AND my_column_name2 IN (?,?) AND my_column_name3 IS NULL AND TIMESTAMP BETWEEN ? AND ?',
+                [5, 1, 2, 10, 20])
+    assert result == expected, f'wrong value returned ! expected  {expected}, got {result}'
+
+    # TEST the raw where_statement is AND-ed with the filters
+    result = compile_where_filters([['ID', '<', 3]], where_statement='ID > 1 OR ID = 0')
+    expected = ('(ID > 1 OR ID = 0) AND ID < ?', [3])
+    assert result == expected, f'wrong value returned ! expected  {expected}, got {result}'
+
+    # TEST the column names are validated
+    invalid_column_rejected = False
+    try:
+        compile_where_filters([('ID = 1 OR 1', '=', 1)])
+    except ValueError:
+        invalid_column_rejected = True
+    assert invalid_column_rejected, 'an invalid column name was accepted'
+
+    print('All tests are PASSED !')
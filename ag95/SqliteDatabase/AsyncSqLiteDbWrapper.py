@@ -0,0 +1,109 @@
+from ag95.General.async_db_executor import AsyncDbExecutor
+from ag95.SqliteDatabase.SqLiteDbWrapper import SqLiteDbWrapper
+from typing import (AnyStr,
+                    List)
+import asyncio
+
+# the methods that never write, a batch made only of them does not need the write lock
+READ_METHODS = {'get_tables_columns', 'get_tables_indexes', 'get_active_pragmas',
+                'return_records', 'return_records_page', 'return_aggregated'}
+
+class AsyncSqLiteDbWrapper(AsyncDbExecutor):
+    """
+    asyncio facade for SqLiteDbWrapper: the same methods, as awaitables.
+
+    The connection is owned by a dedicated thread; the requests of all the awaiting coroutines are pipelined
+    to it and the writes drained together are committed in a single transaction (group commit), each request
+    in its own savepoint, so a failing request does not undo the others. The futures are resolved after the commit.
+    The extra keyword arguments are passed to SqLiteDbWrapper.
+
+    Recommended Usage:
+    async with AsyncSqLiteDbWrapper(database_path='database.db') as DB:
+        await asyncio.gather(*[DB.append_in_table(...) for _ in range(100)])
+        records = await DB.return_records(...)
+    """
+
+    def __init__(self,
+                 database_path: AnyStr = 'database.db',
+                 max_batch_size: int = 256,
+                 **wrapper_kwargs):
+        def wrapper_factory():
+            db = SqLiteDbWrapper(database_path=database_path,
+                                 **wrapper_kwargs)
+            db.con.commit()
+            # auto-commit mode, the transactions are opened explicitly by _run_batch/ the wrapper methods
+            db.con.isolation_level = None
+            return db
+
+        super().__init__(wrapper_factory=wrapper_factory,
+                         max_batch_size=max_batch_size)
+
+    def _run_batch(self,
+                   db: SqLiteDbWrapper,
+                   requests: List) -> List:
+        if len(requests) == 1 or all(_.method_name in READ_METHODS for _ in requests):
+            return super()._run_batch(db, requests)
+
+        results = []
+        try:
+            db.con.execute('BEGIN IMMEDIATE')
+            for request in requests:
+                db.con.execute('SAVEPOINT async_request')
+                result, error = self._run_request(db, request)
+                if error is not None:
+                    db.con.execute('ROLLBACK TO async_request')
+                db.con.execute('RELEASE async_request')
+                results.append((result, error))
+            db.con.execute('COMMIT')
+        except Exception as e:
+            if db.con.in_transaction:
+                db.con.execute('ROLLBACK')
+            # nothing of the batch was committed
+            return [(None, e) for _ in requests]
+
+        return results
+
+if __name__ == '__main__':
+    from ag95.SqliteDatabase.SqLiteDbMigration import SqLiteDbMigration
+    import os
+    import shutil
+    # a dedicated db, independent of the other tests
+    shutil.rmtree('async_sqlite_test', ignore_errors=True)
+    os.makedirs('async_sqlite_test')
+    SqLiteDbMigration(database_path='async_sqlite_test/database.db').migrate()
+
+    async def test():
+        async with AsyncSqLiteDbWrapper(database_path='async_sqlite_test/database.db') as DB:
+            # TEST concurrent appends are all written
+            await asyncio.gather(*[DB.append_in_table(table_name='my_db_table_name',
+                                                      column_names=['my_column_name1', 'my_column_name2'],
+                                                      column_values=[i, i]) for i in range(50)])
+            result = len(await DB.return_records(table_name='my_db_table_name'))
+            expected = 50
+            assert result == expected, f'wrong value returned ! expected  {expected}, got {result}'
+
+            # TEST an error propagates to the awaiting caller
+            error = None
+            try:
+                await DB.return_records(table_name='missing_table')
+            except Exception as e:
+                error = e
+            assert error is not None, 'the error was not propagated'
+
+            # TEST a failing request does not undo the other requests of its batch
+            results = await asyncio.gather(DB.append_in_table(table_name='my_db_table_name',
+                                                              column_names=['my_column_name1'],
+                                                              column_values=[100]),
+                                           DB.append_in_table(table_name='missing_table',
+                                                              column_names=['my_column_name1'],
+                                                              column_values=[100]),
+                                           return_exceptions=True)
+            assert results[0] is None and isinstance(results[1], Exception), f'wrong value returned ! got {results}'
+            result = len(await DB.return_records(table_name='my_db_table_name'))
+            expected = 51
+            assert result == expected, f'wrong value returned ! expected  {expected}, got {result}'
+
+    asyncio.run(test())
+    shutil.rmtree('async_sqlite_test', ignore_errors=True)
+
+    print('All tests are PASSED !')
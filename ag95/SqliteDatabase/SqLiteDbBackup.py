@@ -1,12 +1,16 @@
 import shutil
 from ag95 import configure_logger
+from ag95.SqliteDatabase.SqLiteDbWrapper import (apply_sqlite_pragmas,
+                                                 all_sqlite_profiles)
 from os import (path,
                 makedirs,
                 remove)
 from threading import Thread
 from time import sleep
 from sqlite3 import connect
-from typing import AnyStr
+from typing import (AnyStr,
+                    Dict,
+                    Optional)
 from logging import getLogger
 from datetime import datetime
 from traceback import format_exc
@@ -16,13 +20,18 @@ class SqLiteDbbackup():
                  input_filepath: AnyStr = 'database.db',
                  output_filepath: AnyStr = 'database_BAK.db',
                  print_progress: bool = False,
-                 pages: int = 0):
+                 pages: int = 0,
+                 profile: Optional[all_sqlite_profiles] = None,
+                 pragmas: Optional[Dict] = None):
         self._log = getLogger()
 
         self.input_filepath = input_filepath
         self.output_filepath = output_filepath
         self.print_progress = print_progress
         self.pages = pages
+        # same connection profile as the SqLiteDbWrapper connections, applied to the connections opened here
+        self.profile = profile
+        self.pragmas = pragmas
 
     def _backup_progress(self,
                          status,
@@ -43,6 +52,9 @@ class SqLiteDbbackup():
         try:
             if target_con is None:
                 local_con = connect(self.input_filepath)
+                apply_sqlite_pragmas(con=local_con,
+                                     profile=self.profile,
+                                     pragmas=self.pragmas)
                 target_con = local_con
 
             # 1. Check free space before vacuuming
@@ -95,6 +107,9 @@ class SqLiteDbbackup():
         try:
             # Connect with isolation_level=None to manage transactions manually
             lock_con = connect(self.input_filepath, isolation_level=None)
+            apply_sqlite_pragmas(con=lock_con,
+                                 profile=self.profile,
+                                 pragmas=self.pragmas)
 
             # A. CHECK IF WAL MODE & CHECKPOINT BEFORE LOCKING
             cursor = lock_con.cursor()
@@ -0,0 +1,378 @@
+from ag95.SqliteDatabase.SqLiteDbWrapper import (SqLiteDbWrapper,
+                                                 all_sqlite_profiles)
+from threading import (Thread,
+                       Event,
+                       Lock)
+from time import (perf_counter,
+                  sleep)
+from typing import (AnyStr,
+                    Dict,
+                    List,
+                    Optional)
+from logging import getLogger
+from datetime import datetime
+from traceback import format_exc
+import queue
+
+# queue markers, handled by the writer thread
+_STOP = object()
+
+class SqLiteDbBufferedWriter():
+    """
+    Write-behind buffer on top of SqLiteDbWrapper.
+
+    append_in_table only queues the row (with its TIMESTAMP captured right away) and returns;
+    a background thread, owning its own connection, writes the queued rows every flush_rows rows
+    or every flush_interval_ms milliseconds, whichever comes first, in a single transaction (group commit),
+    so a single fsync is paid for the whole batch instead of one per row.
+    The queue is bounded (max_queue_size), append_in_table blocks when it is full (backpressure).
+    A row failing to be written only drops itself (the batch is retried per table/ columns group, then per row),
+    the errors are raised back by the next flush()/ close().
+
+    Recommended Usage:
+    with SqLiteDbBufferedWriter(database_path='database.db', flush_rows=500, flush_interval_ms=200) as writer:
+        writer.append_in_table(...)
+        writer.flush() # optional, waits until everything queued so far is written
+        print(writer.get_stats())
+    """
+
+    def __init__(self,
+                 database_path: AnyStr = 'database.db',
+                 timeout: int = 5*60,
+                 use_wal: bool = True,
+                 flush_rows: int = 500,
+                 flush_interval_ms: int = 200,
+                 max_queue_size: int = 10000,
+                 profile: Optional[all_sqlite_profiles] = None,
+                 pragmas: Optional[Dict] = None):
+        self._log = getLogger()
+
+        self.database_path = database_path
+        self.timeout = timeout
+        self.use_wal = use_wal
+        self.flush_rows = flush_rows
+        self.flush_interval_ms = flush_interval_ms
+        self.profile = profile
+        self.pragmas = pragmas
+
+        self._queue = queue.Queue(maxsize=max_queue_size)
+        # errors of the background flushes, raised back to the caller on the next flush()
+        self._errors = []
+        # set if the writer thread itself died (connection failure, etc.), nothing is written anymore
+        self._writer_error = None
+
+        self._stats_lock = Lock()
+        self._stats = {'rows_queued': 0,
+                       'rows_flushed': 0,
+                       'rows_failed': 0,
+                       'flushes': 0,
+                       'failed_flushes': 0,
+                       'batch_size_max': 0,
+                       'flush_s_total': 0.0,
+                       'flush_s_max': 0.0,
+                       'flush_s_last': 0.0}
+
+        self._closed = False
+        self._thread = Thread(target=self._writer_loop,
+                              daemon=True)
+        self._thread.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, exc_traceback):
+        self.close()
+
+    def append_in_table(self,
+                        table_name: AnyStr,
+                        column_names: List,
+                        column_values: List,
+                        block: bool = True,
+                        timeout: Optional[float] = None):
+        # raises queue.Full if the queue is still full after timeout (or right away if block is False)
+        if self._closed:
+            raise Exception('The buffered writer is closed.')
+
+        self._put((table_name,
+                   tuple(['TIMESTAMP'] + column_names),
+                   [int(datetime.now().timestamp())] + column_values),
+                  block=block,
+                  timeout=timeout)
+        with self._stats_lock:
+            self._stats['rows_queued'] += 1
+
+    def _check_writer(self):
+        if self._writer_error:
+            raise Exception(f'The buffered writer thread stopped, the rows are no longer written:\n{self._writer_error}')
+
+    def _put(self,
+             item,
+             block: bool = True,
+             timeout: Optional[float] = None):
+        # a blocking put gives up as soon as the writer thread dies, instead of waiting on a queue nobody reads
+        self._check_writer()
+        if not block:
+            self._queue.put(item, block=False)
+            return
+
+        deadline = perf_counter() + timeout if timeout is not None else None
+        while True:
+            try:
+                self._queue.put(item, timeout=0.1 if deadline is None else max(0.0, min(0.1, deadline - perf_counter())))
+                return
+            except queue.Full:
+                self._check_writer()
+                if deadline is not None and perf_counter() >= deadline:
+                    raise
+
+    def _raise_errors(self):
+        with self._stats_lock:
+            errors, self._errors = self._errors, []
+        if errors:
+            raise Exception(f'{len(errors)} buffered row(s) failed to be written, last error:\n{errors[-1]}')
+
+    def flush(self,
+              timeout: Optional[float] = 60):
+        # waits until all the rows queued before this call are written
+        start = perf_counter()
+        flushed = Event()
+        try:
+            self._put(flushed,
+                      timeout=timeout)
+        except queue.Full:
+            raise TimeoutError(f'The buffered rows were not flushed in {timeout}s.')
+        while not flushed.wait(timeout=0.1):
+            self._check_writer()
+            if timeout is not None and perf_counter() - start >= timeout:
+                raise TimeoutError(f'The buffered rows were not flushed in {timeout}s.')
+
+        self._check_writer()
+        self._raise_errors()
+
+    def close(self):
+        if self._closed:
+            return
+
+        self._closed = True
+        if not self._writer_error:
+            self._put(_STOP)
+        self._thread.join()
+
+        self._check_writer()
+        self._raise_errors()
+
+    def get_stats(self) -> Dict:
+        with self._stats_lock:
+            stats = dict(self._stats)
+
+        stats['queue_size'] = self._queue.qsize()
+        stats['batch_size_avg'] = stats['rows_flushed'] / stats['flushes'] if stats['flushes'] else 0.0
+        stats['flush_s_avg'] = stats['flush_s_total'] / stats['flushes'] if stats['flushes'] else 0.0
+
+        return stats
+
+    @staticmethod
+    def _write_group(db: SqLiteDbWrapper,
+                     table_name: AnyStr,
+                     column_names: tuple,
+                     rows: List[List]) -> List[str]:
+        # the group in a savepoint, retried row by row (one savepoint each) if it fails
+        # => a bad row only drops itself; returns the errors of the dropped rows
+        try:
+            with db.savepoint('buffered_group'):
+                db.append_many_in_table(table_name=table_name,
+                                        column_names=list(column_names),
+                                        rows=rows)
+            return []
+        except Exception:
+            pass
+
+        errors = []
+        for row in rows:
+            try:
+                with db.savepoint('buffered_row'):
+                    db.append_many_in_table(table_name=table_name,
+                                            column_names=list(column_names),
+                                            rows=[row])
+            except Exception:
+                errors.append(f'{table_name} {row}:\n{format_exc(chain=False)}')
+        return errors
+
+    def _flush_pending(self,
+                       db: SqLiteDbWrapper,
+                       pending: List):
+        # same table and columns => same statement, written with a single executemany
+        grouped_rows = {}
+        for table_name, column_names, column_values in pending:
+            grouped_rows.setdefault((table_name, column_names), []).append(column_values)
+
+        start = perf_counter()
+        errors = []
+        try:
+            with db.transaction():
+                for (table_name, column_names), rows in grouped_rows.items():
+                    errors += self._write_group(db=db,
+                                                table_name=table_name,
+                                                column_names=column_names,
+                                                rows=rows)
+        except:
+            # BEGIN/ COMMIT failure (busy timeout, disk full, etc.), nothing was written
+            errors = [format_exc(chain=False)] * len(pending)
+        flush_s = perf_counter() - start
+
+        if errors:
+            self._log.warning(f'Failed to write {len(errors)} of {len(pending)} buffered row(s), last error:\n{errors[-1]}')
+            with self._stats_lock:
+                self._stats['failed_flushes'] += 1
+                self._stats['rows_failed'] += len(errors)
+                self._errors.extend(errors)
+        if len(errors) == len(pending):
+            return
+
+        with self._stats_lock:
+            self._stats['flushes'] += 1
+            self._stats['rows_flushed'] += len(pending) - len(errors)
+            self._stats['batch_size_max'] = max(self._stats['batch_size_max'], len(pending))
+            self._stats['flush_s_total'] += flush_s
+            self._stats['flush_s_max'] = max(self._stats['flush_s_max'], flush_s)
+            self._stats['flush_s_last'] = flush_s
+
+    def _writer_loop(self):
+        try:
+            self._run_writer()
+        except Exception:
+            error = format_exc(chain=False)
+            self._log.error(f'The buffered writer thread stopped:\n{error}')
+            self._writer_error = error
+
+            # drop the queued rows and wake up the flush() calls waiting for them
+            while True:
+                try:
+                    item = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if isinstance(item, Event):
+                    item.set()
+                elif item is not _STOP:
+                    with self._stats_lock:
+                        self._stats['rows_failed'] += 1
+
+    def _run_writer(self):
+        # the connection is created in the writer thread, it is used only from here
+        db = SqLiteDbWrapper(database_path=self.database_path,
+                             timeout=self.timeout,
+                             use_wal=self.use_wal,
+                             profile=self.profile,
+                             pragmas=self.pragmas)
+        db.con.commit()
+
+        pending = []
+        flush_deadline = None
+        stop = False
+        while not stop:
+            flushed_events = []
+            try:
+                item = self._queue.get(timeout=max(0.0, flush_deadline - perf_counter()) if pending else None)
+            except queue.Empty:
+                item = None
+
+            if item is _STOP:
+                stop = True
+            elif isinstance(item, Event):
+                flushed_events.append(item)
+            elif item is not None:
+                if not pending:
+                    flush_deadline = perf_counter() + self.flush_interval_ms / 1000
+                pending.append(item)
+
+            if pending and (stop
+                            or flushed_events
+                            or len(pending) >= self.flush_rows
+                            or perf_counter() >= flush_deadline):
+                self._flush_pending(db=db,
+                                    pending=pending)
+                pending = []
+
+            for flushed in flushed_events:
+                flushed.set()
+
+        db.con.close()
+
+if __name__ == '__main__':
+    from ag95.SqliteDatabase.SqLiteDbMigration import SqLiteDbMigration
+    import os
+    import shutil
+    # a dedicated db, independent of the other tests
+    shutil.rmtree('buffered_writer_test', ignore_errors=True)
+    os.makedirs('buffered_writer_test')
+    database_path = 'buffered_writer_test/database.db'
+    SqLiteDbMigration(database_path=database_path).migrate()
+
+    with SqLiteDbBufferedWriter(database_path=database_path, flush_rows=10, flush_interval_ms=50) as writer:
+        # TEST the rows are written only by the buffer, in batches of at most flush_rows rows
+        for i in range(25):
+            writer.append_in_table(table_name='my_db_table_name',
+                                   column_names=['my_column_name1', 'my_column_name2'],
+                                   column_values=[i, i])
+        writer.flush()
+        with SqLiteDbWrapper(database_path=database_path) as DB:
+            result = len(DB.return_records(table_name='my_db_table_name'))
+        expected = 25
+        assert result == expected, f'wrong value returned ! expected  {expected}, got {result}'
+
+        result = writer.get_stats()
+        assert result['rows_flushed'] == 25 and result['batch_size_max'] <= 10, f'wrong stats returned ! got {result}'
+
+        # TEST a row is written after flush_interval_ms even without an explicit flush
+        writer.append_in_table(table_name='my_db_table_name',
+                               column_names=['my_column_name1', 'my_column_name2'],
+                               column_values=[100, 100])
+        sleep(0.5)
+        result = writer.get_stats()['rows_flushed']
+        expected = 26
+        assert result == expected, f'wrong value returned ! expected  {expected}, got {result}'
+
+        # TEST a bad row only drops itself, not the other rows of its batch
+        for column_values in ([102, 102], [{'not': 'bindable'}, 103], [104, 104]):
+            writer.append_in_table(table_name='my_db_table_name',
+                                   column_names=['my_column_name1', 'my_column_name2'],
+                                   column_values=column_values)
+        writer.append_in_table(table_name='missing_table',
+                               column_names=['my_column_name1'],
+                               column_values=[105])
+        try:
+            writer.flush()
+            assert False, 'the failed rows were not reported'
+        except Exception as e:
+            assert '2 buffered row(s) failed' in str(e), f'wrong error raised ! got {e}'
+        result = (writer.get_stats()['rows_flushed'], writer.get_stats()['rows_failed'])
+        expected = (28, 2)
+        assert result == expected, f'wrong value returned ! expected  {expected}, got {result}'
+
+        # TEST the rows still queued are written on exit
+        writer.append_in_table(table_name='my_db_table_name',
+                               column_names=['my_column_name1', 'my_column_name2'],
+                               column_values=[101, 101])
+
+    # TEST a dead writer thread is reported instead of blocking flush()/ append_in_table
+    broken_writer = SqLiteDbBufferedWriter(database_path='missing_folder/database.db',
+                                           max_queue_size=1)
+    for method in (broken_writer.flush,
+                   lambda: [broken_writer.append_in_table(table_name='my_db_table_name',
+                                                          column_names=['my_column_name1'],
+                                                          column_values=[_]) for _ in range(3)],
+                   broken_writer.close):
+        try:
+            method()
+            assert False, 'the dead writer thread was not reported'
+        except Exception as e:
+            assert 'writer thread stopped' in str(e), f'wrong error raised ! got {e}'
+
+    with SqLiteDbWrapper(database_path=database_path) as DB:
+        result = len(DB.return_records(table_name='my_db_table_name'))
+        expected = 29
+        assert result == expected, f'wrong value returned ! expected  {expected}, got {result}'
+
+    shutil.rmtree('buffered_writer_test', ignore_errors=True)
+
+    print('All tests are PASSED !')
@@ -0,0 +1,307 @@
+from ag95.SqliteDatabase.SqLiteDbWrapper import (SqLiteDbWrapper,
+                                                 SqLiteIndexDef,
+                                                 SqLiteRollupDef,
+                                                 all_sqlite_profiles)
+from contextlib import contextmanager
+from threading import Lock
+from time import (perf_counter,
+                  sleep)
+from typing import (AnyStr,
+                    Dict,
+                    Iterator,
+                    Literal,
+                    Optional)
+import queue
+
+class SqLiteDbConnectionPool():
+    """
+    Reader/ writer split on top of SqLiteDbWrapper.
+
+    In WAL mode sqlite allows many concurrent readers but a single writer, so the pool keeps
+    num_readers read only connections (mode=ro, query_only) and one dedicated writer connection.
+    The reads (return_records, get_tables_columns, etc.) are routed to a free reader and
+    the mutating calls are serialized on the writer and committed right away.
+
+    Recommended Usage:
+    with SqLiteDbConnectionPool(database_path='database.db', num_readers=4) as pool:
+        pool.append_in_table(...)
+        records = pool.return_records(...)
+        print(pool.get_stats())
+    """
+
+    def __init__(self,
+                 database_path: AnyStr = 'database.db',
+                 timeout: int = 5*60,
+                 use_wal: bool = True,
+                 num_readers: int = 4,
+                 writer_profile: Optional[all_sqlite_profiles] = None,
+                 reader_profile: Optional[all_sqlite_profiles] = 'read_only',
+                 pragmas: Optional[Dict] = None):
+        self.database_path = database_path
+        self.num_readers = num_readers
+
+        # the writer is opened first, it creates the db file and sets the journal mode for the readers
+        self._writer = SqLiteDbWrapper(database_path=database_path,
+                                       timeout=timeout,
+                                       use_wal=use_wal,
+                                       profile=writer_profile,
+                                       pragmas=pragmas,
+                                       check_same_thread=False)
+        self._writer.con.commit()
+        self._writer_lock = Lock()
+        self._closed = False
+
+        # LIFO => the most recently used reader (with the warmest page cache) is handed out first
+        self._readers = queue.LifoQueue()
+        # all the readers, checked out or not, so close() does not wait for the checked out ones
+        self._all_readers = [SqLiteDbWrapper(database_path=database_path,
+                                             timeout=timeout,
+                                             profile=reader_profile,
+                                             pragmas=pragmas,
+                                             read_only=True,
+                                             check_same_thread=False)
+                             for _ in range(num_readers)]
+        for db in self._all_readers:
+            self._readers.put(db)
+
+        self._stats_lock = Lock()
+        self._stats = {'reader_checkouts': 0,
+                       'reader_returns': 0,
+                       'reader_wait_s_total': 0.0,
+                       'reader_wait_s_max': 0.0,
+                       'writer_checkouts': 0,
+                       'writer_returns': 0,
+                       'writer_wait_s_total': 0.0,
+                       'writer_wait_s_max': 0.0}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, exc_traceback):
+        self.close()
+
+    def close(self):
+        self._closed = True
+        with self._writer_lock:
+            self._writer.con.commit()
+            self._writer.con.close()
+
+        # a reader still checked out (an unfinished iter_records, etc.) is closed too, its next fetch fails
+        for db in self._all_readers:
+            db.con.close()
+
+    def _record_checkout(self,
+                         lane: str,
+                         wait_s: float):
+        with self._stats_lock:
+            self._stats[f'{lane}_checkouts'] += 1
+            self._stats[f'{lane}_wait_s_total'] += wait_s
+            self._stats[f'{lane}_wait_s_max'] = max(self._stats[f'{lane}_wait_s_max'], wait_s)
+
+    def _record_return(self,
+                       lane: str):
+        with self._stats_lock:
+            self._stats[f'{lane}_returns'] += 1
+
+    def get_stats(self) -> Dict:
+        with self._stats_lock:
+            stats = dict(self._stats)
+
+        stats['num_readers'] = self.num_readers
+        stats['readers_available'] = self._readers.qsize()
+        stats['reader_wait_s_avg'] = stats['reader_wait_s_total'] / stats['reader_checkouts'] if stats['reader_checkouts'] else 0.0
+        stats['writer_wait_s_avg'] = stats['writer_wait_s_total'] / stats['writer_checkouts'] if stats['writer_checkouts'] else 0.0
+
+        return stats
+
+    @contextmanager
+    def reader(self) -> Iterator[SqLiteDbWrapper]:
+        start = perf_counter()
+        db = self._readers.get()
+        self._record_checkout(lane='reader',
+                              wait_s=perf_counter() - start)
+        try:
+            yield db
+        finally:
+            # end the read snapshot of the connection before handing it to someone else
+            if not self._closed:
+                db.con.commit()
+                self._readers.put(db)
+            self._record_return(lane='reader')
+
+    @contextmanager
+    def writer(self) -> Iterator[SqLiteDbWrapper]:
+        start = perf_counter()
+        with self._writer_lock:
+            self._record_checkout(lane='writer',
+                                  wait_s=perf_counter() - start)
+            try:
+                yield self._writer
+                # commit right away, so the readers can see the changes
+                self._writer.con.commit()
+            except:
+                self._writer.con.rollback()
+                raise
+            finally:
+                self._record_return(lane='writer')
+
+    # ############## reads, routed to the readers #################
+    def get_tables_columns(self, *args, **kwargs):
+        with self.reader() as db:
+            return db.get_tables_columns(*args, **kwargs)
+
+    def get_tables_indexes(self, *args, **kwargs):
+        with self.reader() as db:
+            return db.get_tables_indexes(*args, **kwargs)
+
+    def return_records(self, *args, **kwargs):
+        with self.reader() as db:
+            return db.return_records(*args, **kwargs)
+
+    def return_records_page(self, *args, **kwargs):
+        with self.reader() as db:
+            return db.return_records_page(*args, **kwargs)
+
+    def return_aggregated(self, *args, **kwargs):
+        with self.reader() as db:
+            return db.return_aggregated(*args, **kwargs)
+
+    def get_active_pragmas(self,
+                           lane: Literal['reader', 'writer'] = 'reader') -> Dict:
+        # the readers and the writer have different profiles
+        with (self.reader() if lane == 'reader' else self.writer()) as db:
+            return db.get_active_pragmas()
+
+    def iter_records(self, *args, **kwargs):
+        # the reader is kept checked out until the iterator is exhausted or closed
+        with self.reader() as db:
+            yield from db.iter_records(*args, **kwargs)
+
+    # ############## writes, routed to the writer #################
+    def create_table(self, *args, **kwargs):
+        with self.writer() as db:
+            return db.create_table(*args, **kwargs)
+
+    def drop_table(self, *args, **kwargs):
+        with self.writer() as db:
+            return db.drop_table(*args, **kwargs)
+
+    def add_column(self, *args, **kwargs):
+        with self.writer() as db:
+            return db.add_column(*args, **kwargs)
+
+    def rename_column(self, *args, **kwargs):
+        with self.writer() as db:
+            return db.rename_column(*args, **kwargs)
+
+    def rebuild_table(self, *args, **kwargs):
+        with self.writer() as db:
+            return db.rebuild_table(*args, **kwargs)
+
+    def create_index(self, *args, **kwargs):
+        with self.writer() as db:
+            return db.create_index(*args, **kwargs)
+
+    def drop_index(self, *args, **kwargs):
+        with self.writer() as db:
+            return db.drop_index(*args, **kwargs)
+
+    def create_rollup(self, *args, **kwargs):
+        with self.writer() as db:
+            return db.create_rollup(*args, **kwargs)
+
+    def drop_rollup(self, *args, **kwargs):
+        with self.writer() as db:
+            return db.drop_rollup(*args, **kwargs)
+
+    def append_in_table(self, *args, **kwargs):
+        with self.writer() as db:
+            return db.append_in_table(*args, **kwargs)
+
+    def append_many_in_table(self, *args, **kwargs):
+        with self.writer() as db:
+            return db.append_many_in_table(*args, **kwargs)
+
+    def update_record(self, *args, **kwargs):
+        with self.writer() as db:
+            return db.update_record(*args, **kwargs)
+
+    def update_records(self, *args, **kwargs):
+        with self.writer() as db:
+            return db.update_records(*args, **kwargs)
+
+    def delete_record(self, *args, **kwargs):
+        with self.writer() as db:
+            return db.delete_record(*args, **kwargs)
+
+    def delete_records(self, *args, **kwargs):
+        with self.writer() as db:
+            return db.delete_records(*args, **kwargs)
+
+    def clear_old_records(self, *args, **kwargs):
+        with self.writer() as db:
+            return db.clear_old_records(*args, **kwargs)
+
+if __name__ == '__main__':
+    print('There is no DB available by default for this test.'
+          ' Please create one before running this test. Use DbMigration for that.')
+    sleep(2)
+
+    with SqLiteDbConnectionPool(num_readers=2) as pool:
+        # TEST correct column names query, on a reader
+        result = str(pool.get_tables_columns())
+        expected = str({'my_db_table_name': ['ID', 'TIMESTAMP', 'my_column_name1', 'my_column_name2']})
+        assert result == expected, f'wrong value returned ! expected  {expected}, got {result}'
+
+        # TEST the writes are visible to the readers right away
+        pool.append_in_table(table_name='my_db_table_name',
+                             column_names=['my_column_name1', 'my_column_name2'],
+                             column_values=[7, 5])
+        result = str(pool.return_records(table_name='my_db_table_name',
+                                         select_values=['my_column_name1', 'my_column_name2']))
+        expected = str([(7, 5)])
+        assert result == expected, f'wrong value returned ! expected  {expected}, got {result}'
+
+        # TEST the readers can not write
+        write_failed = False
+        try:
+            with pool.reader() as db:
+                db.delete_record(table_name='my_db_table_name',
+                                 record_ID=1)
+        except Exception:
+            write_failed = True
+        assert write_failed, 'a reader was able to write'
+
+        # TEST the checkout statistics
+        result = pool.get_stats()
+        assert result['reader_checkouts'] == result['reader_returns'] == 3, f'wrong stats returned ! got {result}'
+        assert result['writer_checkouts'] == result['writer_returns'] == 1, f'wrong stats returned ! got {result}'
+        assert result['readers_available'] == 2, f'wrong stats returned ! got {result}'
+
+        # TEST the pragmas of each lane
+        result = (pool.get_active_pragmas()['query_only'], pool.get_active_pragmas(lane='writer')['query_only'])
+        expected = (1, 0)
+        assert result == expected, f'wrong value returned ! expected  {expected}, got {result}'
+
+        # TEST the index/ rollup management is routed to the writer
+        pool.create_index(table_name='my_db_table_name',
+                          index_def=SqLiteIndexDef(columns=['my_column_name2']))
+        assert 'idx_my_db_table_name_my_column_name2' in pool.get_tables_indexes()['my_db_table_name'], 'the index was not created'
+        pool.drop_index(index_name='idx_my_db_table_name_my_column_name2')
+        pool.create_rollup(table_name='my_db_table_name',
+                           rollup_def=SqLiteRollupDef(bucket_s=60,
+                                                      columns=['my_column_name1']))
+        pool.drop_rollup(table_name='my_db_table_name',
+                         rollup_def=SqLiteRollupDef(bucket_s=60,
+                                                    columns=['my_column_name1']))
+        result = list(pool.get_tables_columns().keys())
+        expected = ['my_db_table_name']
+        assert result == expected, f'wrong value returned ! expected  {expected}, got {result}'
+
+    # TEST close() does not wait for a reader still checked out by an unfinished iterator
+    pool = SqLiteDbConnectionPool(num_readers=1)
+    records = pool.iter_records(table_name='my_db_table_name')
+    next(records)
+    pool.close()
+
+    print('All tests are PASSED !')
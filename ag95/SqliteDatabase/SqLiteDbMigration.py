@@ -1,4 +1,5 @@
 from ag95 import (SqLiteColumnDef,
+                  SqLiteIndexDef,
                   SqLiteDbWrapper)
 from typing import (AnyStr,
                     List,
@@ -17,7 +18,12 @@ class SqLiteDbMigration:
                                      'columns_def': [SqLiteColumnDef(column_name='my_column_name1',
                                                                      column_type='INTEGER'),
                                                      SqLiteColumnDef(column_name='my_column_name2',
-                                                                     column_type='INTEGER')]}]
+                                                                     column_type='INTEGER')],
+                                     # optional, the TIMESTAMP index is always created unless 'index_timestamp' is False
+                                     'indexes_def': [SqLiteIndexDef(columns=['my_column_name1', 'my_column_name2'])]
+                                     # optional, aggregates kept up to date on every insert, e.g. in my_db_table_name_rollup_1h:
+                                     # 'rollups_def': [SqLiteRollupDef(bucket_s=60*60, columns=['my_column_name1'])]
+                                     }]
         else:
             self.all_tables_def = all_tables_def
 
@@ -39,10 +45,13 @@ class SqLiteDbMigration:
 
     def _perform_migration(self, DB: SqLiteDbWrapper):
         current_table_columns = DB.get_tables_columns()
+        current_table_indexes = DB.get_tables_indexes()
         for table_def in self.all_tables_def:
             if table_def['table_name'] not in current_table_columns.keys():
                 DB.create_table(table_name=table_def['table_name'],
-                                columns_definition=table_def['columns_def'])
+                                columns_definition=table_def['columns_def'],
+                                indexes_definition=table_def.get('indexes_def'),
+                                index_timestamp=table_def.get('index_timestamp', True))
             else:
                 for column_def in table_def['columns_def']:
                     if column_def.column_name not in current_table_columns[table_def['table_name']]:
@@ -53,6 +62,21 @@ class SqLiteDbMigration:
                         DB.add_column(table_name=table_def['table_name'],
                                       column_def=column_def)
 
+                # add the missing indexes to the existing table
+                # !!! AN INDEX REMOVED FROM THE db_def WILL STILL BE PRESENT IN THE DB !!!
+                for index_def in DB.get_indexes_definition(columns_definition=table_def['columns_def'],
+                                                           indexes_definition=table_def.get('indexes_def'),
+                                                           index_timestamp=table_def.get('index_timestamp', True)):
+                    if index_def.get_index_name(table_def['table_name']) not in current_table_indexes.get(table_def['table_name'], []):
+                        DB.create_index(table_name=table_def['table_name'],
+                                        index_def=index_def)
+
+            # create the missing rollups, back-filled from the existing raw data
+            # !!! THE COLUMNS/ AGGREGATES OF AN EXISTING ROLLUP ARE NOT UPDATED, USE A NEW rollup_name FOR THAT !!!
+            for rollup_def in table_def.get('rollups_def', []):
+                DB.create_rollup(table_name=table_def['table_name'],
+                                 rollup_def=rollup_def)
+
 if __name__ == '__main__':
     SqLiteDbMigration().migrate()
 
@@ -0,0 +1,725 @@
+from ag95.SqliteDatabase.SqLiteDbWrapper import (SqLiteDbWrapper,
+                                                 SqLiteColumnDef,
+                                                 SqLiteIndexDef,
+                                                 all_aggregates,
+                                                 all_sqlite_profiles,
+                                                 chunks_to_arrays)
+from ag95.General.sql_where_builder import compile_where_filters
+from collections import OrderedDict
+from contextlib import contextmanager
+from datetime import (datetime,
+                      timedelta,
+                      timezone)
+from typing import (AnyStr,
+                    Callable,
+                    Dict,
+                    Iterator,
+                    List,
+                    Literal,
+                    Optional,
+                    Tuple,
+                    Union)
+from sqlite3 import SQLITE_LIMIT_ATTACHED
+import base64
+import json
+import os
+import re
+
+all_partition_periods = Literal['day', 'week', 'month']
+
+# the IDs of a partition start at (partition start timestamp) * ID_SPACING, so they are unique across the
+# partitions, grow with the time and the partition of a record can be found back from its ID alone
+ID_SPACING = 10**6
+
+_PARTITION_FILENAME = re.compile(r'^(\d{4}-\d{2}-\d{2}|\d{4}-W\d{2}|\d{4}-\d{2})\.db$')
+
+def get_partition_bounds(timestamp: int,
+                         period: all_partition_periods) -> Tuple[str, int, int]:
+    # (partition key, start timestamp, end timestamp), UTC based
+    day_start = datetime.fromtimestamp(timestamp, timezone.utc).replace(hour=0, minute=0, second=0, microsecond=0)
+    if period == 'day':
+        start, end = day_start, day_start + timedelta(days=1)
+        key = start.strftime('%Y-%m-%d')
+    elif period == 'week':
+        start = day_start - timedelta(days=day_start.weekday())
+        end = start + timedelta(days=7)
+        iso_year, iso_week, _ = start.isocalendar()
+        key = f'{iso_year}-W{iso_week:02d}'
+    elif period == 'month':
+        start = day_start.replace(day=1)
+        end = (start + timedelta(days=32)).replace(day=1)
+        key = start.strftime('%Y-%m')
+    else:
+        raise ValueError(f'Unknown partition period {period}')
+
+    return key, int(start.timestamp()), int(end.timestamp())
+
+def _partition_start_from_key(key: str) -> int:
+    if '-W' in key:
+        start = datetime.strptime(f'{key}-1', '%G-W%V-%u')
+    elif key.count('-') == 2:
+        start = datetime.strptime(key, '%Y-%m-%d')
+    else:
+        start = datetime.strptime(key, '%Y-%m')
+    return int(start.replace(tzinfo=timezone.utc).timestamp())
+
+class SqLiteDbPartitionedWrapper():
+    """
+    SqLiteDbWrapper compatible wrapper storing the tables across per day/ week/ month SQLite files,
+    routed by TIMESTAMP (UTC), e.g. database_dir/2026-10-18.db, database_dir/2026-W42.db or database_dir/2026-10.db.
+
+    database_dir/catalog.db holds the (empty) table definitions, replicated to every partition.
+    The reads ATTACH only the partitions overlapping the TIMESTAMP range of their where_filters
+    (all the partitions if there is none); the retention unlinks the expired partition files
+    instead of DELETE-ing their rows, so the files stay small for VACUUM and backups.
+
+    NOT supported, compared to SqLiteDbWrapper: the indexes/ rollups management (create_index, create_rollup, ...),
+    the read modes and the result cache. A query spanning more partitions than the ATTACH limit (10 by default)
+    can only be ordered by ID or TIMESTAMP and aggregated in buckets dividing a day.
+
+    Recommended Usage:
+    with SqLiteDbPartitionedWrapper(database_dir='database_partitions', period='day') as DB:
+        DB.create_table(...)
+        DB.append_in_table(...)
+        DB.return_records(table_name=..., where_filters=[('TIMESTAMP', '>=', since)])
+        DB.clear_old_records(table_name=..., since_time_in_past_s=30*24*60*60)
+    """
+
+    def __init__(self,
+                 database_dir: AnyStr = 'database_partitions',
+                 period: all_partition_periods = 'day',
+                 timeout: int = 5*60,
+                 use_wal: bool = True,
+                 max_open_partitions: int = 4,
+                 profile: Optional[all_sqlite_profiles] = None,
+                 pragmas: Optional[Dict] = None):
+        self.database_dir = database_dir
+        self.period = period
+        self.timeout = timeout
+        self.use_wal = use_wal
+        self.max_open_partitions = max_open_partitions
+        self.profile = profile
+        self.pragmas = pragmas
+
+        if not os.path.isdir(database_dir):
+            os.makedirs(database_dir)
+
+        self._catalog = SqLiteDbWrapper(database_path=os.path.join(database_dir, 'catalog.db'),
+                                        timeout=timeout,
+                                        use_wal=use_wal,
+                                        profile=profile,
+                                        pragmas=pragmas)
+        self._catalog.con.commit()
+        self.max_attached = self._catalog.con.getlimit(SQLITE_LIMIT_ATTACHED)
+
+        # partition key -> SqLiteDbWrapper, the least recently used one is closed first
+        self._open_partitions = OrderedDict()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, exc_traceback):
+        self.close()
+
+    def close(self):
+        for db in self._open_partitions.values():
+            db.con.commit()
+            db.con.close()
+        self._open_partitions.clear()
+        self._catalog.con.commit()
+        self._catalog.con.close()
+
+    # ############## partitions #################
+    def _partition_path(self,
+                        key: str) -> str:
+        return os.path.join(self.database_dir, f'{key}.db')
+
+    def get_partitions(self,
+                       since: Optional[int] = None,
+                       until: Optional[int] = None) -> List[Tuple[str, int, int]]:
+        # [(partition key, start timestamp, end timestamp)] of the existing partitions overlapping [since, until], oldest first
+        partitions = []
+        for filename in os.listdir(self.database_dir):
+            match = _PARTITION_FILENAME.match(filename)
+            if not match:
+                continue
+            key, start, end = get_partition_bounds(_partition_start_from_key(match.group(1)), self.period)
+            if key != match.group(1):
+                # a partition of another period, not managed by this wrapper
+                continue
+            if (since is None or end > since) and (until is None or start <= until):
+                partitions.append((key, start, end))
+
+        return sorted(partitions, key=lambda _: _[1])
+
+    def _sync_partition_schema(self,
+                               db: SqLiteDbWrapper,
+                               partition_start: int):
+        # creates the catalog tables/ indexes missing in the partition, their IDs seeded for the partition
+        partition_objects = {_[0] for _ in db.con.execute("SELECT name FROM sqlite_master").fetchall()}
+        catalog_objects = self._catalog.con.execute("SELECT type, name, sql FROM sqlite_master "
+                                                    "WHERE sql IS NOT NULL AND name NOT LIKE 'sqlite_%' "
+                                                    "ORDER BY type = 'table' DESC, rowid").fetchall()
+        with db.transaction():
+            for object_type, object_name, object_sql in catalog_objects:
+                if object_name in partition_objects:
+                    continue
+                db.con.execute(object_sql)
+                if object_type == 'table' and 'AUTOINCREMENT' in object_sql.upper():
+                    db.con.execute("INSERT INTO sqlite_sequence(name, seq) VALUES (?, ?)",
+                                   [object_name, partition_start * ID_SPACING])
+            db._invalidate_schema_cache()
+
+    def _get_partition(self,
+                       timestamp: int,
+                       create: bool = True) -> Optional[SqLiteDbWrapper]:
+        key, start, _ = get_partition_bounds(timestamp, self.period)
+        db = self._open_partitions.get(key)
+        if db is not None:
+            self._open_partitions.move_to_end(key)
+            return db
+
+        partition_path = self._partition_path(key)
+        if not create and not os.path.isfile(partition_path):
+            return None
+
+        db = SqLiteDbWrapper(database_path=partition_path,
+                             timeout=self.timeout,
+                             use_wal=self.use_wal,
+                             profile=self.profile,
+                             pragmas=self.pragmas)
+        self._sync_partition_schema(db=db,
+                                    partition_start=start)
+        self._open_partitions[key] = db
+        while len(self._open_partitions) > self.max_open_partitions:
+            _, oldest_db = self._open_partitions.popitem(last=False)
+            oldest_db.con.commit()
+            oldest_db.con.close()
+
+        return db
+
+    def _close_partition(self,
+                         key: str):
+        db = self._open_partitions.pop(key, None)
+        if db is not None:
+            db.con.commit()
+            db.con.close()
+
+    def drop_old_partitions(self,
+                            since_time_in_past_s: int) -> List[str]:
+        # unlinks the partition files entirely older than the cutoff, returns their keys
+        cutoff = int((datetime.now() - timedelta(seconds=since_time_in_past_s)).timestamp())
+        dropped_keys = []
+        for key, _, end in self.get_partitions(until=cutoff):
+            if end > cutoff:
+                continue
+            self._close_partition(key)
+            for suffix in ('', '-wal', '-shm'):
+                if os.path.isfile(self._partition_path(key) + suffix):
+                    os.remove(self._partition_path(key) + suffix)
+            dropped_keys.append(key)
+
+        return dropped_keys
+
+    # ############## schema #################
+    def get_tables_columns(self) -> Dict:
+        return self._catalog.get_tables_columns()
+
+    def get_tables_indexes(self) -> Dict:
+        return self._catalog.get_tables_indexes()
+
+    def get_active_pragmas(self) -> Dict:
+        # the partitions are opened with the same profile/ pragmas as the catalog
+        return self._catalog.get_active_pragmas()
+
+    def create_table(self,
+                     table_name: AnyStr,
+                     columns_definition: List[SqLiteColumnDef],
+                     indexes_definition: Optional[List[SqLiteIndexDef]] = None,
+                     index_timestamp: bool = True):
+        self._catalog.create_table(table_name=table_name,
+                                   columns_definition=columns_definition,
+                                   indexes_definition=indexes_definition,
+                                   index_timestamp=index_timestamp)
+        self._catalog.con.commit()
+        # the partitions already open were synced when opened, before this table existed
+        for _, start, _ in self.get_partitions():
+            self._sync_partition_schema(db=self._get_partition(start),
+                                        partition_start=start)
+
+    def drop_table(self,
+                   table_name: AnyStr):
+        self._catalog.drop_table(table_name=table_name)
+        self._catalog.con.commit()
+        for _, start, _ in self.get_partitions():
+            db = self._get_partition(start)
+            db.drop_table(table_name=table_name)
+            db.con.commit()
+
+    def add_column(self,
+                   table_name: AnyStr,
+                   column_def: SqLiteColumnDef):
+        self._catalog.add_column(table_name=table_name,
+                                 column_def=column_def)
+        self._catalog.con.commit()
+        for _, start, _ in self.get_partitions():
+            db = self._get_partition(start)
+            if column_def.column_name not in db.get_tables_columns()[table_name]:
+                db.add_column(table_name=table_name,
+                              column_def=column_def)
+                db.con.commit()
+
+    def rename_column(self,
+                      table_name: AnyStr,
+                      old_column_name: AnyStr,
+                      new_column_name: AnyStr,
+                      mode: Literal['auto', 'native', 'rebuild'] = 'auto',
+                      chunk_size: int = 10000,
+                      progress_callback: Optional[Callable[[int, int], None]] = None):
+        # the progress_callback is called per partition
+        self._catalog.rename_column(table_name=table_name,
+                                    old_column_name=old_column_name,
+                                    new_column_name=new_column_name,
+                                    mode=mode)
+        self._catalog.con.commit()
+        for _, start, _ in self.get_partitions():
+            db = self._get_partition(start)
+            if old_column_name in db.get_tables_columns().get(table_name, []):
+                db.rename_column(table_name=table_name,
+                                 old_column_name=old_column_name,
+                                 new_column_name=new_column_name,
+                                 mode=mode,
+                                 chunk_size=chunk_size,
+                                 progress_callback=progress_callback)
+                db.con.commit()
+
+    # ############## writes, routed by TIMESTAMP/ ID #################
+    def append_in_table(self,
+                        table_name: AnyStr,
+                        column_names: List,
+                        column_values: List):
+        db = self._get_partition(int(datetime.now().timestamp()))
+        db.append_in_table(table_name=table_name,
+                           column_names=column_names,
+                           column_values=column_values)
+        db.con.commit()
+
+    def append_many_in_table(self,
+                             table_name: AnyStr,
+                             column_names: List,
+                             rows: List[List],
+                             timestamp_per_row: bool = False) -> int:
+        if 'TIMESTAMP' not in column_names:
+            timestamp = int(datetime.now().timestamp())
+            column_names = ['TIMESTAMP'] + column_names
+            rows = [[int(datetime.now().timestamp()) if timestamp_per_row else timestamp] + list(row) for row in rows]
+
+        # one transaction per touched partition
+        timestamp_index = column_names.index('TIMESTAMP')
+        partitions_rows = {}
+        for row in rows:
+            partitions_rows.setdefault(get_partition_bounds(int(row[timestamp_index]), self.period)[1], []).append(row)
+
+        rows_inserted = 0
+        for partition_start, partition_rows in partitions_rows.items():
+            rows_inserted += self._get_partition(partition_start).append_many_in_table(table_name=table_name,
+                                                                                       column_names=column_names,
+                                                                                       rows=partition_rows)
+        return rows_inserted
+
+    def _group_IDs_by_partition(self,
+                                record_IDs: List[int]) -> Dict[int, List[int]]:
+        partitions_IDs = {}
+        for record_ID in record_IDs:
+            partitions_IDs.setdefault(get_partition_bounds(int(record_ID) // ID_SPACING, self.period)[1], []).append(record_ID)
+        return partitions_IDs
+
+    def update_record(self,
+                      table_name: AnyStr,
+                      record_ID: int,
+                      data: Dict,
+                      skip_new_empty_entries: bool = False) -> int:
+        db = self._get_partition(int(record_ID) // ID_SPACING, create=False)
+        if db is None:
+            return 0
+        rows_updated = db.update_record(table_name=table_name,
+                                        record_ID=record_ID,
+                                        data=data,
+                                        skip_new_empty_entries=skip_new_empty_entries)
+        db.con.commit()
+        return rows_updated
+
+    def update_records(self,
+                       table_name: AnyStr,
+                       records: Dict[int, Dict],
+                       skip_new_empty_entries: bool = False) -> int:
+        rows_updated = 0
+        for partition_start, record_IDs in self._group_IDs_by_partition(list(records.keys())).items():
+            db = self._get_partition(partition_start, create=False)
+            if db is None:
+                continue
+            rows_updated += db.update_records(table_name=table_name,
+                                              records={_: records[_] for _ in record_IDs},
+                                              skip_new_empty_entries=skip_new_empty_entries)
+        return rows_updated
+
+    def delete_record(self,
+                      table_name: AnyStr,
+                      record_ID: int):
+        self.delete_records(table_name=table_name,
+                            record_IDs=[record_ID])
+
+    def delete_records(self,
+                       table_name: AnyStr,
+                       record_IDs: List[int]) -> int:
+        rows_deleted = 0
+        for partition_start, partition_IDs in self._group_IDs_by_partition(record_IDs).items():
+            db = self._get_partition(partition_start, create=False)
+            if db is None:
+                continue
+            rows_deleted += db.delete_records(table_name=table_name,
+                                              record_IDs=partition_IDs)
+        return rows_deleted
+
+    def clear_old_records(self,
+                          table_name: AnyStr,
+                          since_time_in_past_s: int,
+                          timestamp_column_name: AnyStr = 'TIMESTAMP',
+                          batch_size: Optional[int] = None,
+                          sleep_between_batches_s: float = 0) -> int:
+        # the retention is per partition file: the expired partitions are unlinked (for ALL the tables),
+        # only the rows of the partition holding the cutoff are DELETE-d; returns the number of DELETE-d rows
+        self.drop_old_partitions(since_time_in_past_s=since_time_in_past_s)
+
+        cutoff = int((datetime.now() - timedelta(seconds=since_time_in_past_s)).timestamp())
+        rows_deleted = 0
+        for _, start, _ in self.get_partitions(until=cutoff):
+            db = self._get_partition(start)
+            rows_deleted += db.clear_old_records(table_name=table_name,
+                                                 since_time_in_past_s=since_time_in_past_s,
+                                                 timestamp_column_name=timestamp_column_name,
+                                                 batch_size=batch_size,
+                                                 sleep_between_batches_s=sleep_between_batches_s)
+            db.con.commit()
+        return rows_deleted
+
+    # ############## reads, over the ATTACH-ed partitions #################
+    @staticmethod
+    def _time_range(where_filters: Optional[List[Tuple]]) -> Tuple[Optional[int], Optional[int]]:
+        # the [since, until] TIMESTAMP range implied by the where filters (None = unbounded)
+        since, until = None, None
+        for where_filter in where_filters or []:
+            column_name, operator, value = (list(where_filter) + [None])[:3]
+            operator = str(operator).strip().upper()
+            if column_name != 'TIMESTAMP' or value is None:
+                continue
+            if operator in ('>', '>=', '=', 'BETWEEN'):
+                low = value[0] if operator == 'BETWEEN' else value
+                since = low if since is None else max(since, low)
+            if operator in ('<', '<=', '=', 'BETWEEN'):
+                high = value[1] if operator == 'BETWEEN' else value
+                until = high if until is None else min(until, high)
+
+        return since, until
+
+    def _get_partition_groups(self,
+                              since: Optional[int],
+                              until: Optional[int],
+                              reverse: bool = False) -> List[List[Tuple[str, int, int]]]:
+        # the partitions overlapping [since, until] by groups of max_attached, in chronological order (or reversed)
+        partitions = self.get_partitions(since, until)
+        if reverse:
+            partitions.reverse()
+        return [partitions[i:i+self.max_attached] for i in range(0, len(partitions), self.max_attached)]
+
+    @contextmanager
+    def _attached(self,
+                  table_name: AnyStr,
+                  group: List[Tuple[str, int, int]]):
+        # ATTACH-es the group of partitions, yields the SQL of the UNION ALL of their table_name
+        schema_names = [f'partition_{i}' for i in range(len(group))]
+        try:
+            for schema_name, (key, _, _) in zip(schema_names, group):
+                self._catalog.con.execute('ATTACH DATABASE ? AS ' + schema_name, [self._partition_path(key)])
+            yield ' UNION ALL '.join(f'SELECT * FROM {_}.{table_name}' for _ in schema_names)
+        finally:
+            for schema_name in schema_names:
+                try:
+                    self._catalog.con.execute(f'DETACH DATABASE {schema_name}')
+                except Exception:
+                    pass
+
+    def _iter_partition_groups(self,
+                               table_name: AnyStr,
+                               select_values: List[AnyStr],
+                               where_statement: Optional[str],
+                               where_filters: Optional[List[Tuple]],
+                               order: Optional[Literal['DESC', 'ASC']],
+                               order_by: AnyStr,
+                               limit: Optional[int],
+                               chunk_size: int,
+                               seek_sql: Optional[str] = None,
+                               seek_parameters: List = ()) -> Iterator[Tuple[List, List]]:
+        # yields (column names, chunk of rows); the partitions are ATTACH-ed by groups of max_attached
+        # and only then DETACH-ed, the groups are visited in chronological order (reversed for DESC)
+        groups = self._get_partition_groups(*self._time_range(where_filters),
+                                            reverse=order == 'DESC')
+        if len(groups) > 1 and order and order_by not in ('ID', 'TIMESTAMP'):
+            raise ValueError(f'The query spans more than {self.max_attached} partitions, '
+                             f'it can only be ordered by ID or TIMESTAMP; narrow its TIMESTAMP range')
+
+        where_sql, where_parameters = compile_where_filters(where_filters=where_filters,
+                                                            where_statement=where_statement)
+        where_conditions = [f'({_})' for _ in (where_sql, seek_sql) if _]
+        rows_remaining = limit
+        for group in groups:
+            with self._attached(table_name, group) as union_sql:
+                sql_command = f"SELECT {', '.join(select_values) if select_values else '*'} FROM ({union_sql}) AS {table_name}"
+                if where_conditions:
+                    sql_command += f" WHERE {' AND '.join(where_conditions)}"
+                if order:
+                    sql_command += f' ORDER BY {order_by} {order}'
+                    if order_by != 'ID':
+                        sql_command += f', ID {order}'
+                if rows_remaining:
+                    sql_command += f' LIMIT {rows_remaining}'
+
+                cursorObj = self._catalog.con.cursor()
+                cursorObj.execute(sql_command, list(where_parameters) + list(seek_parameters))
+                column_names = [_[0] for _ in cursorObj.description]
+                while True:
+                    chunk = cursorObj.fetchmany(chunk_size)
+                    if not chunk:
+                        break
+                    if rows_remaining:
+                        rows_remaining -= len(chunk)
+                    yield column_names, chunk
+                cursorObj.close()
+
+            if limit and not rows_remaining:
+                return
+
+    def return_records(self,
+                       table_name: AnyStr,
+                       select_values: List[AnyStr] = [],
+                       where_statement: Optional[str] = None,
+                       order: Optional[Literal['DESC', 'ASC']] = None,
+                       order_by: AnyStr = 'ID',
+                       limit: Optional[int] = None,
+                       output_format: Literal['rows', 'columns'] = 'rows',
+                       chunk_size: int = 10000,
+                       where_filters: Optional[List[Tuple]] = None) -> Union[List[List], Dict]:
+        records_chunks = self._iter_partition_groups(table_name=table_name,
+                                                     select_values=select_values,
+                                                     where_statement=where_statement,
+                                                     where_filters=where_filters,
+                                                     order=order,
+                                                     order_by=order_by,
+                                                     limit=limit,
+                                                     chunk_size=chunk_size)
+        if output_format == 'rows':
+            return [row for _, chunk in records_chunks for row in chunk]
+
+        return chunks_to_arrays(column_names=list(select_values) if select_values else self.get_tables_columns()[table_name],
+                                chunks=(chunk for _, chunk in records_chunks))
+
+    def iter_records(self,
+                     table_name: AnyStr,
+                     select_values: List[AnyStr] = [],
+                     where_statement: Optional[str] = None,
+                     order: Optional[Literal['DESC', 'ASC']] = None,
+                     order_by: AnyStr = 'ID',
+                     limit: Optional[int] = None,
+                     chunk_size: int = 1000,
+                     yield_chunks: bool = False,
+                     where_filters: Optional[List[Tuple]] = None) -> Iterator:
+        for _, chunk in self._iter_partition_groups(table_name=table_name,
+                                                    select_values=select_values,
+                                                    where_statement=where_statement,
+                                                    where_filters=where_filters,
+                                                    order=order,
+                                                    order_by=order_by,
+                                                    limit=limit,
+                                                    chunk_size=chunk_size):
+            if yield_chunks:
+                yield chunk
+            else:
+                yield from chunk
+
+    def return_records_page(self,
+                            table_name: AnyStr,
+                            select_values: List[AnyStr] = None,
+                            where_statement: Optional[str] = None,
+                            order: Literal['DESC', 'ASC'] = 'ASC',
+                            order_by: AnyStr = 'ID',
+                            page_size: int = 1000,
+                            page_cursor: Optional[str] = None,
+                            where_filters: Optional[List[Tuple]] = None) -> Tuple[List, Optional[str]]:
+        # keyset pagination like SqLiteDbWrapper.return_records_page, same cursors
+        seek_operator = '>' if order == 'ASC' else '<'
+        extra_columns = ['ID'] if order_by == 'ID' else [order_by, 'ID']
+
+        seek_sql, seek_parameters = None, []
+        if page_cursor:
+            last_order_value, last_ID = json.loads(base64.urlsafe_b64decode(page_cursor.encode()))
+            if order_by == 'ID':
+                seek_sql, seek_parameters = f'ID {seek_operator} ?', [last_ID]
+            elif last_order_value is None:
+                # the NULLs are sorted first (ASC)/ last (DESC) and never match a comparison
+                seek_sql = f'({order_by} IS NULL AND ID {seek_operator} ?)' + (f' OR {order_by} IS NOT NULL' if order == 'ASC' else '')
+                seek_parameters = [last_ID]
+            else:
+                seek_sql = f'({order_by}, ID) {seek_operator} (?, ?)' + (f' OR {order_by} IS NULL' if order == 'DESC' else '')
+                seek_parameters = [last_order_value, last_ID]
+
+        rows = []
+        for _, chunk in self._iter_partition_groups(table_name=table_name,
+                                                    select_values=(list(select_values) if select_values else ['*']) + extra_columns,
+                                                    where_statement=where_statement,
+                                                    where_filters=where_filters,
+                                                    order=order,
+                                                    order_by=order_by,
+                                                    limit=page_size,
+                                                    chunk_size=page_size,
+                                                    seek_sql=seek_sql,
+                                                    seek_parameters=seek_parameters):
+            rows.extend(chunk)
+
+        next_page_cursor = None
+        if len(rows) == page_size:
+            last_row = rows[-1]
+            next_page_cursor = base64.urlsafe_b64encode(json.dumps([last_row[-len(extra_columns)],
+                                                                   last_row[-1]]).encode()).decode()
+
+        # strip the extra columns used for seeking
+        return [row[:-len(extra_columns)] for row in rows], next_page_cursor
+
+    def return_aggregated(self,
+                          table_name: AnyStr,
+                          columns: List[AnyStr],
+                          bucket_s: int,
+                          agg: List[all_aggregates] = ['avg', 'min', 'max', 'last'],
+                          since: Optional[int] = None,
+                          until: Optional[int] = None,
+                          where_statement: Optional[str] = None,
+                          timestamp_column_name: AnyStr = 'TIMESTAMP') -> List[List]:
+        # same SQL as SqLiteDbWrapper.return_aggregated, over a CTE named as the table; the partitions start
+        # at midnight UTC so a bucket dividing a day never spans 2 partitions (or 2 groups of partitions)
+        groups = self._get_partition_groups(since, until)
+        if len(groups) > 1 and (24*60*60) % int(bucket_s):
+            raise ValueError(f'The query spans more than {self.max_attached} partitions, '
+                             f'it can only be aggregated in buckets dividing a day; narrow its time range')
+
+        sql_command, parameters = SqLiteDbWrapper._aggregated_sql(table_name=table_name,
+                                                                  columns=columns,
+                                                                  bucket_s=bucket_s,
+                                                                  agg=agg,
+                                                                  since=since,
+                                                                  until=until,
+                                                                  where_statement=where_statement,
+                                                                  timestamp_column_name=timestamp_column_name)
+        all_rows = []
+        for group in groups:
+            with self._attached(table_name, group) as union_sql:
+                all_rows.extend(self._catalog.con.execute(f'WITH {table_name} AS ({union_sql}) {sql_command}',
+                                                          parameters).fetchall())
+        return all_rows
+
+if __name__ == '__main__':
+    import shutil
+    shutil.rmtree('database_partitions_test', ignore_errors=True)
+
+    with SqLiteDbPartitionedWrapper(database_dir='database_partitions_test', period='day') as DB:
+        DB.create_table(table_name='my_db_table_name',
+                        columns_definition=[SqLiteColumnDef(column_name='my_column_name1',
+                                                            column_type='INTEGER')])
+
+        # TEST the rows are routed to their day partition, with IDs unique across the partitions
+        now = int(datetime.now().timestamp())
+        result = DB.append_many_in_table(table_name='my_db_table_name',
+                                         column_names=['TIMESTAMP', 'my_column_name1'],
+                                         rows=[[now - 3*24*60*60, 1], [now - 24*60*60, 2], [now, 3]])
+        expected = 3
+        assert result == expected, f'wrong value returned ! expected  {expected}, got {result}'
+        result = len(DB.get_partitions())
+        assert result == expected, f'wrong value returned ! expected  {expected}, got {result}'
+
+        # TEST a time range query only reads the partitions it touches
+        result = DB.return_records(table_name='my_db_table_name',
+                                   select_values=['my_column_name1'],
+                                   where_filters=[('TIMESTAMP', '>=', now - 24*60*60)],
+                                   order='ASC',
+                                   order_by='TIMESTAMP')
+        expected = [(2,), (3,)]
+        assert result == expected, f'wrong value returned ! expected  {expected}, got {result}'
+
+        # TEST the update/ delete by ID are routed to the right partition
+        record_ID = DB.return_records(table_name='my_db_table_name',
+                                      select_values=['ID'],
+                                      order='ASC',
+                                      limit=1)[0][0]
+        result = DB.update_record(table_name='my_db_table_name',
+                                  record_ID=record_ID,
+                                  data={'my_column_name1': 10})
+        expected = 1
+        assert result == expected, f'wrong value returned ! expected  {expected}, got {result}'
+
+        # TEST a table created after a partition was opened is created in that partition too
+        DB.create_table(table_name='my_db_table_name2',
+                        columns_definition=[SqLiteColumnDef(column_name='my_column_name1',
+                                                            column_type='INTEGER')])
+        DB.append_in_table(table_name='my_db_table_name2',
+                           column_names=['my_column_name1'],
+                           column_values=[4])
+        result = DB.return_records(table_name='my_db_table_name2',
+                                   select_values=['my_column_name1'])
+        expected = [(4,)]
+        assert result == expected, f'wrong value returned ! expected  {expected}, got {result}'
+
+        # TEST the pagination continues across the partitions
+        result, page_cursor = [], None
+        while True:
+            page, page_cursor = DB.return_records_page(table_name='my_db_table_name',
+                                                       select_values=['my_column_name1'],
+                                                       order='DESC',
+                                                       page_size=2,
+                                                       page_cursor=page_cursor)
+            result += page
+            if not page_cursor:
+                break
+        expected = [(3,), (2,), (10,)]
+        assert result == expected, f'wrong value returned ! expected  {expected}, got {result}'
+
+        # TEST the aggregation per day bucket, one bucket per partition
+        result = [_[1:] for _ in DB.return_aggregated(table_name='my_db_table_name',
+                                                      columns=['my_column_name1'],
+                                                      bucket_s=24*60*60,
+                                                      agg=['max', 'last'])]
+        expected = [(10, 10), (2, 2), (3, 3)]
+        assert result == expected, f'wrong value returned ! expected  {expected}, got {result}'
+
+        # TEST the column rename is applied to the catalog and to every partition
+        DB.rename_column(table_name='my_db_table_name2',
+                         old_column_name='my_column_name1',
+                         new_column_name='my_column_name11')
+        result = DB.return_records(table_name='my_db_table_name2',
+                                   select_values=['my_column_name11'])
+        expected = [(4,)]
+        assert result == expected, f'wrong value returned ! expected  {expected}, got {result}'
+        assert DB.get_active_pragmas()['journal_mode'] == 'wal', 'wrong pragmas returned'
+
+        # TEST the retention unlinks the expired partitions
+        DB.clear_old_records(table_name='my_db_table_name',
+                             since_time_in_past_s=2*24*60*60)
+        result = DB.return_records(table_name='my_db_table_name',
+                                   select_values=['my_column_name1'],
+                                   order='DESC')
+        expected = [(3,), (2,)]
+        assert result == expected, f'wrong value returned ! expected  {expected}, got {result}'
+        result = len(DB.get_partitions())
+        expected = 2
+        assert result == expected, f'wrong value returned ! expected  {expected}, got {result}'
+
+    shutil.rmtree('database_partitions_test', ignore_errors=True)
+
+    print('All tests are PASSED !')
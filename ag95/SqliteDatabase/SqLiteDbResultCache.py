@@ -0,0 +1,221 @@
+from collections import OrderedDict
+from copy import copy
+from threading import Lock
+from time import monotonic
+from typing import (AnyStr,
+                    Dict,
+                    Hashable,
+                    Optional)
+import sys
+
+class SqLiteDbResultCache():
+    """
+    LRU cache for the results of return_records, with TTL and memory bound eviction.
+
+    The entries are grouped per table; any write done through the owner of the cache (SqLiteDbWrapper
+    or the service ServiceBackend) invalidates the entries of that table and of its rollups.
+    The writes done by other connections/ processes are not seen, ttl_s bounds how stale such an entry can get.
+
+    Recommended Usage:
+    with SqLiteDbWrapper(result_cache=SqLiteDbResultCache(ttl_s=2)) as DB:
+        DB.return_records(...)  # miss, the query is executed
+        DB.return_records(...)  # hit
+        print(DB.result_cache.get_stats())
+    """
+
+    def __init__(self,
+                 max_entries: int = 256,
+                 max_bytes: int = 64*1024*1024,
+                 ttl_s: Optional[float] = 5):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl_s = ttl_s
+
+        self._lock = Lock()
+        # (table name, key) -> (expires at, size in bytes, result)
+        self._entries = OrderedDict()
+        # table name -> set of the keys cached for it
+        self._table_keys = {}
+        # table name -> generation, bumped by every invalidation
+        self._generations = {}
+        self._bytes = 0
+        self._stats = {'hits': 0,
+                       'misses': 0,
+                       'expired': 0,
+                       'evicted': 0,
+                       'invalidations': 0}
+
+    @staticmethod
+    def make_key(*query_parameters) -> Optional[Hashable]:
+        # normalized query parameters: lists become tuples, sets sorted tuples, the strings are stripped
+        # (the inner whitespace is kept, it may be part of a string literal)
+        # None if they still can not be hashed => the query is not cached
+        def normalize(value):
+            if isinstance(value, (list, tuple)):
+                return tuple(normalize(_) for _ in value)
+            if isinstance(value, (set, frozenset)):
+                return tuple(sorted((normalize(_) for _ in value), key=repr))
+            if isinstance(value, str):
+                return value.strip()
+            return value
+
+        key = normalize(query_parameters)
+        try:
+            hash(key)
+        except TypeError:
+            return None
+        return key
+
+    @staticmethod
+    def _estimate_size(result) -> int:
+        # rough estimate, extrapolated from the first row/ column
+        if isinstance(result, dict):
+            return sys.getsizeof(result) + sum(SqLiteDbResultCache._estimate_size(_) for _ in result.values())
+        if isinstance(result, list) and result:
+            first = result[0]
+            row_size = sys.getsizeof(first)
+            if isinstance(first, tuple):
+                row_size += sum(sys.getsizeof(_) for _ in first)
+            return sys.getsizeof(result) + row_size * len(result)
+        # array.array, numpy arrays, empty lists
+        return getattr(result, 'nbytes', sys.getsizeof(result))
+
+    @staticmethod
+    def _copy(result):
+        # the callers get their own container, so modifying it does not alter the cached entry
+        if isinstance(result, dict):
+            return {column_name: copy(column) for column_name, column in result.items()}
+        return copy(result)
+
+    def get_generation(self,
+                       table_name: AnyStr) -> int:
+        # to be read BEFORE running the query, then passed to put()
+        with self._lock:
+            return self._generations.setdefault(table_name, 0)
+
+    def get(self,
+            table_name: AnyStr,
+            key: Hashable):
+        # returns None on miss
+        with self._lock:
+            entry = self._entries.get((table_name, key))
+            if entry is None:
+                self._stats['misses'] += 1
+                return None
+
+            if entry[0] is not None and entry[0] < monotonic():
+                self._remove((table_name, key))
+                self._stats['expired'] += 1
+                self._stats['misses'] += 1
+                return None
+
+            self._entries.move_to_end((table_name, key))
+            self._stats['hits'] += 1
+            result = entry[2]
+
+        return self._copy(result)
+
+    def put(self,
+            table_name: AnyStr,
+            key: Hashable,
+            result,
+            generation: int):
+        size = self._estimate_size(result)
+        if size > self.max_bytes:
+            return
+        result = self._copy(result)
+
+        with self._lock:
+            # the table was written while the query was running, the result may already be stale
+            if self._generations.get(table_name, 0) != generation:
+                return
+
+            if (table_name, key) in self._entries:
+                self._remove((table_name, key))
+            self._entries[(table_name, key)] = (monotonic() + self.ttl_s if self.ttl_s is not None else None,
+                                                size,
+                                                result)
+            self._table_keys.setdefault(table_name, set()).add(key)
+            self._bytes += size
+
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+                self._stats['evicted'] += 1
+
+    def _remove(self,
+                entry_key):
+        _, size, _ = self._entries.pop(entry_key)
+        self._bytes -= size
+        table_keys = self._table_keys.get(entry_key[0])
+        if table_keys is not None:
+            table_keys.discard(entry_key[1])
+
+    def invalidate(self,
+                   table_name: AnyStr):
+        # the rollups of the table are written by its insert trigger, they are invalidated as well
+        with self._lock:
+            self._stats['invalidations'] += 1
+            for cached_table_name in {table_name} | {_ for _ in self._generations if _.startswith(f'{table_name}_rollup_')}:
+                self._generations[cached_table_name] = self._generations.get(cached_table_name, 0) + 1
+                for key in list(self._table_keys.pop(cached_table_name, ())):
+                    self._remove((cached_table_name, key))
+
+    def clear(self):
+        # after schema changes (migrations, etc.)
+        with self._lock:
+            self._stats['invalidations'] += 1
+            for table_name in self._generations:
+                self._generations[table_name] += 1
+            self._entries.clear()
+            self._table_keys.clear()
+            self._bytes = 0
+
+    def get_stats(self) -> Dict:
+        with self._lock:
+            stats = dict(self._stats)
+            stats['entries'] = len(self._entries)
+            stats['bytes'] = self._bytes
+
+        lookups = stats['hits'] + stats['misses']
+        stats['hit_ratio'] = stats['hits'] / lookups if lookups else 0.0
+
+        return stats
+
+if __name__ == '__main__':
+    cache = SqLiteDbResultCache(max_entries=2, ttl_s=60)
+    key = cache.make_key('my_db_table_name', ['ID'], '  ID > 1 ')
+
+    # TEST miss, then hit with the same normalized key
+    assert cache.get('my_db_table_name', key) is None
+    cache.put('my_db_table_name', key, [(1,)], generation=cache.get_generation('my_db_table_name'))
+    result = cache.get('my_db_table_name', cache.make_key('my_db_table_name', ('ID',), 'ID > 1'))
+    expected = [(1,)]
+    assert result == expected, f'wrong value returned ! expected  {expected}, got {result}'
+
+    # TEST the invalidation of the table and of its rollups
+    cache.put('my_db_table_name_rollup_1h', key, [(2,)], generation=cache.get_generation('my_db_table_name_rollup_1h'))
+    cache.invalidate('my_db_table_name')
+    assert cache.get('my_db_table_name', key) is None
+    assert cache.get('my_db_table_name_rollup_1h', key) is None
+
+    # TEST a result computed before an invalidation is not cached
+    generation = cache.get_generation('my_db_table_name')
+    cache.invalidate('my_db_table_name')
+    cache.put('my_db_table_name', key, [(1,)], generation=generation)
+    assert cache.get('my_db_table_name', key) is None
+
+    # TEST the LRU eviction
+    for i in range(3):
+        cache.put('other_table', i, [(i,)], generation=cache.get_generation('other_table'))
+    assert cache.get('other_table', 0) is None and cache.get('other_table', 2) == [(2,)]
+
+    # TEST the sets are normalized, the unhashable parameters are not cached
+    result = cache.make_key([('ID', 'IN', {3, 1, 2})]) == cache.make_key([('ID', 'IN', frozenset([2, 3, 1]))])
+    assert result, 'the sets were not normalized'
+    result = cache.make_key([('ID', 'IN', {'unhashable': 1})])
+    assert result is None, f'wrong value returned ! expected  None, got {result}'
+
+    result = cache.get_stats()
+    assert result['hits'] == 2 and result['evicted'] == 1, f'wrong stats returned ! got {result}'
+
+    print('All tests are PASSED !')
@@ -1,42 +1,459 @@
-from sqlite3 import connect
+from sqlite3 import (connect,
+                     sqlite_version_info,
+                     ProgrammingError)
+from contextlib import contextmanager
+from collections import OrderedDict
 from typing import (List,
                     AnyStr,
+                    Callable,
                     Dict,
+                    Iterable,
+                    Iterator,
                     Literal,
-                    Optional)
+                    Optional,
+                    Tuple,
+                    Union)
+from urllib.request import pathname2url
+from array import array
+from operator import itemgetter
+import base64
+import json
+import re
 from datetime import (datetime,
                       timedelta)
-from time import sleep
+from time import (sleep,
+                  perf_counter)
+from ag95.General.query_instrumentation import (QueryInstrumentation,
+                                                instrumented)
+from ag95.SqliteDatabase.SqLiteDbResultCache import SqLiteDbResultCache
+from ag95.General.sql_where_builder import compile_where_filters
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# transaction control/ schema checks, not reported as the SQL of an instrumented operation
+_UNTRACED_SQL_PREFIXES = ('BEGIN', 'COMMIT', 'ROLLBACK', 'SAVEPOINT', 'RELEASE', 'PRAGMA', 'pragma')
+
+all_aggregates = Literal['avg', 'min', 'max', 'sum', 'count', 'first', 'last']
+
+# named connection profiles (PRAGMA name -> value), applied on top of the journal mode
+all_sqlite_profiles = Literal['durable', 'balanced', 'ingest', 'read_only']
+SQLITE_PERFORMANCE_PROFILES = {
+    # every commit is fsync-ed, safest against power loss
+    'durable': {'synchronous': 'FULL'},
+    # in WAL mode, NORMAL only loses the last commits on power loss, never corrupts the db
+    'balanced': {'synchronous': 'NORMAL',
+                 'cache_size': -64000, # negative => KiB, so 64 MB
+                 'temp_store': 'MEMORY'},
+    # write heavy loads: bigger cache and fewer, larger WAL checkpoints
+    'ingest': {'synchronous': 'NORMAL',
+               'cache_size': -256000,
+               'temp_store': 'MEMORY',
+               'mmap_size': 256*1024*1024,
+               'wal_autocheckpoint': 10000},
+    # readers: no writes allowed, big cache and memory mapped reads
+    'read_only': {'query_only': 'ON',
+                  'cache_size': -128000,
+                  'temp_store': 'MEMORY',
+                  'mmap_size': 1024*1024*1024}
+}
+# the pragmas reported by get_active_pragmas, on top of the custom ones
+REPORTED_PRAGMAS = ['journal_mode', 'synchronous', 'cache_size', 'mmap_size',
+                    'temp_store', 'busy_timeout', 'wal_autocheckpoint', 'query_only']
+
+# where the reads are served from: the db file, the db file memory mapped or an in-memory copy of the db
+all_read_modes = Literal['disk', 'mmap', 'memory']
+
+def apply_sqlite_pragmas(con,
+                         profile: Optional[all_sqlite_profiles] = None,
+                         pragmas: Optional[Dict] = None) -> Dict:
+    # the custom pragmas take precedence over the ones of the profile
+    if profile and profile not in SQLITE_PERFORMANCE_PROFILES:
+        raise ValueError(f'Unknown sqlite profile {profile}, available: {list(SQLITE_PERFORMANCE_PROFILES.keys())}')
+    all_pragmas = dict(SQLITE_PERFORMANCE_PROFILES[profile]) if profile else {}
+    all_pragmas.update(pragmas or {})
+
+    for pragma_name, pragma_value in all_pragmas.items():
+        if not str(pragma_name).isidentifier():
+            raise ValueError(f'Invalid pragma name {pragma_name}')
+        con.execute(f'PRAGMA {pragma_name}={pragma_value}')
+
+    return all_pragmas
+
+# the tokens of a SQL statement that may contain a name: the string literals and the comments (kept as they are),
+# the quoted identifiers ("name", [name], `name`) and the bare words (identifiers or keywords)
+_SQL_TOKENS = re.compile(r"('(?:[^']|'')*'|--[^\n]*|/\*.*?\*/)"
+                         r'|("(?:[^"]|"")*"|\[[^\]]*\]|`(?:[^`]|``)*`)'
+                         r"|([A-Za-z_][A-Za-z0-9_$]*)",
+                         re.DOTALL)
+
+def _sql_identifiers(sql: str) -> List[str]:
+    # the names used in sql, lower case (the sqlite identifiers are case insensitive), outside of the literals/ comments
+    identifiers = []
+    for match in _SQL_TOKENS.finditer(sql):
+        if match.group(2):
+            identifiers.append(match.group(2)[1:-1].lower())
+        elif match.group(3):
+            identifiers.append(match.group(3).lower())
+    return identifiers
+
+def _rename_sql_identifiers(sql: str,
+                            renamed_names: Dict[str, str]) -> str:
+    # renames the identifier tokens only, never a part of a longer name or the content of a literal/ comment
+    renamed_names = {old_name.lower(): new_name for old_name, new_name in renamed_names.items()}
+
+    def rename(match):
+        if match.group(2) and match.group(2)[1:-1].lower() in renamed_names:
+            return f'"{renamed_names[match.group(2)[1:-1].lower()]}"'
+        if match.group(3) and match.group(3).lower() in renamed_names:
+            return renamed_names[match.group(3).lower()]
+        return match.group(0)
+
+    return _SQL_TOKENS.sub(rename, sql)
+
+class _ColumnBuffer:
+    # one column of the columnar output, filled chunk by chunk: a typed array ('q' int64, then 'd' float64)
+    # while the values are numeric, with the NULLs tracked in a mask; a list once a text/ blob value shows up
+    def __init__(self):
+        self.values = array('q')
+        self.nulls = None
+
+    def extend(self,
+               chunk: List[tuple],
+               getter: itemgetter):
+        values_count = len(self.values)
+        try:
+            # fast path: the values of the chunk go straight into the typed array/ list
+            self.values.extend(map(getter, chunk))
+            if self.nulls is not None:
+                self.nulls.extend(bytes(len(chunk)))
+            return
+        except (TypeError, OverflowError):
+            del self.values[values_count:]
+        for value in map(getter, chunk):
+            self.append(value)
+
+    def append(self,
+               value):
+        if not isinstance(self.values, array):
+            self.values.append(value)
+            return
+        if value is None:
+            if self.nulls is None:
+                self.nulls = bytearray(len(self.values))
+            self.nulls.append(1)
+            self.values.append(0)
+            return
+        try:
+            self.values.append(value)
+        except (TypeError, OverflowError):
+            if isinstance(value, float) and self.values.typecode == 'q':
+                self.values = array('d', self.values)
+            else:
+                # the lists keep the NULLs as None
+                self.values = [None if self.nulls and self.nulls[i] else _ for i, _ in enumerate(self.values)]
+                self.nulls = None
+            self.values.append(value)
+        if self.nulls is not None:
+            self.nulls.append(0)
+
+    def to_array(self):
+        # NumPy: an ndarray, masked if there are NULLs (same as DuckDb's fetchnumpy)
+        # otherwise the typed array, or a list with None for the NULLs
+        if isinstance(self.values, array):
+            nulls = self.nulls if self.nulls is not None and any(self.nulls) else None
+        else:
+            nulls = bytearray(_ is None for _ in self.values) if None in self.values else None
+
+        if numpy is not None:
+            if isinstance(self.values, array):
+                column = numpy.frombuffer(self.values, dtype=numpy.int64 if self.values.typecode == 'q' else numpy.float64)
+            else:
+                column = numpy.array(self.values, dtype=object)
+            if nulls is not None:
+                return numpy.ma.masked_array(column, mask=numpy.frombuffer(nulls, dtype=numpy.bool_))
+            return column
+
+        if nulls is not None and isinstance(self.values, array):
+            return [None if null else _ for _, null in zip(self.values, nulls)]
+        return self.values
+
+def chunks_to_arrays(column_names: List[AnyStr],
+                     chunks: Iterable[List[tuple]]) -> Dict:
+    # columnar output: column name -> array, each chunk of rows is appended to the typed column buffers
+    # as it is fetched, so only the current chunk exists as rows
+    columns = [_ColumnBuffer() for _ in column_names]
+    getters = [itemgetter(_) for _ in range(len(column_names))]
+    for chunk in chunks:
+        for column, getter in zip(columns, getters):
+            column.extend(chunk, getter)
+
+    return {column_name: column.to_array() for column_name, column in zip(column_names, columns)}
 
 class SqLiteColumnDef:
     def __init__(self,
                 column_name: AnyStr,
-                column_type: AnyStr):
+                column_type: AnyStr,
+                index: bool = False):
         self.column_name = column_name
         self.column_type = column_type
+        self.index = index
+
+class SqLiteIndexDef:
+    def __init__(self,
+                 columns: List[AnyStr],
+                 unique: bool = False,
+                 index_name: Optional[AnyStr] = None):
+        self.columns = columns
+        self.unique = unique
+        self.index_name = index_name
+
+    def get_index_name(self,
+                       table_name: AnyStr) -> AnyStr:
+        return self.index_name or f"idx_{table_name}_{'_'.join(self.columns)}"
+
+all_rollup_aggregates = Literal['avg', 'min', 'max', 'count', 'sum']
+class SqLiteRollupDef:
+    def __init__(self,
+                 bucket_s: int,
+                 columns: List[AnyStr],
+                 aggregates: List[all_rollup_aggregates] = ['avg', 'min', 'max', 'count'],
+                 rollup_name: Optional[AnyStr] = None):
+        self.bucket_s = int(bucket_s)
+        self.columns = columns
+        self.aggregates = aggregates
+        self.rollup_name = rollup_name or {60: '1m', 60*60: '1h', 24*60*60: '1d'}.get(self.bucket_s, f'{self.bucket_s}s')
+
+    def get_rollup_table_name(self,
+                              table_name: AnyStr) -> AnyStr:
+        return f'{table_name}_rollup_{self.rollup_name}'
+
+    def get_rollup_columns(self) -> List[AnyStr]:
+        # count and sum are always kept, the running avg is computed from them
+        rollup_columns = []
+        for column_name in self.columns:
+            for aggregate in ['count', 'sum', 'min', 'max', 'avg']:
+                if aggregate in ('count', 'sum') or aggregate in self.aggregates:
+                    rollup_columns.append(f'{column_name}_{aggregate}')
+
+        return rollup_columns
 
 class SqLiteDbWrapper():
     def __init__(self,
                  database_path: AnyStr = 'database.db',
                  timeout: int = 5*60,
-                 use_wal: bool = True):
+                 use_wal: bool = True,
+                 cached_statements: int = 256,
+                 profile: Optional[all_sqlite_profiles] = None,
+                 pragmas: Optional[Dict] = None,
+                 read_only: bool = False,
+                 check_same_thread: bool = True,
+                 instrumentation: Optional[QueryInstrumentation] = None,
+                 result_cache: Optional[SqLiteDbResultCache] = None,
+                 read_mode: all_read_modes = 'disk',
+                 mmap_size: int = 1024*1024*1024,
+                 hot_copy_check_interval_s: float = 1.0,
+                 hot_copy_max_age_s: Optional[float] = None):
         self.database_path = database_path
-        self.con = connect(database_path, timeout=timeout)
-        if use_wal:
+        self.read_only = read_only
+        if read_only:
+            # mode=ro => the connection can never write, not even by mistake
+            self.con = connect(f'file:{pathname2url(database_path)}?mode=ro',
+                               uri=True,
+                               timeout=timeout,
+                               cached_statements=cached_statements,
+                               check_same_thread=check_same_thread)
+        else:
+            self.con = connect(database_path,
+                               timeout=timeout,
+                               cached_statements=cached_statements,
+                               check_same_thread=check_same_thread)
+
+        # the generated SQL texts are cached per connection, keyed by (operation, table, columns, ...)
+        # reusing the exact same text also lets sqlite3's own statement cache hit reliably
+        self._sql_cache = OrderedDict()
+        self._sql_cache_size = cached_statements
+        # table name -> column names; valid as long as the schema_version of the db does not change
+        self._schema_cache = None
+        self._schema_version = None
+
+        if read_only:
+            # the journal mode can not be changed by a read only connection
+            self.con.execute('pragma query_only=ON')
+        elif use_wal:
             self.con.execute('pragma journal_mode=wal')
         else:
             self.con.execute('pragma journal_mode=delete')
 
+        self.profile = profile
+        self.pragmas = apply_sqlite_pragmas(con=self.con,
+                                            profile=profile,
+                                            pragmas=pragmas)
+        if read_mode == 'mmap':
+            # the pages are read straight from the OS page cache, without copying them in the sqlite cache
+            self.con.execute(f'PRAGMA mmap_size={int(mmap_size)}')
+            self.pragmas['mmap_size'] = int(mmap_size)
+
+        # optional latency instrumentation, see the @instrumented methods
+        self.instrumentation = instrumentation
+        self._op_depth = 0
+        self._op_sql = None
+        self._op_lock_wait_s = 0.0
+        if instrumentation:
+            self.con.set_trace_callback(self._trace_sql)
+
+        # optional cache of the return_records results, invalidated by the writes done through this wrapper
+        self.result_cache = result_cache
+
+        # read_mode='memory': the reads are served by an in-memory copy of the db (hot copy), loaded with
+        # the backup API; it is reloaded on the next read after a write through this wrapper, after a commit
+        # of another connection/ process (PRAGMA data_version, checked at most every hot_copy_check_interval_s)
+        # or when older than hot_copy_max_age_s; the writes always go to the db file
+        self.read_mode = read_mode
+        self.hot_copy_check_interval_s = hot_copy_check_interval_s
+        self.hot_copy_max_age_s = hot_copy_max_age_s
+        self._check_same_thread = check_same_thread
+        self._hot_con = None
+        self._hot_copy_loaded_at = None
+        self._hot_copy_checked_at = None
+        self._hot_copy_data_version = None
+        self._hot_copy_stale = True
+        self.hot_copy_refreshes = 0
+        if read_mode == 'memory':
+            self.refresh_hot_copy()
+
     def __enter__(self):
         return self
 
     def __exit__(self, exc_type, exc_value, exc_traceback):
         self.con.commit()
         self.con.close()
+        if self._hot_con is not None:
+            self._hot_con.close()
 
-    def get_tables_columns(self) -> Dict:
-        tables_columns = {}
+    def refresh_hot_copy(self):
+        # loads a new in-memory copy, then swaps it in; the iterators still reading the previous copy keep it alive
+        data_version = self.con.execute('PRAGMA data_version').fetchone()[0]
+        hot_con = connect(':memory:',
+                          check_same_thread=self._check_same_thread)
+        self.con.backup(hot_con)
+        if self.instrumentation:
+            hot_con.set_trace_callback(self._trace_sql)
+
+        self._hot_con = hot_con
+        self._hot_copy_loaded_at = self._hot_copy_checked_at = perf_counter()
+        self._hot_copy_data_version = data_version
+        self._hot_copy_stale = False
+        self.hot_copy_refreshes += 1
+
+    def _get_read_con(self):
+        # the connection serving the reads, see read_mode
+        if self.read_mode != 'memory':
+            return self.con
+
+        now = perf_counter()
+        if not self._hot_copy_stale and self.hot_copy_max_age_s is not None \
+                and now - self._hot_copy_loaded_at >= self.hot_copy_max_age_s:
+            self._hot_copy_stale = True
+        if not self._hot_copy_stale and now - self._hot_copy_checked_at >= self.hot_copy_check_interval_s:
+            # data_version changes when another connection commits, it is read from the shared memory, not from the disk
+            self._hot_copy_checked_at = now
+            self._hot_copy_stale = self.con.execute('PRAGMA data_version').fetchone()[0] != self._hot_copy_data_version
+        if self._hot_copy_stale:
+            if self.con.in_transaction:
+                # the backup can not read the db while the own writes are not committed, they are read from the db file meanwhile
+                return self.con
+            self.refresh_hot_copy()
+
+        return self._hot_con
+
+    @contextmanager
+    def _transaction(self):
+        # reuse the transaction of the caller if one is already open,
+        # otherwise open an explicit one and commit/ rollback it here
+        if self.con.in_transaction:
+            yield
+            return
+
+        start = perf_counter()
+        self.con.execute('BEGIN IMMEDIATE')
+        # BEGIN IMMEDIATE waits (up to timeout) for the write lock of the db
+        self._op_lock_wait_s += perf_counter() - start
+        try:
+            yield
+        except:
+            self.con.rollback()
+            raise
+        self.con.commit()
+
+    @contextmanager
+    def transaction(self):
+        # groups several calls in a single transaction, committed on exit or rolled back on error
+        # (the calls made inside reuse it instead of committing on their own)
+        with self._transaction():
+            yield
+
+    @contextmanager
+    def savepoint(self,
+                  name: AnyStr = 'ag95_savepoint'):
+        # inside a transaction: on error, only the statements of the block are rolled back, the transaction goes on
+        self.con.execute(f'SAVEPOINT {name}')
+        try:
+            yield
+        except:
+            self.con.execute(f'ROLLBACK TO SAVEPOINT {name}')
+            self.con.execute(f'RELEASE SAVEPOINT {name}')
+            raise
+        self.con.execute(f'RELEASE SAVEPOINT {name}')
+
+    def _trace_sql(self,
+                   sql: str):
+        # keeps the first statement of the current instrumented operation, for the slow-query log
+        if self._op_sql is None and self._op_depth and not sql.startswith(_UNTRACED_SQL_PREFIXES):
+            self._op_sql = sql
+
+    def get_active_pragmas(self) -> Dict:
+        # the values actually active on the connection, to verify the applied profile
+        return {pragma_name: self.con.execute(f'PRAGMA {pragma_name}').fetchone()[0]
+                for pragma_name in dict.fromkeys(REPORTED_PRAGMAS + list(self.pragmas.keys()))}
+
+    def _cached_sql(self,
+                    key: tuple,
+                    build_sql) -> str:
+        sql = self._sql_cache.get(key)
+        if sql is None:
+            sql = build_sql()
+            self._sql_cache[key] = sql
+            if len(self._sql_cache) > self._sql_cache_size:
+                self._sql_cache.popitem(last=False)
+        else:
+            self._sql_cache.move_to_end(key)
+        return sql
+
+    def _invalidate_results(self,
+                            table_name: AnyStr):
+        # any write on a table drops the cached return_records results of that table (and of its rollups)
+        # and marks the hot copy as stale
+        self._hot_copy_stale = True
+        if self.result_cache is not None:
+            self.result_cache.invalidate(table_name)
+
+    def _invalidate_schema_cache(self):
+        # the hot copy has the schema of its load time as well
+        self._hot_copy_stale = True
+        self._schema_cache = None
+        self._schema_version = None
+
+    def _get_schema(self) -> Dict:
+        # PRAGMA schema_version is bumped by any DDL, including the ones done by other connections,
+        # so a single cheap pragma replaces the sqlite_master + PRAGMA_TABLE_INFO queries of every table
         cursorObj = self.con.cursor()
+        schema_version = cursorObj.execute('PRAGMA schema_version').fetchone()[0]
+        if self._schema_cache is not None and schema_version == self._schema_version:
+            return self._schema_cache
+
+        tables_columns = {}
         cursorObj.execute('SELECT name from sqlite_master where type = "table"')
 
         all_table_names = [_[0] for _ in cursorObj.fetchall()]
@@ -46,11 +463,63 @@ class SqLiteDbWrapper():
         for table_name in all_table_names:
             tables_columns.update({table_name : cursorObj.execute(f"SELECT GROUP_CONCAT(NAME,',') FROM PRAGMA_TABLE_INFO('{table_name}')").fetchall()[0][0].split(',')})
 
+        self._schema_cache = tables_columns
+        self._schema_version = schema_version
         return tables_columns
 
+    def get_tables_columns(self) -> Dict:
+        # return a copy, the cached schema must not be altered by the caller
+        return {table_name: list(column_names) for table_name, column_names in self._get_schema().items()}
+
+    def get_tables_indexes(self) -> Dict:
+        tables_indexes = {}
+        cursorObj = self.con.cursor()
+        # the automatic indexes (UNIQUE/ PRIMARY KEY constraints) have no sql and are skipped
+        cursorObj.execute('SELECT tbl_name, name from sqlite_master where type = "index" and sql is not null')
+        for table_name, index_name in cursorObj.fetchall():
+            tables_indexes.setdefault(table_name, []).append(index_name)
+
+        return tables_indexes
+
+    @staticmethod
+    def get_indexes_definition(columns_definition: List[SqLiteColumnDef],
+                               indexes_definition: Optional[List[SqLiteIndexDef]] = None,
+                               index_timestamp: bool = True) -> List[SqLiteIndexDef]:
+        # all the indexes expected for a table: TIMESTAMP (by default), the indexed columns and the composite ones
+        all_indexes_definition = [SqLiteIndexDef(columns=['TIMESTAMP'])] if index_timestamp else []
+        all_indexes_definition += [SqLiteIndexDef(columns=[_.column_name]) for _ in columns_definition if getattr(_, 'index', False)]
+        all_indexes_definition += (indexes_definition or [])
+
+        return all_indexes_definition
+
+    @instrumented
+    def create_index(self,
+                     table_name: AnyStr,
+                     index_def: SqLiteIndexDef):
+
+        cursorObj = self.con.cursor()
+        cursorObj.execute(f"CREATE {'UNIQUE ' if index_def.unique else ''}INDEX IF NOT EXISTS "
+                          f"{index_def.get_index_name(table_name)} ON {table_name} ({','.join(index_def.columns)})")
+        self._invalidate_schema_cache()
+
+    @instrumented
+    def drop_index(self,
+                   index_name: AnyStr):
+
+        cursorObj = self.con.cursor()
+        cursorObj.execute(f"DROP INDEX IF EXISTS {index_name}")
+        self._invalidate_schema_cache()
+
+    @instrumented
     def create_table(self,
                      table_name: AnyStr,
-                     columns_definition: List[SqLiteColumnDef]):
+                     columns_definition: List[SqLiteColumnDef],
+                     indexes_definition: Optional[List[SqLiteIndexDef]] = None,
+                     index_timestamp: bool = True):
+        all_indexes_definition = self.get_indexes_definition(columns_definition=columns_definition,
+                                                             indexes_definition=indexes_definition,
+                                                             index_timestamp=index_timestamp)
+
         columns_definition = [SqLiteColumnDef(column_name = 'ID',
                                               column_type = 'INTEGER PRIMARY KEY AUTOINCREMENT'),
                               SqLiteColumnDef(column_name='TIMESTAMP',
@@ -60,168 +529,707 @@ class SqLiteDbWrapper():
 
         cursorObj = self.con.cursor()
         cursorObj.execute(sql_statement)
+        self._invalidate_schema_cache()
+
+        # without an index on TIMESTAMP, clear_old_records and every time window query do a full table scan
+        for index_def in all_indexes_definition:
+            self.create_index(table_name=table_name,
+                              index_def=index_def)
 
+    @instrumented
     def drop_table(self,
                    table_name: AnyStr):
+        self._invalidate_results(table_name)
 
         cursorObj = self.con.cursor()
+        # a rollup table is fed by a trigger on its source table, every later append on the source would fail without it
+        cursorObj.execute(f"DROP TRIGGER IF EXISTS trg_{table_name}")
         cursorObj.execute(f"DROP TABLE {table_name}")
+        self._invalidate_schema_cache()
+
+    @instrumented
+    def create_rollup(self,
+                      table_name: AnyStr,
+                      rollup_def: SqLiteRollupDef):
+        self._invalidate_results(table_name)
+
+        # a rollup is a regular table (queryable through return_records), one row per bucket, with TIMESTAMP = the bucket start
+        # it is kept up to date incrementally by an AFTER INSERT trigger on the raw table, so every write path
+        # (append_in_table, append_many_in_table, the service, other processes, etc.) updates it in the same transaction;
+        # the raw deletes (clear_old_records) are not propagated, so the rollups survive the retention of the raw data
+        rollup_table_name = rollup_def.get_rollup_table_name(table_name)
+        rollup_columns = rollup_def.get_rollup_columns()
+        bucket_sql = f'CAST(NEW.TIMESTAMP AS INTEGER) / {rollup_def.bucket_s} * {rollup_def.bucket_s}'
+
+        with self._transaction():
+            rollup_created = rollup_table_name not in self._get_schema()
+            if rollup_created:
+                self.create_table(table_name=rollup_table_name,
+                                  columns_definition=[SqLiteColumnDef(column_name=_,
+                                                                      column_type='INTEGER' if _.endswith('_count') else 'REAL')
+                                                      for _ in rollup_columns],
+                                  indexes_definition=[SqLiteIndexDef(columns=['TIMESTAMP'],
+                                                                     unique=True)],
+                                  index_timestamp=False)
 
+            insert_values = []
+            update_statements = []
+            for column_name in rollup_def.columns:
+                running_sum = f'COALESCE({column_name}_sum + excluded.{column_name}_sum, {column_name}_sum, excluded.{column_name}_sum)'
+                running_count = f'{column_name}_count + excluded.{column_name}_count'
+                for rollup_column in [_ for _ in rollup_columns if _.startswith(f'{column_name}_')]:
+                    aggregate = rollup_column[len(column_name)+1:]
+                    insert_values.append(f'NEW.{column_name} IS NOT NULL' if aggregate == 'count' else f'NEW.{column_name}')
+                    if aggregate == 'count':
+                        update_statements.append(f'{rollup_column} = {running_count}')
+                    elif aggregate == 'sum':
+                        update_statements.append(f'{rollup_column} = {running_sum}')
+                    elif aggregate == 'avg':
+                        update_statements.append(f'{rollup_column} = {running_sum} * 1.0 / NULLIF({running_count}, 0)')
+                    else:
+                        # the scalar MIN/ MAX of sqlite return NULL if any argument is NULL
+                        update_statements.append(f'{rollup_column} = {aggregate.upper()}(COALESCE({rollup_column}, excluded.{rollup_column}), '
+                                                 f'COALESCE(excluded.{rollup_column}, {rollup_column}))')
+
+            cursorObj = self.con.cursor()
+            cursorObj.execute(f"CREATE TRIGGER IF NOT EXISTS trg_{rollup_table_name} AFTER INSERT ON {table_name} FOR EACH ROW BEGIN "
+                              f"INSERT INTO {rollup_table_name}(TIMESTAMP,{','.join(rollup_columns)}) "
+                              f"VALUES({bucket_sql},{','.join(insert_values)}) "
+                              f"ON CONFLICT(TIMESTAMP) DO UPDATE SET {','.join(update_statements)}; END")
+
+            # back-fill a new rollup from the raw data already present
+            if rollup_created:
+                backfill_selects = []
+                for rollup_column in rollup_columns:
+                    column_name, aggregate = rollup_column.rsplit('_', 1)
+                    backfill_selects.append(f'{aggregate.upper()}({column_name})')
+                cursorObj.execute(f"INSERT INTO {rollup_table_name}(TIMESTAMP,{','.join(rollup_columns)}) "
+                                  f"SELECT {bucket_sql.replace('NEW.', '')} AS BUCKET,{','.join(backfill_selects)} "
+                                  f"FROM {table_name} GROUP BY BUCKET")
+
+    @instrumented
+    def drop_rollup(self,
+                    table_name: AnyStr,
+                    rollup_def: SqLiteRollupDef):
+        self._invalidate_results(table_name)
+
+        rollup_table_name = rollup_def.get_rollup_table_name(table_name)
+        cursorObj = self.con.cursor()
+        cursorObj.execute(f"DROP TRIGGER IF EXISTS trg_{rollup_table_name}")
+        cursorObj.execute(f"DROP TABLE IF EXISTS {rollup_table_name}")
+        self._invalidate_schema_cache()
+
+    @instrumented
     def delete_record(self,
                     table_name: AnyStr,
                     record_ID: int):
+        self._invalidate_results(table_name)
 
         cursorObj = self.con.cursor()
-        set_statement = f"DELETE FROM {table_name} WHERE ID = (?)"
+        set_statement = self._cached_sql(('delete_record', table_name),
+                                         lambda: f"DELETE FROM {table_name} WHERE ID = (?)")
         cursorObj.execute(set_statement, [record_ID, ])
 
+    @instrumented
+    def delete_records(self,
+                       table_name: AnyStr,
+                       record_IDs: List[int],
+                       max_IDs_per_statement: int = 500) -> int:
+        self._invalidate_results(table_name)
+
+        # one DELETE ... WHERE ID IN (...) per max_IDs_per_statement IDs (sqlite limits the number of parameters)
+        records_deleted = 0
+        with self._transaction():
+            cursorObj = self.con.cursor()
+            for i in range(0, len(record_IDs), max_IDs_per_statement):
+                IDs_chunk = list(record_IDs[i:i+max_IDs_per_statement])
+                cursorObj.execute(self._cached_sql(('delete_records', table_name, len(IDs_chunk)),
+                                                   lambda: f"DELETE FROM {table_name} WHERE ID IN ({','.join(['?']*len(IDs_chunk))})"),
+                                  IDs_chunk)
+                records_deleted += cursorObj.rowcount
+
+        return records_deleted
+
+    @instrumented
     def add_column(self,
                    table_name: AnyStr,
                    column_def: SqLiteColumnDef):
+        self._invalidate_results(table_name)
 
         cursorObj = self.con.cursor()
         cursorObj.execute(f"ALTER TABLE {table_name} ADD {column_def.column_name} {column_def.column_type}")
+        self._invalidate_schema_cache()
 
+        if getattr(column_def, 'index', False):
+            self.create_index(table_name=table_name,
+                              index_def=SqLiteIndexDef(columns=[column_def.column_name]))
+
+    def _check_not_rolled_up(self,
+                             table_name: AnyStr,
+                             column_names: List[AnyStr]):
+        # the rollup columns are named after the source column (<column>_sum, etc.), a rename would leave them stale
+        for rollup_table_name, trigger_sql in self.con.execute("SELECT SUBSTR(name, 5), sql FROM sqlite_master "
+                                                               "WHERE type = 'trigger' AND tbl_name = ? AND name LIKE 'trg\\_%' ESCAPE '\\'",
+                                                               [table_name]).fetchall():
+            rolled_up_columns = set(_sql_identifiers(trigger_sql)).intersection(_.lower() for _ in column_names)
+            if rolled_up_columns:
+                raise ValueError(f"The column(s) {sorted(rolled_up_columns)} of {table_name} feed the rollup {rollup_table_name}; "
+                                 f"drop_rollup, rename, then create_rollup with the new column name")
+
+    @instrumented
     def rename_column(self,
                       table_name: AnyStr,
                       old_column_name: AnyStr,
-                      new_column_name: AnyStr):
+                      new_column_name: AnyStr,
+                      mode: Literal['auto', 'native', 'rebuild'] = 'auto',
+                      chunk_size: int = 10000,
+                      progress_callback: Optional[Callable[[int, int], None]] = None):
+        self._invalidate_results(table_name)
 
-        cursorObj = self.con.cursor()
-
-        # 1. Get the current schema of the table
-        cursorObj.execute(f"PRAGMA table_info('{table_name}')")
-        columns_info = cursorObj.fetchall()
-
-        if not any(col[1] == old_column_name for col in columns_info):
+        if old_column_name not in self._get_schema().get(table_name, []):
             print(f"Error: Column '{old_column_name}' not found in table '{table_name}'.")
             return
+        self._check_not_rolled_up(table_name=table_name,
+                                  column_names=[old_column_name])
 
-        column_definitions = []
-        for col_info in columns_info:
-            cid, name, data_type, notnull, default_value, primary_key = col_info
-            if name == old_column_name:
-                column_definitions.append(
-                    f"{new_column_name} "
-                    f"{data_type}"
-                    f"{' NOT NULL' if notnull else ''}"
-                    f"{' PRIMARY KEY' if primary_key else ''}"
-                    f"{f' DEFAULT {default_value}' if default_value is not None else ''}")
-            else:
-                column_definitions.append(
-                    f"{name} "
-                    f"{data_type}"
-                    f"{' NOT NULL' if notnull else ''}"
-                    f"{' PRIMARY KEY' if primary_key else ''}"
-                    f"{f' DEFAULT {default_value}' if default_value is not None else ''}")
+        # sqlite >= 3.25 renames the column in place (a schema only change, no data is copied)
+        # and rewrites the indexes and the triggers referencing it
+        if mode == 'native' or (mode == 'auto' and sqlite_version_info >= (3, 25, 0)):
+            cursorObj = self.con.cursor()
+            cursorObj.execute(f"ALTER TABLE {table_name} RENAME COLUMN {old_column_name} TO {new_column_name}")
+            self._invalidate_schema_cache()
+            return
+
+        self.rebuild_table(table_name=table_name,
+                           renamed_columns={old_column_name: new_column_name},
+                           chunk_size=chunk_size,
+                           progress_callback=progress_callback)
 
+    @instrumented
+    def rebuild_table(self,
+                      table_name: AnyStr,
+                      renamed_columns: Optional[Dict[AnyStr, AnyStr]] = None,
+                      column_types: Optional[Dict[AnyStr, AnyStr]] = None,
+                      chunk_size: int = 10000,
+                      progress_callback: Optional[Callable[[int, int], None]] = None):
+        self._invalidate_results(table_name)
+
+        # online rebuild, for the schema changes sqlite can not do in place (column types, renames on old sqlite, etc.):
+        # the rows are copied in chunks of chunk_size, each chunk in its own short transaction, so the other writers
+        # can go on in between; while copying, temporary triggers mirror their inserts/ updates/ deletes to the copy.
+        # The AUTOINCREMENT, the sequence, the indexes and the triggers of the table are kept.
+        # column_types: column name (before renaming) -> new type
+        # progress_callback(rows_copied, rows_total) is called after every chunk
+        renamed_columns = renamed_columns or {}
+        column_types = column_types or {}
         new_table_name = f"_temp_{table_name}"
+        self._check_not_rolled_up(table_name=table_name,
+                                  column_names=list(renamed_columns.keys()))
 
-        # 2. Create a new temporary table with the new column name
-        create_table_sql = f"CREATE TABLE {new_table_name} ({', '.join(column_definitions)})"
-        cursorObj.execute(create_table_sql)
+        cursorObj = self.con.cursor()
+        table_sql = cursorObj.execute("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = ?",
+                                      [table_name]).fetchone()[0]
+        dependent_sqls = [_[0] for _ in cursorObj.execute("SELECT sql FROM sqlite_master WHERE type IN ('index', 'trigger') "
+                                                          "AND tbl_name = ? AND sql IS NOT NULL AND name NOT LIKE '\\_rebuild\\_%' ESCAPE '\\'",
+                                                          [table_name]).fetchall()]
+        columns_info = cursorObj.execute(f"PRAGMA table_info('{table_name}')").fetchall()
 
-        # 3. Construct the column list for the INSERT statement
         old_columns = [col[1] for col in columns_info]
-        new_columns = [new_column_name if col == old_column_name else col for col in old_columns]
-        columns_to_insert = ', '.join([str(col) for col in new_columns])
-        old_columns_to_select = ', '.join(old_columns)
+        new_columns = [renamed_columns.get(col, col) for col in old_columns]
+        # with an INTEGER PRIMARY KEY the rowid is that column, otherwise it is copied explicitly
+        primary_keys = [col for col in columns_info if col[5]]
+        has_rowid_alias = len(primary_keys) == 1 and primary_keys[0][2].upper() == 'INTEGER'
+        copied_old_columns = old_columns if has_rowid_alias else ['rowid'] + old_columns
+        copied_new_columns = new_columns if has_rowid_alias else ['rowid'] + new_columns
+
+        column_definitions = []
+        for cid, name, data_type, notnull, default_value, primary_key in columns_info:
+            column_definitions.append(
+                f"{renamed_columns.get(name, name)} "
+                f"{column_types.get(name, data_type)}"
+                f"{' NOT NULL' if notnull else ''}"
+                f"{' PRIMARY KEY' if primary_key and len(primary_keys) == 1 else ''}"
+                f"{' AUTOINCREMENT' if primary_key and has_rowid_alias and 'AUTOINCREMENT' in table_sql.upper() else ''}"
+                f"{f' DEFAULT {default_value}' if default_value is not None else ''}")
+        if len(primary_keys) > 1:
+            column_definitions.append(f"PRIMARY KEY ({', '.join(renamed_columns.get(_[1], _[1]) for _ in sorted(primary_keys, key=lambda _: _[5]))})")
 
-        # 4. Copy data from the old table to the new table
-        insert_data_sql = (f"INSERT INTO "
-                           f"{new_table_name} "
-                           f"({columns_to_insert}) SELECT {old_columns_to_select} FROM {table_name}")
-        cursorObj.execute(insert_data_sql)
+        # 1. the empty copy and the triggers mirroring the concurrent writes into it
+        with self._transaction():
+            # leftovers of an interrupted rebuild
+            cursorObj.execute(f"DROP TABLE IF EXISTS {new_table_name}")
+            for trigger_action in ('insert', 'update', 'delete'):
+                cursorObj.execute(f"DROP TRIGGER IF EXISTS _rebuild_{table_name}_{trigger_action}")
+            cursorObj.execute(f"CREATE TABLE {new_table_name} ({', '.join(column_definitions)})")
+            new_values = ', '.join(f'NEW.{_}' for _ in copied_old_columns)
+            cursorObj.execute(f"CREATE TRIGGER _rebuild_{table_name}_insert AFTER INSERT ON {table_name} FOR EACH ROW BEGIN "
+                              f"INSERT OR REPLACE INTO {new_table_name} ({', '.join(copied_new_columns)}) VALUES ({new_values}); END")
+            cursorObj.execute(f"CREATE TRIGGER _rebuild_{table_name}_update AFTER UPDATE ON {table_name} FOR EACH ROW BEGIN "
+                              f"DELETE FROM {new_table_name} WHERE rowid = OLD.rowid; "
+                              f"INSERT OR REPLACE INTO {new_table_name} ({', '.join(copied_new_columns)}) VALUES ({new_values}); END")
+            cursorObj.execute(f"CREATE TRIGGER _rebuild_{table_name}_delete AFTER DELETE ON {table_name} FOR EACH ROW BEGIN "
+                              f"DELETE FROM {new_table_name} WHERE rowid = OLD.rowid; END")
+            rows_total = cursorObj.execute(f"SELECT COUNT(*) FROM {table_name}").fetchone()[0]
 
-        # 5. Drop the old table
-        drop_table_sql = f"DROP TABLE {table_name}"
-        cursorObj.execute(drop_table_sql)
+        # 2. the chunked copy, in rowid order; INSERT OR REPLACE, the mirrored rows may already be there
+        last_rowid = -1
+        rows_copied = 0
+        while True:
+            with self._transaction():
+                chunk_last_rowid, chunk_rows = cursorObj.execute(f"SELECT MAX(rowid), COUNT(*) FROM (SELECT rowid FROM {table_name} "
+                                                                 f"WHERE rowid > ? ORDER BY rowid LIMIT ?)",
+                                                                 [last_rowid, chunk_size]).fetchone()
+                if not chunk_rows:
+                    break
+                cursorObj.execute(f"INSERT OR REPLACE INTO {new_table_name} ({', '.join(copied_new_columns)}) "
+                                  f"SELECT {', '.join(copied_old_columns)} FROM {table_name} WHERE rowid > ? AND rowid <= ?",
+                                  [last_rowid, chunk_last_rowid])
+            last_rowid = chunk_last_rowid
+            rows_copied += chunk_rows
+            if progress_callback:
+                progress_callback(rows_copied, max(rows_total, rows_copied))
 
-        # 6. Rename the new table to the original table name
-        rename_table_sql = f"ALTER TABLE {new_table_name} RENAME TO {table_name}"
-        cursorObj.execute(rename_table_sql)
+        # 3. the swap, in a single transaction: the sequence is carried over (no ID reuse),
+        # the indexes and the triggers are recreated on the new table
+        with self._transaction():
+            sequence = None
+            if 'AUTOINCREMENT' in table_sql.upper():
+                sequence = cursorObj.execute("SELECT seq FROM sqlite_sequence WHERE name = ?", [table_name]).fetchone()
+            for trigger_action in ('insert', 'update', 'delete'):
+                cursorObj.execute(f"DROP TRIGGER _rebuild_{table_name}_{trigger_action}")
+            cursorObj.execute(f"DROP TABLE {table_name}")
+            cursorObj.execute(f"ALTER TABLE {new_table_name} RENAME TO {table_name}")
+            if sequence:
+                cursorObj.execute("UPDATE sqlite_sequence SET seq = MAX(seq, ?) WHERE name = ?", [sequence[0], table_name])
+            for dependent_sql in dependent_sqls:
+                cursorObj.execute(_rename_sql_identifiers(dependent_sql, renamed_columns))
+        self._invalidate_schema_cache()
 
+    @instrumented
     def append_in_table(self,
                         table_name: AnyStr,
                         column_names: List,
                         column_values: List):
+        self._invalidate_results(table_name)
 
-        column_names = ['TIMESTAMP'] + column_names
         column_values = [int(datetime.now().timestamp())] + column_values
 
-        sql = f"INSERT INTO {table_name}({','.join(column_names)}) VALUES({','.join(['?']*len(column_values))})"
+        sql = self._cached_sql(('append_in_table', table_name, tuple(column_names)),
+                               lambda: f"INSERT INTO {table_name}(TIMESTAMP,{','.join(column_names)}) VALUES({','.join(['?']*len(column_values))})")
 
         cursorObj = self.con.cursor()
         cursorObj.execute(sql, column_values)
 
+    @instrumented
+    def append_many_in_table(self,
+                             table_name: AnyStr,
+                             column_names: List,
+                             rows: Iterable[List],
+                             timestamp_per_row: bool = False) -> int:
+        self._invalidate_results(table_name)
+
+        if 'TIMESTAMP' in column_names:
+            # the caller provides its own timestamps (back-filling, buffered writes, etc.)
+            all_values = rows
+        elif timestamp_per_row:
+            column_names = ['TIMESTAMP'] + column_names
+            all_values = ([int(datetime.now().timestamp())] + list(row) for row in rows)
+        else:
+            column_names = ['TIMESTAMP'] + column_names
+            timestamp = int(datetime.now().timestamp())
+            all_values = ([timestamp] + list(row) for row in rows)
+
+        sql = self._cached_sql(('append_many_in_table', table_name, tuple(column_names)),
+                               lambda: f"INSERT INTO {table_name}({','.join(column_names)}) VALUES({','.join(['?']*len(column_names))})")
+
+        # a single explicit transaction for the whole batch => a single fsync instead of one per row
+        with self._transaction():
+            cursorObj = self.con.cursor()
+            cursorObj.executemany(sql, all_values)
+
+        return cursorObj.rowcount
+
+    def _select_sql(self,
+                    table_name: AnyStr,
+                    select_values: List[AnyStr],
+                    where_statement: Optional[str],
+                    order: Optional[Literal['DESC', 'ASC']],
+                    order_by: AnyStr,
+                    limit: Optional[int]) -> str:
+
+        def build_sql():
+            sql_command = f'SELECT '
+            if select_values:
+                sql_command += ', '.join([str(val) for val in select_values])
+            else:
+                sql_command += '*'
+            sql_command += f' FROM {table_name}'
+            if where_statement:
+                sql_command += f' WHERE {where_statement}'
+            if order:
+                sql_command += f' ORDER BY {order_by} {order}'
+            if limit:
+                sql_command += f' LIMIT {limit}'
+            return sql_command
+
+        return self._cached_sql(('select', table_name, tuple(select_values or ()),
+                                 where_statement, order, order_by, limit),
+                                build_sql)
+
+    @instrumented
     def return_records(self,
                        table_name: AnyStr,
                        select_values: List[AnyStr] = [],
                        where_statement: Optional[str] = None,
                        order: Optional[Literal['DESC', 'ASC']] = None,
                        order_by: AnyStr = 'ID',
-                       limit: Optional[int] = None) -> List[List]:
+                       limit: Optional[int] = None,
+                       output_format: Literal['rows', 'columns'] = 'rows',
+                       chunk_size: int = 10000,
+                       where_filters: Optional[List[Tuple]] = None) -> Union[List[List], Dict]:
+
+        # where_filters: [(column, operator, value), ...], compiled to placeholders, see compile_where_filters
+        where_sql, where_parameters = compile_where_filters(where_filters=where_filters,
+                                                            where_statement=where_statement)
+        sql_command = self._select_sql(table_name=table_name,
+                                       select_values=select_values,
+                                       where_statement=where_sql,
+                                       order=order,
+                                       order_by=order_by,
+                                       limit=limit)
+
+        # no cache, or query parameters that can not be used as a cache key
+        cache_key = None
+        if self.result_cache is not None:
+            cache_key = self.result_cache.make_key(select_values, where_statement, where_filters, order, order_by, limit, output_format)
+        if cache_key is None:
+            return self._fetch_records(sql_command=sql_command,
+                                       parameters=where_parameters,
+                                       output_format=output_format,
+                                       chunk_size=chunk_size)
+
+        result = self.result_cache.get(table_name, cache_key)
+        if result is None:
+            # read before the query, so a write done meanwhile prevents caching a stale result
+            generation = self.result_cache.get_generation(table_name)
+            result = self._fetch_records(sql_command=sql_command,
+                                         parameters=where_parameters,
+                                         output_format=output_format,
+                                         chunk_size=chunk_size)
+            self.result_cache.put(table_name, cache_key, result, generation=generation)
+
+        return result
+
+    def _fetch_records(self,
+                       sql_command: str,
+                       parameters: List,
+                       output_format: Literal['rows', 'columns'],
+                       chunk_size: int) -> Union[List[List], Dict]:
+
+        cursorObj = self._get_read_con().cursor()
+        cursorObj.execute(sql_command, parameters)
+        if output_format == 'rows':
+            return cursorObj.fetchall()
+
+        # columnar output: column name -> array, filled chunk by chunk, no full list of rows is built
+        return chunks_to_arrays(column_names=[_[0] for _ in cursorObj.description],
+                                chunks=iter(lambda: cursorObj.fetchmany(chunk_size), []))
+
+    def iter_records(self,
+                     table_name: AnyStr,
+                     select_values: List[AnyStr] = [],
+                     where_statement: Optional[str] = None,
+                     order: Optional[Literal['DESC', 'ASC']] = None,
+                     order_by: AnyStr = 'ID',
+                     limit: Optional[int] = None,
+                     chunk_size: int = 1000,
+                     yield_chunks: bool = False,
+                     where_filters: Optional[List[Tuple]] = None) -> Iterator:
+
+        # same as return_records, but the rows are fetched in chunks of chunk_size
+        # and yielded one by one (or chunk by chunk), so the peak memory stays flat
+        # NOTE: the read snapshot is kept open until the iterator is exhausted or closed
+        where_sql, where_parameters = compile_where_filters(where_filters=where_filters,
+                                                            where_statement=where_statement)
+        sql_command = self._select_sql(table_name=table_name,
+                                       select_values=select_values,
+                                       where_statement=where_sql,
+                                       order=order,
+                                       order_by=order_by,
+                                       limit=limit)
+
+        cursorObj = self._get_read_con().cursor()
+        cursorObj.execute(sql_command, where_parameters)
+        try:
+            while True:
+                chunk = cursorObj.fetchmany(chunk_size)
+                if not chunk:
+                    break
+                if yield_chunks:
+                    yield chunk
+                else:
+                    yield from chunk
+        finally:
+            try:
+                cursorObj.close()
+            except ProgrammingError:
+                # the connection was already closed (e.g. SqLiteDbConnectionPool.close()), nothing left to release
+                pass
+
+    @instrumented
+    def return_records_page(self,
+                            table_name: AnyStr,
+                            select_values: List[AnyStr] = [],
+                            where_statement: Optional[str] = None,
+                            order: Literal['DESC', 'ASC'] = 'ASC',
+                            order_by: AnyStr = 'ID',
+                            page_size: int = 1000,
+                            page_cursor: Optional[str] = None,
+                            where_filters: Optional[List[Tuple]] = None) -> Tuple[List, Optional[str]]:
+
+        where_sql, where_parameters = compile_where_filters(where_filters=where_filters,
+                                                            where_statement=where_statement)
+
+        # keyset (seek) pagination: instead of skipping the previous pages, the next page continues
+        # right after the last (order_by, ID) seen, through the index => constant cost per page
+        # returns the page and the cursor of the next page (None when there are no more pages)
+        seek_operator = '>' if order == 'ASC' else '<'
+        extra_columns = ['ID'] if order_by == 'ID' else [order_by, 'ID']
+        last_order_value, last_ID = (json.loads(base64.urlsafe_b64decode(page_cursor.encode()))
+                                     if page_cursor else (None, None))
+        # SQLite sorts the NULLs first (ASC)/ last (DESC) and (NULL, ID) > (?, ?) never matches
+        # => a page ending on a NULL order_by value continues with a NULL aware seek
+        seek_from_null = bool(page_cursor) and order_by != 'ID' and last_order_value is None
+
+        def build_sql():
+            sql_command = f'SELECT '
+            if select_values:
+                sql_command += ', '.join([str(val) for val in select_values])
+            else:
+                sql_command += '*'
+            sql_command += f", {', '.join(extra_columns)} FROM {table_name}"
+
+            where_conditions = []
+            if where_sql:
+                where_conditions.append(f'({where_sql})')
+            if page_cursor:
+                if order_by == 'ID':
+                    where_conditions.append(f'ID {seek_operator} ?')
+                elif seek_from_null:
+                    where_conditions.append(f'(({order_by} IS NULL AND ID {seek_operator} ?)'
+                                            + (f' OR {order_by} IS NOT NULL)' if order == 'ASC' else ')'))
+                else:
+                    where_conditions.append(f'(({order_by}, ID) {seek_operator} (?, ?)'
+                                            + (f' OR {order_by} IS NULL)' if order == 'DESC' else ')'))
+            if where_conditions:
+                sql_command += f" WHERE {' AND '.join(where_conditions)}"
 
-        sql_command = f'SELECT '
-        if select_values:
-            sql_command += ', '.join([str(val) for val in select_values])
-        else:
-            sql_command += '*'
-        sql_command += f' FROM {table_name}'
-        if where_statement:
-            sql_command += f' WHERE {where_statement}'
-        if order:
             sql_command += f' ORDER BY {order_by} {order}'
-        if limit:
-            sql_command += f' LIMIT {limit}'
+            if order_by != 'ID':
+                sql_command += f', ID {order}'
+            sql_command += f' LIMIT {page_size}'
+            return sql_command
 
-        cursorObj = self.con.cursor()
-        return cursorObj.execute(sql_command).fetchall()
+        sql_command = self._cached_sql(('select_page', table_name, tuple(select_values or ()),
+                                        where_sql, order, order_by, page_size, bool(page_cursor), seek_from_null),
+                                       build_sql)
+
+        parameters = list(where_parameters)
+        if page_cursor:
+            parameters += [last_ID] if order_by == 'ID' or seek_from_null else [last_order_value, last_ID]
+
+        cursorObj = self._get_read_con().cursor()
+        rows = cursorObj.execute(sql_command, parameters).fetchall()
+
+        next_page_cursor = None
+        if len(rows) == page_size:
+            last_row = rows[-1]
+            next_page_cursor = base64.urlsafe_b64encode(json.dumps([last_row[-len(extra_columns)],
+                                                                   last_row[-1]]).encode()).decode()
+
+        # strip the extra columns used for seeking
+        return [row[:-len(extra_columns)] for row in rows], next_page_cursor
+
+    @instrumented
+    def return_aggregated(self,
+                          table_name: AnyStr,
+                          columns: List[AnyStr],
+                          bucket_s: int,
+                          agg: List[all_aggregates] = ['avg', 'min', 'max', 'last'],
+                          since: Optional[int] = None,
+                          until: Optional[int] = None,
+                          where_statement: Optional[str] = None,
+                          timestamp_column_name: AnyStr = 'TIMESTAMP') -> List[List]:
+
+        # time bucketed aggregation (downsampling) pushed down to SQL
+        # each returned row is (bucket start timestamp, column1 agg1, column1 agg2, ..., column2 agg1, ...)
+        # since (inclusive)/ until (exclusive) are unix timestamps, like the values of the TIMESTAMP column
+        # NOTE: first/ last are the values of the records with the min/ max ID of the bucket
+        sql_command, parameters = self._aggregated_sql(table_name=table_name,
+                                                       columns=columns,
+                                                       bucket_s=bucket_s,
+                                                       agg=agg,
+                                                       since=since,
+                                                       until=until,
+                                                       where_statement=where_statement,
+                                                       timestamp_column_name=timestamp_column_name)
+
+        cursorObj = self._get_read_con().cursor()
+        return cursorObj.execute(sql_command, parameters).fetchall()
+
+    @staticmethod
+    def _aggregated_sql(table_name: AnyStr,
+                        columns: List[AnyStr],
+                        bucket_s: int,
+                        agg: List[all_aggregates],
+                        since: Optional[int],
+                        until: Optional[int],
+                        where_statement: Optional[str],
+                        timestamp_column_name: AnyStr) -> Tuple[str, List]:
+        # the SQL of return_aggregated, table_name may also be a CTE (see SqLiteDbPartitionedWrapper)
+        bucket_s = int(bucket_s)
+        bucket_sql = f'CAST({timestamp_column_name} AS INTEGER) / {bucket_s} * {bucket_s}'
+
+        inner_selects = [f'{bucket_sql} AS BUCKET', 'MIN(ID) AS FIRST_ID', 'MAX(ID) AS LAST_ID']
+        outer_selects = ['b.BUCKET']
+        for column_name in columns:
+            for aggregate in agg:
+                if aggregate not in all_aggregates.__args__:
+                    raise ValueError(f'Unknown aggregate {aggregate}, available: {all_aggregates.__args__}')
+                if aggregate in ('first', 'last'):
+                    outer_selects.append(f'{aggregate}_record.{column_name}')
+                else:
+                    inner_selects.append(f'{aggregate.upper()}({column_name}) AS {column_name}_{aggregate}')
+                    outer_selects.append(f'b.{column_name}_{aggregate}')
+
+        where_conditions = []
+        parameters = []
+        if since is not None:
+            where_conditions.append(f'{timestamp_column_name} >= (?)')
+            parameters.append(since)
+        if until is not None:
+            where_conditions.append(f'{timestamp_column_name} < (?)')
+            parameters.append(until)
+        if where_statement:
+            where_conditions.append(f'({where_statement})')
+
+        sql_command = f"SELECT {', '.join(outer_selects)} FROM (SELECT {', '.join(inner_selects)} FROM {table_name}"
+        if where_conditions:
+            sql_command += f" WHERE {' AND '.join(where_conditions)}"
+        sql_command += ' GROUP BY BUCKET) b'
+        if 'first' in agg:
+            sql_command += f' LEFT JOIN {table_name} AS first_record ON first_record.ID = b.FIRST_ID'
+        if 'last' in agg:
+            sql_command += f' LEFT JOIN {table_name} AS last_record ON last_record.ID = b.LAST_ID'
+        sql_command += ' ORDER BY b.BUCKET'
 
+        return sql_command, parameters
+
+    @instrumented
     def clear_old_records(self,
                           table_name: AnyStr,
                           since_time_in_past_s: int,
-                          timestamp_column_name: AnyStr = 'TIMESTAMP'):
+                          timestamp_column_name: AnyStr = 'TIMESTAMP',
+                          batch_size: Optional[int] = None,
+                          sleep_between_batches_s: float = 0) -> int:
+        self._invalidate_results(table_name)
 
         minimum_timestamp = (datetime.now()-timedelta(seconds=since_time_in_past_s)).timestamp()
-
-        sql = f"DELETE FROM {table_name} WHERE {timestamp_column_name} < {minimum_timestamp}"
         cursorObj = self.con.cursor()
-        cursorObj.execute(sql)
 
+        if not batch_size:
+            sql = f"DELETE FROM {table_name} WHERE {timestamp_column_name} < (?)"
+            cursorObj.execute(sql, [minimum_timestamp])
+            return cursorObj.rowcount
+
+        # chunked retention: bounded batches of rowids, each batch in its own transaction
+        # => the write lock is released between the batches and the WAL file does not grow sharply
+        # NOTE: if the caller already has an open transaction, the batches are part of it and are not committed one by one
+        sql = (f"DELETE FROM {table_name} WHERE rowid IN "
+               f"(SELECT rowid FROM {table_name} WHERE {timestamp_column_name} < (?) LIMIT (?))")
+        records_deleted = 0
+        while True:
+            with self._transaction():
+                cursorObj.execute(sql, [minimum_timestamp, batch_size])
+            records_deleted += cursorObj.rowcount
+
+            if cursorObj.rowcount < batch_size:
+                break
+            if sleep_between_batches_s:
+                sleep(sleep_between_batches_s)
+
+        return records_deleted
+
+    def _update_record_sql(self,
+                           table_name: AnyStr,
+                           column_names: tuple) -> str:
+        # a single statement that only rewrites the given columns and only if at least one value differs,
+        # "IS NOT" is the NULL-safe "!=" of sqlite
+        return self._cached_sql(('update_record', table_name, column_names),
+                                lambda: f"UPDATE {table_name} SET {','.join([f'{key} = (?)' for key in column_names])} "
+                                        f"WHERE ID = (?) AND ({' OR '.join([f'{key} IS NOT (?)' for key in column_names])})")
+
+    @staticmethod
+    def _update_record_data(data: Dict,
+                            skip_new_empty_entries: bool) -> Dict:
+        # remove empty entries from the dict, the existing values are kept for them
+        if skip_new_empty_entries:
+            data = dict(filter(lambda _:_[1], data.items()))
+
+        # the ID is never overwritten
+        data.pop('ID', None)
+
+        return data
+
+    @instrumented
     def update_record(self,
                       table_name: AnyStr,
                       record_ID: int,
                       data: Dict,
-                      skip_new_empty_entries: bool = False):
+                      skip_new_empty_entries: bool = False) -> int:
+        self._invalidate_results(table_name)
+
+        data = self._update_record_data(data=dict(data),
+                                        skip_new_empty_entries=skip_new_empty_entries)
+        if not data:
+            return 0
+
+        set_statement_values = list(data.values())
+        sql = self._update_record_sql(table_name=table_name,
+                                      column_names=tuple(data.keys()))
 
-        # extract the existing data (column names and values) as a dic
         cursorObj = self.con.cursor()
-        column_names = cursorObj.execute(f"SELECT GROUP_CONCAT(NAME,',') FROM PRAGMA_TABLE_INFO('{table_name}')").fetchall()[0][0].split(',')
-        column_values = cursorObj.execute(f'SELECT * FROM {table_name} WHERE ID = (?)', [str(record_ID),]).fetchall()
-        existing_data = dict([[key, value] for key, value in zip(column_names, column_values[0])])
-
-        # only proceed if data is != existing_data
-        different = False
-        for key, value in data.items():
-            if data[key] != existing_data[key]:
-                different = True
-                break
-        if different:
+        cursorObj.execute(sql, set_statement_values + [record_ID] + set_statement_values)
+
+        # 1 if the record was updated, 0 if it is missing or if nothing changed
+        return cursorObj.rowcount
+
+    @instrumented
+    def update_records(self,
+                       table_name: AnyStr,
+                       records: Dict[int, Dict],
+                       skip_new_empty_entries: bool = False) -> int:
+        self._invalidate_results(table_name)
 
-            # update the dict with the new data passed as an argument
-            existing_data.update(data)
+        # group the records by their updated columns => one executemany per group, all in a single transaction
+        grouped_parameters = {}
+        for record_ID, data in records.items():
+            data = self._update_record_data(data=dict(data),
+                                            skip_new_empty_entries=skip_new_empty_entries)
+            if data:
+                set_statement_values = list(data.values())
+                grouped_parameters.setdefault(tuple(data.keys()), []).append(set_statement_values + [record_ID] + set_statement_values)
 
-            # remove empty entries from the dict
-            if skip_new_empty_entries:
-                existing_data = dict(filter(lambda _:_[1], existing_data.items()))
+        records_updated = 0
+        with self._transaction():
+            cursorObj = self.con.cursor()
+            for column_names, parameters in grouped_parameters.items():
+                cursorObj.executemany(self._update_record_sql(table_name=table_name,
+                                                              column_names=column_names),
+                                      parameters)
+                records_updated += cursorObj.rowcount
 
-            # finally update the row inside the db
-            set_statement_keys = ','.join([f"{key} = (?)" for key, value in existing_data.items()])
-            set_statement_values = list(existing_data.values())
-            # set_statement = ','.join([f"{key} = '{value}'" for key, value in existing_data.items()])
-            sql = f"UPDATE {table_name} SET {set_statement_keys} WHERE ID = (?)"
-            cursorObj.execute(sql, set_statement_values + [str(existing_data['ID'])])
+        return records_updated
 
 if __name__ == '__main__':
     print('There is no DB available by default for this test.'
@@ -264,6 +1272,19 @@ if __name__ == '__main__':
         expected = str([(1, timestamp, 10, 5)])
         assert result == expected, f'wrong value returned ! expected  {expected}, got {result}'
 
+        # TEST correct batch record update
+        result = DB.update_records(table_name='my_db_table_name',
+                                   records={1: {'my_column_name1': 10, 'my_column_name2': 6}})
+        expected = 1
+        assert result == expected, f'wrong value returned ! expected  {expected}, got {result}'
+        result = DB.update_records(table_name='my_db_table_name',
+                                   records={1: {'my_column_name1': 10, 'my_column_name2': 5}})
+        result = DB.update_record(table_name='my_db_table_name',
+                                  record_ID=1,
+                                  data={'my_column_name2': 5})
+        expected = 0
+        assert result == expected, f'wrong value returned ! expected  {expected}, got {result}'
+
         # TEST the column rename method
         DB.rename_column(table_name='my_db_table_name',
                          old_column_name='my_column_name1',
@@ -276,4 +1297,217 @@ if __name__ == '__main__':
         expected = str([(1, timestamp, 10, 5)])
         assert result == expected, f'wrong value returned ! expected  {expected}, got {result}'
 
+        # TEST the chunked rebuild keeps the data and the indexes
+        progress = []
+        DB.rename_column(table_name='my_db_table_name',
+                         old_column_name='my_column_name2',
+                         new_column_name='my_column_name22',
+                         mode='rebuild',
+                         progress_callback=lambda rows_copied, rows_total: progress.append((rows_copied, rows_total)))
+        DB.rename_column(table_name='my_db_table_name',
+                         old_column_name='my_column_name22',
+                         new_column_name='my_column_name2')
+        result = str(DB.return_records(table_name='my_db_table_name'))
+        expected = str([(1, timestamp, 10, 5)])
+        assert result == expected, f'wrong value returned ! expected  {expected}, got {result}'
+        assert progress == [(1, 1)], f'wrong progress reported ! got {progress}'
+        assert 'idx_my_db_table_name_TIMESTAMP' in DB.get_tables_indexes()['my_db_table_name'], 'an index was lost'
+
+        # TEST correct chunked data return
+        result = str(list(DB.iter_records(table_name='my_db_table_name',
+                                          select_values=['my_column_name11'],
+                                          chunk_size=2,
+                                          yield_chunks=True)))
+        expected = str([[(10,)]])
+        assert result == expected, f'wrong value returned ! expected  {expected}, got {result}'
+
+        # TEST correct paginated data return
+        result = DB.return_records_page(table_name='my_db_table_name',
+                                        select_values=['my_column_name11'],
+                                        page_size=1)
+        expected = [(10,)]
+        assert result[0] == expected, f'wrong value returned ! expected  {expected}, got {result}'
+        result = DB.return_records_page(table_name='my_db_table_name',
+                                        select_values=['my_column_name11'],
+                                        page_size=1,
+                                        page_cursor=result[1])
+        expected = ([], None)
+        assert result == expected, f'wrong value returned ! expected  {expected}, got {result}'
+
+        # TEST the pagination on a nullable column keeps the NULL rows, in both orders
+        DB.create_table(table_name='my_paging_table',
+                        columns_definition=[SqLiteColumnDef(column_name='b',
+                                                            column_type='REAL')])
+        DB.append_many_in_table(table_name='my_paging_table',
+                                column_names=['b'],
+                                rows=[[1.0], [None], [3.0], [5.0], [None]])
+        for order, expected in (('ASC', [2, 5, 1, 3, 4]), ('DESC', [4, 3, 1, 5, 2])):
+            result, page_cursor = [], None
+            while True:
+                page, page_cursor = DB.return_records_page(table_name='my_paging_table',
+                                                           select_values=['ID'],
+                                                           order=order,
+                                                           order_by='b',
+                                                           page_size=2,
+                                                           page_cursor=page_cursor)
+                result += [_[0] for _ in page]
+                if not page_cursor:
+                    break
+            assert result == expected, f'wrong value returned ! expected  {expected}, got {result}'
+
+        # TEST the columnar output keeps the types and the NULLs (masked with NumPy), across the chunks
+        result = DB.return_records(table_name='my_paging_table',
+                                   select_values=['ID', 'b'],
+                                   output_format='columns',
+                                   chunk_size=2)
+        result = {column_name: (values.tolist() if hasattr(values, 'tolist') else values) for column_name, values in result.items()}
+        expected = {'ID': [1, 2, 3, 4, 5], 'b': [1.0, None, 3.0, 5.0, None]}
+        assert result == expected, f'wrong value returned ! expected  {expected}, got {result}'
+        DB.drop_table(table_name='my_paging_table')
+
+        # TEST correct multi records delete
+        result = DB.delete_records(table_name='my_db_table_name',
+                                   record_IDs=[100, 101])
+        expected = 0
+        assert result == expected, f'wrong value returned ! expected  {expected}, got {result}'
+
+        # TEST correct bulk data append
+        timestamp = int(datetime.now().timestamp())
+        result = DB.append_many_in_table(table_name='my_db_table_name',
+                                         column_names=['my_column_name11', 'my_column_name2'],
+                                         rows=[[1, 2], [3, 4]])
+        expected = 2
+        assert result == expected, f'wrong value returned ! expected  {expected}, got {result}'
+
+        result = str(DB.return_records(table_name='my_db_table_name',
+                                       where_statement='ID > 1'))
+        expected = str([(2, timestamp, 1, 2), (3, timestamp, 3, 4)])
+        assert result == expected, f'wrong value returned ! expected  {expected}, got {result}'
+
+        # TEST the bulk append SQL is built once per table/ columns
+        assert ('append_many_in_table', 'my_db_table_name', ('TIMESTAMP', 'my_column_name11', 'my_column_name2')) in DB._sql_cache, 'the bulk append SQL was not cached'
+
+    # TEST the where filters are bound as parameters
+    with SqLiteDbWrapper() as DB:
+        result = DB.return_records(table_name='my_db_table_name',
+                                   select_values=['ID'],
+                                   where_filters=[('ID', 'IN', [2, 3, 100]), ('my_column_name2', '>=', 4)])
+        expected = [(3,)]
+        assert result == expected, f'wrong value returned ! expected  {expected}, got {result}'
+
+    # TEST the instrumentation records the operations, the rows and the SQL of the slow queries
+    instrumentation = QueryInstrumentation(slow_query_threshold_s=0)
+    with SqLiteDbWrapper(instrumentation=instrumentation) as DB:
+        DB.return_records(table_name='my_db_table_name')
+        DB.append_many_in_table(table_name='my_db_table_name',
+                                column_names=['my_column_name11', 'my_column_name2'],
+                                rows=[[5, 6]])
+
+    result = instrumentation.get_stats()
+    assert result['return_records']['my_db_table_name']['count'] == 1, f'wrong stats returned ! got {result}'
+    assert result['return_records']['my_db_table_name']['rows_total'] == 3, f'wrong stats returned ! got {result}'
+    assert result['append_many_in_table']['my_db_table_name']['rows_total'] == 1, f'wrong stats returned ! got {result}'
+    result = instrumentation.get_slow_queries()[0]['sql']
+    expected = 'SELECT * FROM my_db_table_name'
+    assert result == expected, f'wrong value returned ! expected  {expected}, got {result}'
+
+    # TEST the result cache hits on the same query and is invalidated by the writes on the table
+    with SqLiteDbWrapper(result_cache=SqLiteDbResultCache(ttl_s=60)) as DB:
+        DB.return_records(table_name='my_db_table_name')
+        result = len(DB.return_records(table_name='my_db_table_name'))
+        expected = 4
+        assert result == expected, f'wrong value returned ! expected  {expected}, got {result}'
+
+        DB.delete_record(table_name='my_db_table_name',
+                         record_ID=4)
+        result = len(DB.return_records(table_name='my_db_table_name'))
+        expected = 3
+        assert result == expected, f'wrong value returned ! expected  {expected}, got {result}'
+
+        result = DB.result_cache.get_stats()
+        assert result['hits'] == 1 and result['misses'] == 2, f'wrong stats returned ! got {result}'
+
+    # TEST the in-memory hot copy is refreshed after the own commits and after the commits of other connections
+    with SqLiteDbWrapper(read_mode='memory', hot_copy_check_interval_s=0) as DB:
+        result = len(DB.return_records(table_name='my_db_table_name'))
+        expected = 3
+        assert result == expected, f'wrong value returned ! expected  {expected}, got {result}'
+
+        DB.delete_record(table_name='my_db_table_name',
+                         record_ID=3)
+        result = len(DB.return_records(table_name='my_db_table_name'))
+        expected = 2
+        assert result == expected, f'wrong value returned ! expected  {expected}, got {result}'
+
+        DB.con.commit()
+        with SqLiteDbWrapper() as other_DB:
+            other_DB.delete_record(table_name='my_db_table_name',
+                                   record_ID=2)
+        result = len(DB.return_records(table_name='my_db_table_name'))
+        expected = 1
+        assert result == expected, f'wrong value returned ! expected  {expected}, got {result}'
+
+        # no change => no reload
+        DB.return_records(table_name='my_db_table_name')
+        result = DB.hot_copy_refreshes
+        expected = 2
+        assert result == expected, f'wrong value returned ! expected  {expected}, got {result}'
+
+    # a dedicated db, independent of the tests above
+    import os
+    import shutil
+    shutil.rmtree('sqlite_rollups_test', ignore_errors=True)
+    os.makedirs('sqlite_rollups_test')
+    with SqLiteDbWrapper(database_path='sqlite_rollups_test/database.db') as DB:
+        # TEST the rollups are maintained by the trigger, and the appends still work after the rollup table is dropped
+        DB.create_table(table_name='my_rollup_source',
+                        columns_definition=[SqLiteColumnDef(column_name='v',
+                                                            column_type='REAL')])
+        DB.create_rollup(table_name='my_rollup_source',
+                         rollup_def=SqLiteRollupDef(bucket_s=60,
+                                                    columns=['v']))
+        DB.append_many_in_table(table_name='my_rollup_source',
+                                column_names=['TIMESTAMP', 'v'],
+                                rows=[[0, 1.0], [30, 3.0]])
+        result = DB.return_records(table_name='my_rollup_source_rollup_1m',
+                                   select_values=['TIMESTAMP', 'v_count', 'v_sum'])
+        expected = [(0, 2, 4.0)]
+        assert result == expected, f'wrong value returned ! expected  {expected}, got {result}'
+
+        # TEST a column feeding a rollup can not be renamed
+        error = None
+        try:
+            DB.rename_column(table_name='my_rollup_source',
+                             old_column_name='v',
+                             new_column_name='w')
+        except ValueError as e:
+            error = e
+        assert error is not None, 'a rolled-up column was renamed'
+
+        DB.drop_table(table_name='my_rollup_source_rollup_1m')
+        DB.append_in_table(table_name='my_rollup_source',
+                           column_names=['v'],
+                           column_values=[5.0])
+        result = len(DB.return_records(table_name='my_rollup_source'))
+        expected = 3
+        assert result == expected, f'wrong value returned ! expected  {expected}, got {result}'
+        DB.drop_table(table_name='my_rollup_source')
+
+        # TEST the rebuild renames the column in the indexes, not in their string literals
+        DB.create_table(table_name='my_rename_table',
+                        columns_definition=[SqLiteColumnDef(column_name='v',
+                                                            column_type='INTEGER'),
+                                            SqLiteColumnDef(column_name='label',
+                                                            column_type='TEXT')])
+        DB.con.execute("CREATE INDEX idx_my_rename_table_v ON my_rename_table (v) WHERE label != 'v'")
+        DB.rename_column(table_name='my_rename_table',
+                         old_column_name='v',
+                         new_column_name='w',
+                         mode='rebuild')
+        result = DB.con.execute("SELECT sql FROM sqlite_master WHERE name = 'idx_my_rename_table_v'").fetchone()[0]
+        expected = "CREATE INDEX idx_my_rename_table_v ON my_rename_table (w) WHERE label != 'v'"
+        assert result == expected, f'wrong value returned ! expected  {expected}, got {result}'
+        DB.drop_table(table_name='my_rename_table')
+    shutil.rmtree('sqlite_rollups_test', ignore_errors=True)
+
     print('All tests are PASSED !')
\ No newline at end of file
@@ -0,0 +1,191 @@
+from typing import (Dict,
+                    Iterable,
+                    Iterator,
+                    Literal,
+                    Optional,
+                    Tuple)
+import gzip
+import json
+import struct
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+try:
+    # urllib3 >= 2 decodes zstd itself, if zstandard is installed
+    from urllib3.response import HAS_ZSTD as URLLIB3_DECODES_ZSTD
+except ImportError:
+    URLLIB3_DECODES_ZSTD = False
+
+# the wire formats/ compressions of the service responses, negotiated with the Accept/ Accept-Encoding headers
+all_wire_formats = Literal['json', 'msgpack']
+all_wire_compressions = Literal['zstd', 'gzip']
+WIRE_FORMAT_CONTENT_TYPES = {'json': 'application/json',
+                             'msgpack': 'application/msgpack'}
+# the streamed responses: one JSON document per line or msgpack documents prefixed by their 4 bytes big-endian length
+STREAM_CONTENT_TYPES = {'json': 'application/x-ndjson',
+                        'msgpack': 'application/x-msgpack-frames'}
+_FRAME_LENGTH = struct.Struct('>I')
+
+def get_available_wire_formats() -> list:
+    return ['json'] + (['msgpack'] if msgpack is not None else [])
+
+def get_available_wire_compressions() -> list:
+    return (['zstd'] if zstandard is not None else []) + ['gzip']
+
+def _accepted_tokens(header: Optional[str]) -> set:
+    # the tokens of an Accept/ Accept-Encoding header, except the ones refused with q=0
+    tokens = set()
+    for part in (header or '').split(','):
+        token, _, parameters = part.strip().partition(';')
+        if token and parameters.replace(' ', '') not in ('q=0', 'q=0.0', 'q=0.00', 'q=0.000'):
+            tokens.add(token.strip().lower())
+    return tokens
+
+def negotiate_wire_format(accept: Optional[str],
+                          wire_formats: Iterable[all_wire_formats] = ('json', 'msgpack')) -> all_wire_formats:
+    # msgpack only if explicitly accepted, JSON otherwise
+    if 'msgpack' in wire_formats and msgpack is not None and WIRE_FORMAT_CONTENT_TYPES['msgpack'] in _accepted_tokens(accept):
+        return 'msgpack'
+    return 'json'
+
+def encode_response(data,
+                    accept: Optional[str] = None,
+                    accept_encoding: Optional[str] = None,
+                    wire_formats: Iterable[all_wire_formats] = ('json', 'msgpack'),
+                    wire_compressions: Iterable[all_wire_compressions] = ('zstd', 'gzip'),
+                    compress_min_bytes: Optional[int] = 1024) -> Tuple[bytes, Dict]:
+    """
+    Serializes the response data in the format and compression requested by the Accept/ Accept-Encoding headers.
+
+    msgpack is used only if explicitly accepted ('application/msgpack'), JSON otherwise; the body is compressed
+    with the first of wire_compressions accepted by the client, if it is larger than compress_min_bytes.
+    Returns the body and the Content-Type/ Content-Encoding headers.
+    """
+
+    wire_format = negotiate_wire_format(accept=accept,
+                                        wire_formats=wire_formats)
+    if wire_format == 'msgpack':
+        body = msgpack.packb(data, use_bin_type=True)
+    else:
+        body = json.dumps(data, separators=(',', ':')).encode()
+    headers = {'Content-Type': WIRE_FORMAT_CONTENT_TYPES[wire_format]}
+
+    if compress_min_bytes is None or len(body) < compress_min_bytes:
+        return body, headers
+
+    accepted_compressions = _accepted_tokens(accept_encoding)
+    for compression in wire_compressions:
+        if compression not in accepted_compressions:
+            continue
+        if compression == 'zstd' and zstandard is not None:
+            body = zstandard.ZstdCompressor(level=3).compress(body)
+        elif compression == 'gzip':
+            # level 6 is ~3x faster than 9 for a slightly larger output
+            body = gzip.compress(body, compresslevel=6)
+        else:
+            continue
+        headers['Content-Encoding'] = compression
+        headers['Vary'] = 'Accept, Accept-Encoding'
+        break
+
+    return body, headers
+
+def get_undecoded_content_encoding(content_encoding: Optional[str]) -> Optional[str]:
+    # the Content-Encoding of a requests response still applied to response.content:
+    # gzip is always decoded by requests/ urllib3, zstd only by urllib3 >= 2 with zstandard installed
+    if content_encoding == 'gzip' or (content_encoding == 'zstd' and URLLIB3_DECODES_ZSTD):
+        return None
+    return content_encoding
+
+def decode_response(body: bytes,
+                    content_type: Optional[str],
+                    content_encoding: Optional[str] = None):
+    # content_encoding: the compression still applied to body (see get_undecoded_content_encoding), never guessed from the body
+    if content_encoding == 'zstd':
+        if zstandard is None:
+            raise ImportError('zstandard is required to decode a zstd compressed response')
+        body = zstandard.ZstdDecompressor().decompress(body)
+    elif content_encoding == 'gzip':
+        body = gzip.decompress(body)
+
+    if content_type and content_type.startswith(WIRE_FORMAT_CONTENT_TYPES['msgpack']):
+        return msgpack.unpackb(body, raw=False)
+    return json.loads(body)
+
+def encode_stream_frame(data,
+                        wire_format: all_wire_formats) -> bytes:
+    if wire_format == 'msgpack':
+        frame = msgpack.packb(data, use_bin_type=True)
+        return _FRAME_LENGTH.pack(len(frame)) + frame
+    return json.dumps(data, separators=(',', ':')).encode() + b'\n'
+
+def iter_stream_frames(stream,
+                       content_type: Optional[str]) -> Iterator:
+    # decodes the frames of a streamed response incrementally; stream is a binary file-like object
+    if content_type and content_type.startswith(STREAM_CONTENT_TYPES['msgpack']):
+        unpacker = msgpack.Unpacker(raw=False)
+        while True:
+            header = stream.read(_FRAME_LENGTH.size)
+            if len(header) < _FRAME_LENGTH.size:
+                return
+            frame_length, = _FRAME_LENGTH.unpack(header)
+            frame = stream.read(frame_length)
+            if len(frame) < frame_length:
+                return
+            unpacker.feed(frame)
+            yield from unpacker
+
+    for line in stream:
+        if line.strip():
+            yield json.loads(line)
+
+if __name__ == '__main__':
+    records = [[i, 1700000000 + i, i * 1.5, f'text {i}'] for i in range(1000)]
+
+    # TEST JSON stays the default
+    body, headers = encode_response(records)
+    result = (headers, decode_response(body, headers['Content-Type']))
+    expected = ({'Content-Type': 'application/json'}, records)
+    assert result == expected, f'wrong value returned ! expected  {expected}, got {result}'
+
+    # TEST msgpack + zstd/ gzip round trips
+    for accept_encoding in get_available_wire_compressions():
+        body, headers = encode_response(records,
+                                        accept='application/msgpack, application/json;q=0.5',
+                                        accept_encoding=accept_encoding)
+        result = decode_response(body, headers['Content-Type'], headers['Content-Encoding'])
+        assert result == records, f'wrong value returned ! expected  {records[:2]}..., got {result[:2]}...'
+        assert headers['Content-Encoding'] == accept_encoding, f'wrong headers returned ! got {headers}'
+
+    # TEST the body is decompressed only as told by the Content-Encoding, gzip being always decoded by requests
+    result = get_undecoded_content_encoding('gzip'), get_undecoded_content_encoding(None)
+    expected = (None, None)
+    assert result == expected, f'wrong value returned ! expected  {expected}, got {result}'
+    if zstandard is not None:
+        body, headers = encode_response(records, accept_encoding='zstd')
+        decode_failed = False
+        try:
+            decode_response(body, headers['Content-Type'])
+        except ValueError:
+            decode_failed = True
+        assert decode_failed, 'an undeclared compression was decoded'
+
+    # TEST the refused encodings are not used
+    result = encode_response(records, accept_encoding='gzip;q=0')[1]
+    expected = {'Content-Type': 'application/json'}
+    assert result == expected, f'wrong value returned ! expected  {expected}, got {result}'
+
+    # TEST the stream frames round trips
+    import io
+    for wire_format in get_available_wire_formats():
+        frames = [{'records': records[:10]}, {'records': records[10:20]}, {'status': 'ok', 'rows': 20}]
+        stream = io.BytesIO(b''.join(encode_stream_frame(_, wire_format) for _ in frames))
+        result = list(iter_stream_frames(stream, STREAM_CONTENT_TYPES[wire_format]))
+        assert result == frames, f'wrong value returned ! expected  {frames}, got {result}'
+
+    print('All tests are PASSED !')
@@ -3,18 +3,32 @@ from ag95 import (Singleton_without_cache,
                   SqLiteDbbackup,
                   SqLiteDbMigration,
                   SqLiteColumnDef,
+                  SqLiteIndexDef,
+                  SqLiteRollupDef,
                   stdin_watcher)
 from flask import (Flask,
+                   Response,
                    jsonify,
                    request)
 from waitress import serve
+from ag95.SqliteDatabase.SqLiteDbWrapper import all_sqlite_profiles
+from ag95.General.query_instrumentation import QueryInstrumentation
+from ag95.SqliteDatabase.SqLiteDbResultCache import SqLiteDbResultCache
+from ag95.SqliteDatabaseService.SqLiteDbWireFormat import (all_wire_formats,
+                                                           all_wire_compressions,
+                                                           STREAM_CONTENT_TYPES,
+                                                           negotiate_wire_format,
+                                                           encode_response,
+                                                           encode_stream_frame)
 from datetime import datetime
 from typing import (List,
                     AnyStr,
+                    Iterator,
                     Optional,
                     Literal,
                     Dict)
 import threading
+import itertools
 import queue
 import os
 import requests
@@ -46,43 +60,172 @@ def shutdown_watcher_start(mode: all_shutdown_watcher_modes = 'ag95_stdin_watche
     else:
         return
 
+# /batch operation name -> (SqLiteDbWrapper method, is a write)
+# the parameters of each operation are the same as the ones of its own endpoint
+BATCH_OPERATIONS = {'insert_record': ('append_in_table', True),
+                    'insert_records': ('append_many_in_table', True),
+                    'update_record': ('update_record', True),
+                    'update_records': ('update_records', True),
+                    'delete_record': ('delete_record', True),
+                    'delete_records': ('delete_records', True),
+                    'clear_old_records': ('clear_old_records', True),
+                    'get_records': ('return_records', False),
+                    'get_aggregated': ('return_aggregated', False)}
+
+class BatchOperationError(Exception):
+    def __init__(self, operation_index: int, operation_name: str, error: Exception):
+        super().__init__(f'batch operation {operation_index} ({operation_name}) failed: {error}')
+        self.operation_index = operation_index
+
+# the priority classes of the tasks, most urgent first
+all_task_priorities = Literal['interactive', 'bulk', 'maintenance']
+TASK_PRIORITIES = {'interactive': 0, 'bulk': 1, 'maintenance': 2}
+# queued after all the tasks, so the queued tasks are still executed on shutdown
+_STOP_RANK = len(TASK_PRIORITIES)
+
+class DbTaskExpiredError(Exception):
+    pass
+
+class DbStreamLimitError(Exception):
+    pass
+
 class DbTask:
-    def __init__(self, fn, args, kwargs):
+    def __init__(self, fn, args, kwargs,
+                 priority: all_task_priorities = 'interactive',
+                 deadline_s: Optional[float] = None):
+        if priority not in TASK_PRIORITIES:
+            raise ValueError(f'Unknown task priority {priority}, available: {list(TASK_PRIORITIES.keys())}')
         self.fn = fn
         self.args = args
         self.kwargs = kwargs
+        self.priority = priority
         self.result = None
         self.error = None
         self.done = threading.Event()
+        # used to report the time spent in the queue, waiting for a free connection
+        self.queued_at = time.perf_counter()
+        # a task still queued at its deadline is rejected, never executed
+        self.deadline = self.queued_at + deadline_s if deadline_s is not None else None
+        self._state = 'queued'
+        self._state_lock = threading.Lock()
+
+    def start(self) -> bool:
+        # called by the worker thread; False if the task expired and must be skipped
+        with self._state_lock:
+            if self._state == 'queued' and (self.deadline is None or time.perf_counter() <= self.deadline):
+                self._state = 'running'
+                return True
+            self._state = 'expired'
+            self.error = DbTaskExpiredError(f'the {self.priority} task expired after {time.perf_counter() - self.queued_at:.3f}s in the queue')
+            return False
+
+    def expire(self) -> bool:
+        # called by the caller at the deadline; False if the task is already running
+        with self._state_lock:
+            if self._state == 'queued':
+                self._state = 'expired'
+                return True
+            return False
+
+class _LaneStats:
+    # queue wait statistics of one lane, shared by its threads
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.tasks = 0
+        self.errors = 0
+        self.expired = 0
+        self.wait_s_total = 0.0
+        self.wait_s_max = 0.0
+        self.batches = 0
+        self.batch_size_max = 0
+
+    def record(self, wait_s: float):
+        with self.lock:
+            self.tasks += 1
+            self.wait_s_total += wait_s
+            self.wait_s_max = max(self.wait_s_max, wait_s)
+
+    def record_error(self):
+        with self.lock:
+            self.errors += 1
+
+    def record_expired(self):
+        with self.lock:
+            self.expired += 1
+
+    def record_batch(self, batch_size: int):
+        with self.lock:
+            self.batches += 1
+            self.batch_size_max = max(self.batch_size_max, batch_size)
 
 class SqliteDbWorker:
+    """
+    Runs the database tasks on 4 lanes, each with a priority queue (interactive before bulk, FIFO within a class):
+    - the write lane: a single thread owning the only writing connection, so the writers never compete for
+      the sqlite write lock; the queued writes are run back to back in a single transaction (one savepoint
+      per write, so a failing write does not roll back the others) => a single commit/ fsync per batch.
+    - the read lanes: num_threads - 1 threads (at least 1) with read-only connections, never waiting behind the writes (WAL).
+    - the maintenance lane: a single thread with its own connection, running the maintenance tasks (backups,
+      migrations, chunked retention, etc.) one by one, outside of any transaction, so they never queue up
+      in front of the interactive tasks.
+    - the stream lane: num_stream_threads threads with read-only connections, producing the streamed reads
+      (iter_records); a stream holds its thread for as long as its consumer takes, so the streams never occupy
+      the read lanes and the streams over num_stream_threads are rejected with DbStreamLimitError.
+    execute() queues a write, execute_read() a read and execute_exclusive() a maintenance task; the tasks
+    still queued at their deadline (deadline_s after being queued) are rejected with DbTaskExpiredError.
+    """
+
     def __init__(self,
                  database_path: str,
                  timeout: int,
                  use_wal: bool = True,
-                 num_threads: int = 4):
+                 num_threads: int = 4,
+                 profile: Optional[all_sqlite_profiles] = None,
+                 pragmas: Optional[Dict] = None,
+                 instrumentation: Optional[QueryInstrumentation] = None,
+                 max_write_batch_size: int = 256,
+                 num_stream_threads: int = 2):
         self.database_path = database_path
         self.timeout = timeout
         self.use_wal = use_wal
-        self.queue = queue.Queue()
+        self.profile = profile
+        self.pragmas = pragmas
+        # shared by the connections of all the threads
+        self.instrumentation = instrumentation
+        self.max_write_batch_size = max_write_batch_size
+        # lane name -> queue of (priority rank, sequence, task)
+        self.queues = {'write': queue.PriorityQueue(),
+                       'read': queue.PriorityQueue(),
+                       'maintenance': queue.PriorityQueue(),
+                       'stream': queue.PriorityQueue()}
+        self.stats = {lane_name: _LaneStats() for lane_name in self.queues}
+        self._sequence = itertools.count()
         self._stop = False
-        self.num_threads = num_threads
+        self.num_read_threads = max(1, num_threads - 1)
+        self.num_stream_threads = max(1, num_stream_threads)
+        # one slot per stream thread, taken by submit_stream and released once the stream task is done
+        self._stream_slots = threading.BoundedSemaphore(self.num_stream_threads)
         self.threads = []
 
         # We need a barrier or counter to ensure ALL threads are ready before we proceed
         # otherwise the service might start accepting requests before connections are open.
-        self._ready_barrier = threading.Barrier(num_threads + 1)  # +1 for the main thread
+        self._ready_barrier = threading.Barrier(self.num_read_threads + self.num_stream_threads + 3)  # +1 for the writer, +1 for the maintenance, +1 for the main thread
 
         # NEW: Ensure the DB is in WAL mode before threads start
         # This prevents the "database is locked" race condition.
+        # (it also creates the db file, required by the read-only connections)
         with SqLiteDbWrapper(database_path=self.database_path,
                              timeout=self.timeout,
-                             use_wal=self.use_wal) as _:
+                             use_wal=self.use_wal,
+                             profile=self.profile,
+                             pragmas=self.pragmas) as _:
             pass
 
         # Now it is safe to start multiple threads
-        for _ in range(num_threads):
-            t = threading.Thread(target=self._run, daemon=True)
+        for target, args in ([(self._run_writer, ()), (self._run_maintenance, ())]
+                             + [(self._run_reader, ('read',))] * self.num_read_threads
+                             + [(self._run_reader, ('stream',))] * self.num_stream_threads):
+            t = threading.Thread(target=target, args=args, daemon=True)
             t.start()
             self.threads.append(t)
 
@@ -92,47 +235,180 @@ class SqliteDbWorker:
         except threading.BrokenBarrierError:
             print("Error: Database worker threads failed to initialize in time.")
 
-    def _run(self):
+    def _connect(self, read_only: bool) -> SqLiteDbWrapper:
         # Create a THREAD-LOCAL connection.
         # SQLite connections generally cannot be shared across threads.
         db = SqLiteDbWrapper(
             database_path=self.database_path,
             timeout=self.timeout,
-            use_wal=self.use_wal
+            use_wal=self.use_wal,
+            profile=self.profile,
+            pragmas=self.pragmas,
+            read_only=read_only,
+            instrumentation=self.instrumentation
         )
 
         # Set auto-commit mode
         db.con.isolation_level = None
 
+        return db
+
+    def _get_task(self, lane_name: str, block: bool = True) -> Optional[DbTask]:
+        # the next task of the lane, None for the stop sentinel; the expired tasks are rejected here
+        while True:
+            _, _, task = self.queues[lane_name].get(block=block)
+            self.queues[lane_name].task_done()
+            if task is None or task.start():
+                return task
+            self.stats[lane_name].record_expired()
+            self._task_done(lane_name, task)
+
+    def _task_done(self, lane_name: str, task: DbTask):
+        task.done.set()
+        if lane_name == 'stream':
+            self._stream_slots.release()
+
+    def _run_task(self, db: SqLiteDbWrapper, task: DbTask, lane_name: str,
+                  lock_wait_s: float = 0.0):
+        # the queue wait goes to the lane statistics only; the instrumentation gets the sqlite lock wait
+        # (the BEGIN IMMEDIATE of the write batch), plus what the wrapper measures itself
+        self.stats[lane_name].record(wait_s=time.perf_counter() - task.queued_at)
+        db._op_lock_wait_s = lock_wait_s
+        try:
+            task.result = task.fn(db, *task.args, **task.kwargs)
+        except Exception as e:
+            task.error = e
+        finally:
+            db._op_lock_wait_s = 0.0
+
+    def _run_reader(self, lane_name: str):
+        db = self._connect(read_only=True)
+
         # Signal that this specific thread is ready
         self._ready_barrier.wait()
 
         while not self._stop:
-            task: DbTask = self.queue.get()
+            task = self._get_task(lane_name)
+
+            # Sentinel value to stop the thread
+            if task is None:
+                break
+
+            self._run_task(db, task, lane_name)
+            if task.error:
+                self.stats[lane_name].record_error()
+            self._task_done(lane_name, task)
+
+        # Clean up when thread exits
+        db.con.close()
+
+    def _run_maintenance(self):
+        db = self._connect(read_only=False)
+
+        # Signal that this specific thread is ready
+        self._ready_barrier.wait()
+
+        while not self._stop:
+            task = self._get_task('maintenance')
+
+            # Sentinel value to stop the thread
+            if task is None:
+                break
+
+            # run alone, outside of any transaction opened here
+            self._run_task(db, task, 'maintenance')
+            try:
+                if db.con.in_transaction:
+                    if task.error:
+                        db.con.rollback()
+                    else:
+                        db.con.commit()
+            except Exception as e:
+                task.error = task.error or e
+            if task.error:
+                self.stats['maintenance'].record_error()
+            task.done.set()
+
+        # Clean up when thread exits
+        db.con.close()
+
+    def _run_write_batch(self, db: SqLiteDbWrapper, tasks: List[DbTask]):
+        start = time.perf_counter()
+        db.con.execute('BEGIN IMMEDIATE')
+        # BEGIN IMMEDIATE waits (up to timeout) for the write lock of the db, every write of the batch waited for it
+        lock_wait_s = time.perf_counter() - start
+        for task in tasks:
+            db.con.execute('SAVEPOINT write_task')
+            self._run_task(db, task, 'write', lock_wait_s=lock_wait_s)
+            if task.error:
+                db.con.execute('ROLLBACK TO SAVEPOINT write_task')
+            db.con.execute('RELEASE SAVEPOINT write_task')
+
+        # the results are only returned once committed
+        try:
+            db.con.commit()
+        except Exception as e:
+            db.con.rollback()
+            for task in tasks:
+                task.error = task.error or e
+
+    def _run_writer(self):
+        db = self._connect(read_only=False)
+
+        # Signal that this specific thread is ready
+        self._ready_barrier.wait()
+
+        stop = False
+        while not stop and not self._stop:
+            task = self._get_task('write')
 
             # Sentinel value to stop the thread
             if task is None:
-                self.queue.task_done()
                 break
 
+            # the queue is drained in priority order, so the interactive writes are batched first
+            tasks = [task]
+            while len(tasks) < self.max_write_batch_size:
+                try:
+                    next_task = self._get_task('write', block=False)
+                except queue.Empty:
+                    break
+                if next_task is None:
+                    stop = True
+                    break
+                tasks.append(next_task)
+
+            self.stats['write'].record_batch(len(tasks))
             try:
-                # Execute the task using THIS thread's connection
-                task.result = task.fn(db, *task.args, **task.kwargs)
-                db.con.commit()
+                self._run_write_batch(db, tasks)
             except Exception as e:
-                db.con.rollback()
-                task.error = e
+                # BEGIN/ SAVEPOINT failures (busy timeout, etc.)
+                if db.con.in_transaction:
+                    db.con.rollback()
+                for task in tasks:
+                    task.error = task.error or e
             finally:
-                task.done.set()
-                self.queue.task_done()
+                for task in tasks:
+                    if task.error:
+                        self.stats['write'].record_error()
+                    task.done.set()
 
         # Clean up when thread exits
-        if db:
-            db.con.close()
+        db.con.close()
+
+    def _enqueue(self, lane_name: str, task: DbTask) -> DbTask:
+        if task.priority == 'maintenance':
+            lane_name = 'maintenance'
+        self.queues[lane_name].put((TASK_PRIORITIES[task.priority], next(self._sequence), task))
+        return task
+
+    def _submit(self, lane_name: str, task: DbTask):
+        self._enqueue(lane_name, task)
 
-    def execute(self, fn, *args, **kwargs):
-        task = DbTask(fn, args, kwargs)
-        self.queue.put(task)
+        if task.deadline is not None:
+            if not task.done.wait(timeout=max(0.0, task.deadline - time.perf_counter())) and task.expire():
+                # rejected without waiting for the worker to reach it; it is skipped once dequeued
+                raise DbTaskExpiredError(f'the {task.priority} task expired after {time.perf_counter() - task.queued_at:.3f}s in the queue')
         task.done.wait()
 
         if task.error:
@@ -140,11 +416,72 @@ class SqliteDbWorker:
 
         return task.result
 
+    def execute(self, fn, *args,
+                priority: all_task_priorities = 'interactive',
+                deadline_s: Optional[float] = None,
+                **kwargs):
+        return self._submit('write', DbTask(fn, args, kwargs, priority=priority, deadline_s=deadline_s))
+
+    def execute_exclusive(self, fn, *args,
+                          deadline_s: Optional[float] = None,
+                          **kwargs):
+        return self._submit('maintenance', DbTask(fn, args, kwargs, priority='maintenance', deadline_s=deadline_s))
+
+    def execute_read(self, fn, *args,
+                     priority: all_task_priorities = 'interactive',
+                     deadline_s: Optional[float] = None,
+                     **kwargs):
+        return self._submit('read', DbTask(fn, args, kwargs, priority=priority, deadline_s=deadline_s))
+
+    def submit_read(self, fn, *args,
+                    priority: all_task_priorities = 'interactive',
+                    deadline_s: Optional[float] = None,
+                    **kwargs) -> DbTask:
+        # queues a read without waiting for it, the caller waits on task.done
+        return self._enqueue('read', DbTask(fn, args, kwargs, priority=priority, deadline_s=deadline_s))
+
+    def submit_stream(self, fn, *args,
+                      priority: all_task_priorities = 'bulk',
+                      deadline_s: Optional[float] = None,
+                      **kwargs) -> DbTask:
+        # queues a streamed read on the stream lane without waiting for it, the caller waits on task.done;
+        # rejected right away if all the stream threads are taken
+        if not self._stream_slots.acquire(blocking=False):
+            raise DbStreamLimitError(f'too many concurrent streams, at most {self.num_stream_threads}')
+        task = DbTask(fn, args, kwargs, priority=priority, deadline_s=deadline_s)
+        # never redirected to the maintenance lane, its slot is released by the stream lane
+        self.queues['stream'].put((TASK_PRIORITIES[task.priority], next(self._sequence), task))
+        return task
+
+    def _lanes_threads(self) -> List:
+        return [('write', 1), ('read', self.num_read_threads), ('maintenance', 1), ('stream', self.num_stream_threads)]
+
+    def get_stats(self) -> Dict:
+        # per lane: threads, queue depth, tasks, errors, expired tasks, queue wait (and write batches for the write lane)
+        stats = {}
+        for lane_name, lane_threads in self._lanes_threads():
+            lane_stats = self.stats[lane_name]
+            with lane_stats.lock:
+                stats[lane_name] = {'threads': lane_threads,
+                                    'queue_depth': self.queues[lane_name].qsize(),
+                                    'tasks': lane_stats.tasks,
+                                    'errors': lane_stats.errors,
+                                    'expired': lane_stats.expired,
+                                    'wait_s_avg': lane_stats.wait_s_total / lane_stats.tasks if lane_stats.tasks else 0.0,
+                                    'wait_s_max': lane_stats.wait_s_max}
+        with self.stats['write'].lock:
+            stats['write']['batches'] = self.stats['write'].batches
+            stats['write']['batch_size_avg'] = self.stats['write'].tasks / self.stats['write'].batches if self.stats['write'].batches else 0.0
+            stats['write']['batch_size_max'] = self.stats['write'].batch_size_max
+
+        return stats
+
     def shutdown(self):
         self._stop = True
-        # Put 'None' in the queue once for EACH thread
-        for _ in range(self.num_threads):
-            self.queue.put(None)
+        # Put 'None' in the queues once for EACH thread
+        for lane_name, lane_threads in self._lanes_threads():
+            for _ in range(lane_threads):
+                self.queues[lane_name].put((_STOP_RANK, next(self._sequence), None))
 
         # Wait for all threads to finish
         for t in self.threads:
@@ -155,27 +492,98 @@ class ServiceBackend(metaclass=Singleton_without_cache):
                  database_path: str,
                  timeout: int,
                  use_wal: bool = True,
-                 num_threads: int = 4):
+                 num_threads: int = 4,
+                 profile: Optional[all_sqlite_profiles] = None,
+                 pragmas: Optional[Dict] = None,
+                 instrumentation: Optional[QueryInstrumentation] = None,
+                 result_cache: Optional[SqLiteDbResultCache] = None,
+                 max_write_batch_size: int = 256,
+                 num_stream_threads: int = 2):
         self.worker = SqliteDbWorker(
             database_path=database_path,
             timeout=timeout,
             use_wal=use_wal,
-            num_threads=num_threads
+            num_threads=num_threads,
+            profile=profile,
+            pragmas=pragmas,
+            instrumentation=instrumentation,
+            max_write_batch_size=max_write_batch_size,
+            num_stream_threads=num_stream_threads
         )
+        # checked before queueing the reads, invalidated after the (committed) writes
+        self.result_cache = result_cache
+
+    def _execute_write(self,
+                       table_name: AnyStr,
+                       fn,
+                       priority: all_task_priorities = 'interactive',
+                       deadline_s: Optional[float] = None):
+        try:
+            return self.worker.execute(fn, priority=priority, deadline_s=deadline_s)
+        finally:
+            # the worker committed already, so no read can cache the data from before this write anymore
+            if self.result_cache is not None:
+                self.result_cache.invalidate(table_name)
+
+    def get_worker_stats(self) -> Dict:
+        return self.worker.get_stats()
+
+    def get_result_cache_stats(self) -> Dict:
+        return self.result_cache.get_stats() if self.result_cache is not None else {}
 
     def get_tables_columns(self):
-        return self.worker.execute(
+        return self.worker.execute_read(
             lambda db: db.get_tables_columns()
         )
 
+    def get_active_pragmas(self):
+        # a read: served by a read lane, not queued behind the writes (same profile/ pragmas on all the lanes)
+        return self.worker.execute_read(
+            lambda db: db.get_active_pragmas()
+        )
+
+    def get_instrumentation_stats(self) -> Dict:
+        # read directly, the instrumentation is thread safe
+        instrumentation = self.worker.instrumentation
+        if instrumentation is None:
+            return {'stats': {}, 'slow_queries': []}
+        return {'stats': instrumentation.get_stats(),
+                'slow_queries': instrumentation.get_slow_queries()}
+
+    def get_prometheus_metrics(self) -> str:
+        instrumentation = self.worker.instrumentation
+        return instrumentation.to_prometheus() if instrumentation else ''
+
     def insert_record(self,
                       table_name: AnyStr,
                       column_names: List,
-                      column_values: List):
-        self.worker.execute(
+                      column_values: List,
+                      priority: all_task_priorities = 'interactive',
+                      deadline_s: Optional[float] = None):
+        self._execute_write(
+            table_name,
             lambda db: db.append_in_table(table_name=table_name,
                                           column_names=column_names,
-                                          column_values=column_values)
+                                          column_values=column_values),
+            priority=priority,
+            deadline_s=deadline_s
+        )
+
+    def insert_records(self,
+                       table_name: AnyStr,
+                       column_names: List,
+                       rows: List[List],
+                       timestamp_per_row: bool = False,
+                       priority: all_task_priorities = 'bulk',
+                       deadline_s: Optional[float] = None) -> int:
+        return self._execute_write(
+            table_name,
+            lambda db: db.append_many_in_table(table_name=table_name,
+                                               column_names=column_names,
+                                               rows=rows,
+                                               timestamp_per_row=timestamp_per_row),
+            priority=priority,
+            deadline_s=deadline_s
         )
 
     def get_records(self,
@@ -184,59 +592,299 @@ class ServiceBackend(metaclass=Singleton_without_cache):
                     where_statement: Optional[str] = None,
                     order: Optional[Literal['DESC', 'ASC']] = None,
                     order_by: AnyStr = 'ID',
-                    limit: Optional[int] = None):
-        return self.worker.execute(
+                    limit: Optional[int] = None,
+                    where_filters: Optional[List] = None,
+                    priority: all_task_priorities = 'interactive',
+                    deadline_s: Optional[float] = None):
+        # no cache, or query parameters that can not be used as a cache key
+        cache_key = None
+        if self.result_cache is not None:
+            cache_key = self.result_cache.make_key(select_values, where_statement, where_filters, order, order_by, limit, 'rows')
+        if cache_key is not None:
+            result = self.result_cache.get(table_name, cache_key)
+            if result is not None:
+                return result
+            generation = self.result_cache.get_generation(table_name)
+
+        result = self.worker.execute_read(
             lambda db: db.return_records(table_name=table_name,
                                          select_values=select_values,
                                          where_statement=where_statement,
                                          order=order,
                                          order_by=order_by,
-                                         limit=limit)
+                                         limit=limit,
+                                         where_filters=where_filters),
+            priority=priority,
+            deadline_s=deadline_s
+        )
+
+        if cache_key is not None:
+            self.result_cache.put(table_name, cache_key, result, generation=generation)
+        return result
+
+    def iter_records(self,
+                     table_name: AnyStr,
+                     select_values: List[AnyStr] = (),
+                     where_statement: Optional[str] = None,
+                     order: Optional[Literal['DESC', 'ASC']] = None,
+                     order_by: AnyStr = 'ID',
+                     limit: Optional[int] = None,
+                     where_filters: Optional[List] = None,
+                     chunk_size: int = 1000,
+                     max_buffered_chunks: int = 4,
+                     priority: all_task_priorities = 'bulk',
+                     deadline_s: Optional[float] = None) -> Iterator[List]:
+        # yields the records chunk by chunk, as a stream thread fetches them: the stream thread is paused while
+        # max_buffered_chunks are waiting to be consumed, so neither side holds the whole result.
+        # A slow consumer only holds a stream thread, never a read lane; DbStreamLimitError if none is free
+        chunks = queue.Queue(maxsize=max_buffered_chunks)
+        cancelled = threading.Event()
+        end_of_records = object()
+
+        def put_chunk(chunk) -> bool:
+            # False if the consumer is gone
+            while not cancelled.is_set():
+                try:
+                    chunks.put(chunk, timeout=0.5)
+                    return True
+                except queue.Full:
+                    pass
+            return False
+
+        def produce_chunks(db):
+            try:
+                for chunk in db.iter_records(table_name=table_name,
+                                             select_values=select_values,
+                                             where_statement=where_statement,
+                                             order=order,
+                                             order_by=order_by,
+                                             limit=limit,
+                                             chunk_size=chunk_size,
+                                             yield_chunks=True,
+                                             where_filters=where_filters):
+                    if not put_chunk(chunk):
+                        return
+            finally:
+                put_chunk(end_of_records)
+
+        task = self.worker.submit_stream(produce_chunks, priority=priority, deadline_s=deadline_s)
+        try:
+            while True:
+                try:
+                    chunk = chunks.get(timeout=0.5)
+                except queue.Empty:
+                    if task.deadline is not None and time.perf_counter() > task.deadline and task.expire():
+                        raise DbTaskExpiredError(f'the {task.priority} task expired after {time.perf_counter() - task.queued_at:.3f}s in the queue')
+                    if task.done.is_set() and chunks.empty():
+                        # rejected by the worker (expired), nothing was produced
+                        break
+                    continue
+                if chunk is end_of_records:
+                    break
+                yield chunk
+
+            task.done.wait()
+            if task.error:
+                raise task.error
+        finally:
+            # the consumer stopped early (client disconnected, etc.) => the stream thread is released
+            cancelled.set()
+
+    def get_records_page(self,
+                         table_name: AnyStr,
+                         select_values: List[AnyStr] = (),
+                         where_statement: Optional[str] = None,
+                         order: Literal['DESC', 'ASC'] = 'ASC',
+                         order_by: AnyStr = 'ID',
+                         page_size: int = 1000,
+                         page_cursor: Optional[str] = None,
+                         where_filters: Optional[List] = None,
+                         priority: all_task_priorities = 'interactive',
+                         deadline_s: Optional[float] = None):
+        return self.worker.execute_read(
+            lambda db: db.return_records_page(table_name=table_name,
+                                              select_values=select_values,
+                                              where_statement=where_statement,
+                                              order=order,
+                                              order_by=order_by,
+                                              page_size=page_size,
+                                              page_cursor=page_cursor,
+                                              where_filters=where_filters),
+            priority=priority,
+            deadline_s=deadline_s
+        )
+
+    def get_aggregated(self,
+                       table_name: AnyStr,
+                       columns: List[AnyStr],
+                       bucket_s: int,
+                       agg: List[AnyStr] = ('avg', 'min', 'max', 'last'),
+                       since: Optional[int] = None,
+                       until: Optional[int] = None,
+                       where_statement: Optional[str] = None,
+                       timestamp_column_name: AnyStr = 'TIMESTAMP',
+                       priority: all_task_priorities = 'interactive',
+                       deadline_s: Optional[float] = None):
+        return self.worker.execute_read(
+            lambda db: db.return_aggregated(table_name=table_name,
+                                            columns=columns,
+                                            bucket_s=bucket_s,
+                                            agg=agg,
+                                            since=since,
+                                            until=until,
+                                            where_statement=where_statement,
+                                            timestamp_column_name=timestamp_column_name),
+            priority=priority,
+            deadline_s=deadline_s
         )
 
     def update_record(self,
                       table_name: AnyStr,
                       record_ID: int,
                       data: Dict,
-                      skip_new_empty_entries: bool = False):
-        self.worker.execute(
+                      skip_new_empty_entries: bool = False,
+                      priority: all_task_priorities = 'interactive',
+                      deadline_s: Optional[float] = None) -> int:
+        return self._execute_write(
+            table_name,
             lambda db: db.update_record(table_name=table_name,
                                         record_ID=record_ID,
                                         data=data,
-                                        skip_new_empty_entries=skip_new_empty_entries)
+                                        skip_new_empty_entries=skip_new_empty_entries),
+            priority=priority,
+            deadline_s=deadline_s
+        )
+
+    def update_records(self,
+                       table_name: AnyStr,
+                       records: Dict[int, Dict],
+                       skip_new_empty_entries: bool = False,
+                       priority: all_task_priorities = 'bulk',
+                       deadline_s: Optional[float] = None) -> int:
+        return self._execute_write(
+            table_name,
+            lambda db: db.update_records(table_name=table_name,
+                                         records=records,
+                                         skip_new_empty_entries=skip_new_empty_entries),
+            priority=priority,
+            deadline_s=deadline_s
         )
 
     def delete_record(self,
                       table_name: AnyStr,
-                      record_ID: int):
-        self.worker.execute(
+                      record_ID: int,
+                      priority: all_task_priorities = 'interactive',
+                      deadline_s: Optional[float] = None):
+        self._execute_write(
+            table_name,
             lambda db: db.delete_record(table_name=table_name,
-                                        record_ID=record_ID)
+                                        record_ID=record_ID),
+            priority=priority,
+            deadline_s=deadline_s
+        )
+
+    def delete_records(self,
+                       table_name: AnyStr,
+                       record_IDs: List[int],
+                       priority: all_task_priorities = 'bulk',
+                       deadline_s: Optional[float] = None) -> int:
+        return self._execute_write(
+            table_name,
+            lambda db: db.delete_records(table_name=table_name,
+                                         record_IDs=record_IDs),
+            priority=priority,
+            deadline_s=deadline_s
         )
 
     def clear_old_records(self,
                           table_name: AnyStr,
                           since_time_in_past_s: int,
-                          timestamp_column_name: AnyStr = 'TIMESTAMP'):
-        self.worker.execute(
+                          timestamp_column_name: AnyStr = 'TIMESTAMP',
+                          batch_size: Optional[int] = None,
+                          sleep_between_batches_s: float = 0,
+                          priority: all_task_priorities = 'bulk',
+                          deadline_s: Optional[float] = None) -> int:
+        return self._execute_write(
+            table_name,
             lambda db: db.clear_old_records(table_name=table_name,
                                             since_time_in_past_s=since_time_in_past_s,
-                                            timestamp_column_name=timestamp_column_name)
+                                            timestamp_column_name=timestamp_column_name,
+                                            batch_size=batch_size,
+                                            sleep_between_batches_s=sleep_between_batches_s),
+            # the chunked retention commits between its batches => maintenance lane
+            priority='maintenance' if batch_size else priority,
+            deadline_s=deadline_s
         )
 
-    def backup_db(self, output_filepath: str):
-        # Execute the backup using the worker's DB connection (db.con)
-        self.worker.execute(
+    def execute_batch(self,
+                      operations: List[Dict],
+                      atomic: bool = True,
+                      priority: all_task_priorities = 'interactive',
+                      deadline_s: Optional[float] = None) -> List[Dict]:
+        # runs the operations in order, on one worker connection, in a single transaction => a single commit
+        # atomic: the first failing operation rolls back the whole batch (BatchOperationError)
+        # otherwise each operation runs in a savepoint and only the failing ones are rolled back
+        # returns [{'status': 'ok', 'result': ...} or {'status': 'error', 'message': ...}] in the order of the operations
+        for operation_index, operation in enumerate(operations):
+            if operation.get('op') not in BATCH_OPERATIONS:
+                raise BatchOperationError(operation_index, operation.get('op'), ValueError(f'unknown operation, available: {list(BATCH_OPERATIONS.keys())}'))
+        written_table_names = {operation.get('table_name') for operation in operations if BATCH_OPERATIONS[operation['op']][1]}
+
+        def run_operation(db, operation: Dict):
+            method_name, _ = BATCH_OPERATIONS[operation['op']]
+            kwargs = {key: value for key, value in operation.items() if key != 'op'}
+            if operation['op'] == 'update_records':
+                # JSON object keys are always strings
+                kwargs['records'] = {int(record_ID): data for record_ID, data in kwargs['records'].items()}
+            return getattr(db, method_name)(**kwargs)
+
+        def run_batch(db):
+            results = []
+            with db.transaction():
+                for operation_index, operation in enumerate(operations):
+                    if atomic:
+                        try:
+                            results.append({'status': 'ok', 'result': run_operation(db, operation)})
+                        except Exception as e:
+                            raise BatchOperationError(operation_index, operation['op'], e)
+                        continue
+
+                    db.con.execute('SAVEPOINT batch_operation')
+                    try:
+                        results.append({'status': 'ok', 'result': run_operation(db, operation)})
+                        db.con.execute('RELEASE SAVEPOINT batch_operation')
+                    except Exception as e:
+                        db.con.execute('ROLLBACK TO SAVEPOINT batch_operation')
+                        db.con.execute('RELEASE SAVEPOINT batch_operation')
+                        results.append({'status': 'error', 'message': str(e)})
+            return results
+
+        try:
+            return self.worker.execute(run_batch, priority=priority, deadline_s=deadline_s)
+        finally:
+            if self.result_cache is not None:
+                for table_name in written_table_names:
+                    self.result_cache.invalidate(table_name)
+
+    def backup_db(self, output_filepath: str, deadline_s: Optional[float] = None):
+        # Execute the backup using the maintenance DB connection (db.con), outside of any transaction (VACUUM)
+        self.worker.execute_exclusive(
             lambda db: SqLiteDbbackup(input_filepath=db.database_path,
-                                      output_filepath=output_filepath).backup_db(source_connection=db.con)
+                                      output_filepath=output_filepath,
+                                      profile=self.worker.profile,
+                                      pragmas=self.worker.pragmas).backup_db(source_connection=db.con),
+            deadline_s=deadline_s
         )
 
-    def migrate_db(self, all_tables_def: Optional[List] = None):
-        # Execute the migration using the worker's DB wrapper (db)
-        self.worker.execute(
+    def migrate_db(self, all_tables_def: Optional[List] = None, deadline_s: Optional[float] = None):
+        # Execute the migration using the maintenance DB wrapper (db)
+        self.worker.execute_exclusive(
             lambda db: SqLiteDbMigration(database_path=db.database_path,
-                                         all_tables_def=all_tables_def).migrate(db_wrapper=db)
+                                         all_tables_def=all_tables_def).migrate(db_wrapper=db),
+            deadline_s=deadline_s
         )
+        if self.result_cache is not None:
+            self.result_cache.clear()
 
 def initialize_SqliteDbWrapper_service(LOCALHOST_ONLY=True,
                                        SERVICE_PORT=5834,
@@ -244,7 +892,16 @@ def initialize_SqliteDbWrapper_service(LOCALHOST_ONLY=True,
                                        timeout=60,
                                        use_wal=True,
                                        shutdown_watcher_mode: all_shutdown_watcher_modes = 'ag95_stdin_watcher',
-                                       num_threads: int = 4):
+                                       num_threads: int = 4,
+                                       profile: Optional[all_sqlite_profiles] = None,
+                                       pragmas: Optional[Dict] = None,
+                                       instrumentation: Optional[QueryInstrumentation] = None,
+                                       result_cache: Optional[SqLiteDbResultCache] = None,
+                                       max_write_batch_size: int = 256,
+                                       num_stream_threads: int = 2,
+                                       wire_formats: List[all_wire_formats] = ('json', 'msgpack'),
+                                       wire_compressions: List[all_wire_compressions] = ('zstd', 'gzip'),
+                                       compress_min_bytes: Optional[int] = 1024):
     # Create an event to signal the main service thread to exit
     stop_event = threading.Event()
 
@@ -256,7 +913,13 @@ def initialize_SqliteDbWrapper_service(LOCALHOST_ONLY=True,
         database_path=database_path,
         timeout=timeout,
         use_wal=use_wal,
-        num_threads=num_threads
+        num_threads=num_threads,
+        profile=profile,
+        pragmas=pragmas,
+        instrumentation=instrumentation,
+        result_cache=result_cache,
+        max_write_batch_size=max_write_batch_size,
+        num_stream_threads=num_stream_threads
     )
 
     # Start the watcher and use the handle_shutdown() handler
@@ -265,61 +928,237 @@ def initialize_SqliteDbWrapper_service(LOCALHOST_ONLY=True,
 
     app = Flask(__name__)
 
+    def task_options(payload: Dict) -> Dict:
+        # the optional 'priority' ('interactive', 'bulk', 'maintenance') and 'deadline_s' of the request,
+        # otherwise the defaults of the backend method apply
+        return {key: payload[key] for key in ('priority', 'deadline_s') if payload.get(key) is not None}
+
+    def data_response(data):
+        # the records are sent in the format/ compression negotiated with the Accept/ Accept-Encoding headers (JSON by default)
+        body, headers = encode_response(data,
+                                        accept=request.headers.get('Accept'),
+                                        accept_encoding=request.headers.get('Accept-Encoding'),
+                                        wire_formats=wire_formats,
+                                        wire_compressions=wire_compressions,
+                                        compress_min_bytes=compress_min_bytes)
+        return body, 200, headers
+
+    @app.errorhandler(DbTaskExpiredError)
+    def task_expired(e):
+        return {'status': 'error', 'message': str(e)}, 504
+
+    @app.errorhandler(DbStreamLimitError)
+    def stream_limit(e):
+        return {'status': 'error', 'message': str(e)}, 503
+
+    @app.errorhandler(ValueError)
+    def invalid_request(e):
+        return {'status': 'error', 'message': str(e)}, 400
+
     @app.get('/tables_columns')
     def tables_columns():
         return jsonify(backend.get_tables_columns())
 
+    @app.get('/active_pragmas')
+    def active_pragmas():
+        return jsonify(backend.get_active_pragmas())
+
+    @app.get('/instrumentation_stats')
+    def instrumentation_stats():
+        return jsonify(backend.get_instrumentation_stats())
+
+    @app.get('/worker_stats')
+    def worker_stats():
+        return jsonify(backend.get_worker_stats())
+
+    @app.get('/result_cache_stats')
+    def result_cache_stats():
+        return jsonify(backend.get_result_cache_stats())
+
+    @app.get('/metrics')
+    def metrics():
+        # Prometheus text exposition format
+        return backend.get_prometheus_metrics(), 200, {'Content-Type': 'text/plain; version=0.0.4'}
+
     @app.post('/insert_record')
     def insert_record():
         payload = request.json
         backend.insert_record(
             table_name=payload['table_name'],
             column_names=payload['column_names'],
-            column_values=payload['column_values']
+            column_values=payload['column_values'],
+            **task_options(payload)
         )
         return {'status': 'ok'}
 
+    @app.post('/insert_records')
+    def insert_records():
+        payload = request.json
+        rows_inserted = backend.insert_records(
+            table_name=payload['table_name'],
+            column_names=payload['column_names'],
+            rows=payload['rows'],
+            timestamp_per_row=payload.get('timestamp_per_row', False),
+            **task_options(payload)
+        )
+        return {'status': 'ok', 'rows_inserted': rows_inserted}
+
     @app.post('/update_record')
     def update_record():
         payload = request.json
-        backend.update_record(
+        rows_updated = backend.update_record(
             table_name=payload['table_name'],
             record_ID=payload['record_ID'],
             data=payload['data'],
-            skip_new_empty_entries=payload.get('skip_new_empty_entries')
+            skip_new_empty_entries=payload.get('skip_new_empty_entries'),
+            **task_options(payload)
         )
-        return {'status': 'ok'}
+        return {'status': 'ok', 'rows_updated': rows_updated}
+
+    @app.post('/update_records')
+    def update_records():
+        payload = request.json
+        rows_updated = backend.update_records(
+            table_name=payload['table_name'],
+            # JSON object keys are always strings
+            records={int(record_ID): data for record_ID, data in payload['records'].items()},
+            skip_new_empty_entries=payload.get('skip_new_empty_entries'),
+            **task_options(payload)
+        )
+        return {'status': 'ok', 'rows_updated': rows_updated}
 
     @app.post('/delete_record')
     def delete_record():
         payload = request.json
         backend.delete_record(
             table_name=payload['table_name'],
-            record_ID=payload['record_ID']
+            record_ID=payload['record_ID'],
+            **task_options(payload)
         )
         return {'status': 'ok'}
 
+    @app.post('/delete_records')
+    def delete_records():
+        payload = request.json
+        rows_removed = backend.delete_records(
+            table_name=payload['table_name'],
+            record_IDs=payload['record_IDs'],
+            **task_options(payload)
+        )
+        return {'status': 'ok', 'rows_removed': rows_removed}
+
     @app.post('/clear_old_records')
     def clear_old_records():
         payload = request.json
-        backend.clear_old_records(
+        rows_removed = backend.clear_old_records(
             table_name=payload['table_name'],
             since_time_in_past_s=payload['since_time_in_past_s'],
-            timestamp_column_name=payload.get('timestamp_column_name', 'TIMESTAMP')
+            timestamp_column_name=payload.get('timestamp_column_name', 'TIMESTAMP'),
+            batch_size=payload.get('batch_size'),
+            sleep_between_batches_s=payload.get('sleep_between_batches_s', 0),
+            **task_options(payload)
         )
-        return {'status': 'ok'}
+        return {'status': 'ok', 'rows_removed': rows_removed}
+
+    @app.post('/batch')
+    def batch():
+        # {'operations': [{'op': 'insert_record', 'table_name': ..., ...}, ...], 'atomic': True}
+        payload = request.json
+        try:
+            results = backend.execute_batch(
+                operations=payload['operations'],
+                atomic=payload.get('atomic', True),
+                **task_options(payload)
+            )
+            return data_response({'status': 'ok', 'results': results})
+        except BatchOperationError as e:
+            return {'status': 'error', 'message': str(e), 'operation_index': e.operation_index}, 400
 
     @app.get('/get_records')
     def get_records():
         payload = request.json
-        return jsonify(
+        return data_response(
             backend.get_records(
                 table_name=payload['table_name'],
                 select_values=payload.get('select_values'),
                 where_statement=payload.get('where_statement'),
                 order=payload.get('order'),
                 order_by=payload.get('order_by', 'ID'),
-                limit=payload.get('limit')
+                limit=payload.get('limit'),
+                # [[column, operator, value], ...], bound as parameters
+                where_filters=payload.get('where_filters'),
+                **task_options(payload)
+            )
+        )
+
+    @app.get('/iter_records')
+    def iter_records():
+        # streamed response: {'records': [...]} frames as the rows are fetched, then a {'status': 'ok', 'rows': N}
+        # or {'status': 'error', 'message': ...} trailer; NDJSON lines or length-prefixed msgpack frames (Accept header)
+        payload = request.json
+        wire_format = negotiate_wire_format(accept=request.headers.get('Accept'),
+                                            wire_formats=wire_formats)
+        records_chunks = backend.iter_records(
+            table_name=payload['table_name'],
+            select_values=payload.get('select_values'),
+            where_statement=payload.get('where_statement'),
+            order=payload.get('order'),
+            order_by=payload.get('order_by', 'ID'),
+            limit=payload.get('limit'),
+            where_filters=payload.get('where_filters'),
+            chunk_size=payload.get('chunk_size', 1000),
+            **task_options(payload)
+        )
+        # the first chunk is awaited here, so an expired/ invalid request still gets its HTTP error status
+        first_chunk = next(records_chunks, None)
+
+        def generate_frames():
+            rows = 0
+            try:
+                if first_chunk is not None:
+                    rows += len(first_chunk)
+                    yield encode_stream_frame({'records': first_chunk}, wire_format)
+                for chunk in records_chunks:
+                    rows += len(chunk)
+                    yield encode_stream_frame({'records': chunk}, wire_format)
+                yield encode_stream_frame({'status': 'ok', 'rows': rows}, wire_format)
+            except Exception as e:
+                yield encode_stream_frame({'status': 'error', 'message': str(e)}, wire_format)
+            finally:
+                records_chunks.close()
+
+        return Response(generate_frames(), content_type=STREAM_CONTENT_TYPES[wire_format])
+
+    @app.get('/get_records_page')
+    def get_records_page():
+        payload = request.json
+        records, next_page_cursor = backend.get_records_page(
+            table_name=payload['table_name'],
+            select_values=payload.get('select_values'),
+            where_statement=payload.get('where_statement'),
+            order=payload.get('order', 'ASC'),
+            order_by=payload.get('order_by', 'ID'),
+            page_size=payload.get('page_size', 1000),
+            page_cursor=payload.get('page_cursor'),
+            where_filters=payload.get('where_filters'),
+            **task_options(payload)
+        )
+        return data_response({'records': records, 'next_page_cursor': next_page_cursor})
+
+    @app.get('/get_aggregated')
+    def get_aggregated():
+        payload = request.json
+        return data_response(
+            backend.get_aggregated(
+                table_name=payload['table_name'],
+                columns=payload['columns'],
+                bucket_s=payload['bucket_s'],
+                agg=payload.get('agg', ['avg', 'min', 'max', 'last']),
+                since=payload.get('since'),
+                until=payload.get('until'),
+                where_statement=payload.get('where_statement'),
+                timestamp_column_name=payload.get('timestamp_column_name', 'TIMESTAMP'),
+                **task_options(payload)
             )
         )
 
@@ -330,8 +1169,11 @@ def initialize_SqliteDbWrapper_service(LOCALHOST_ONLY=True,
         output_filepath = payload.get('output_filepath', 'database_BAK.db')
 
         try:
-            backend.backup_db(output_filepath=output_filepath)
+            backend.backup_db(output_filepath=output_filepath,
+                              deadline_s=payload.get('deadline_s'))
             return {'status': 'ok', 'message': f'Backup created at {output_filepath}'}
+        except DbTaskExpiredError as e:
+            return {'status': 'error', 'message': str(e)}, 504
         except Exception as e:
             return {'status': 'error', 'message': str(e)}, 500
 
@@ -343,16 +1185,26 @@ def initialize_SqliteDbWrapper_service(LOCALHOST_ONLY=True,
         final_defs = None
 
         # If the user passed a schema in the JSON, we must reconstruct the objects
-        # because SqLiteDbMigration expects SqLiteColumnDef objects, not dicts.
+        # because SqLiteDbMigration expects SqLiteColumnDef/ SqLiteIndexDef/ SqLiteRollupDef objects, not dicts.
         if raw_defs:
             final_defs = []
             for table in raw_defs:
-                cols = [SqLiteColumnDef(c['column_name'], c['column_type']) for c in table['columns_def']]
-                final_defs.append({'table_name': table['table_name'], 'columns_def': cols})
+                cols = [SqLiteColumnDef(c['column_name'], c['column_type'], c.get('index', False)) for c in table['columns_def']]
+                indexes = [SqLiteIndexDef(i['columns'], i.get('unique', False), i.get('index_name')) for i in table.get('indexes_def', [])]
+                rollups = [SqLiteRollupDef(r['bucket_s'], r['columns'], r.get('aggregates', ['avg', 'min', 'max', 'count']), r.get('rollup_name'))
+                           for r in table.get('rollups_def', [])]
+                final_defs.append({'table_name': table['table_name'],
+                                   'columns_def': cols,
+                                   'indexes_def': indexes,
+                                   'rollups_def': rollups,
+                                   'index_timestamp': table.get('index_timestamp', True)})
 
         try:
-            backend.migrate_db(all_tables_def=final_defs)
+            backend.migrate_db(all_tables_def=final_defs,
+                               deadline_s=payload.get('deadline_s'))
             return {'status': 'ok', 'message': 'Migration completed'}
+        except DbTaskExpiredError as e:
+            return {'status': 'error', 'message': str(e)}, 504
         except Exception as e:
             return {'status': 'error', 'message': str(e)}, 500
 
@@ -374,6 +1226,9 @@ def initialize_SqliteDbWrapper_service(LOCALHOST_ONLY=True,
         stop_event.wait(timeout=1.0)
 
 if __name__ == '__main__':
+    from ag95.SqliteDatabaseService.SqLiteDbWireFormat import (decode_response,
+                                                               get_undecoded_content_encoding)
+
     SERVICE_PORT = 5834
 
     detached_thread = threading.Thread(target=initialize_SqliteDbWrapper_service,
@@ -436,7 +1291,142 @@ if __name__ == '__main__':
         expected = [[1, timestamp, 10, 5]]
         assert result == expected, f'wrong value returned ! expected  {expected}, got {result}'
 
+        # TEST batch, the operations see the writes of the previous ones
+        result = session.post(f'http://localhost:{SERVICE_PORT}/batch',
+                              json={'operations': [{'op': 'insert_record',
+                                                    'table_name': 'my_db_table_name',
+                                                    'column_names': ['my_column_name1', 'my_column_name2'],
+                                                    'column_values': [8, 6]},
+                                                   {'op': 'update_record',
+                                                    'table_name': 'my_db_table_name',
+                                                    'record_ID': 2,
+                                                    'data': {'my_column_name2': 9}},
+                                                   {'op': 'get_records',
+                                                    'table_name': 'my_db_table_name',
+                                                    'select_values': ['my_column_name2']}]}).json()
+        expected = {'status': 'ok', 'results': [{'status': 'ok', 'result': None},
+                                                {'status': 'ok', 'result': 1},
+                                                {'status': 'ok', 'result': [[5], [9]]}]}
+        assert result == expected, f'wrong value returned ! expected  {expected}, got {result}'
+
+        # TEST an atomic batch is rolled back entirely if one of its operations fails
+        result = session.post(f'http://localhost:{SERVICE_PORT}/batch',
+                              json={'operations': [{'op': 'delete_record',
+                                                    'table_name': 'my_db_table_name',
+                                                    'record_ID': 2},
+                                                   {'op': 'insert_record',
+                                                    'table_name': 'missing_table',
+                                                    'column_names': ['my_column_name1'],
+                                                    'column_values': [1]}]}).json()
+        expected = 1
+        assert result['operation_index'] == expected, f'wrong value returned ! expected  {expected}, got {result}'
+        result = len(session.get(f'http://localhost:{SERVICE_PORT}/get_records',
+                                 json={'table_name': 'my_db_table_name'}).json())
+        expected = 2
+        assert result == expected, f'wrong value returned ! expected  {expected}, got {result}'
+
+        # TEST the worker lanes statistics
+        result = result_before = session.get(f'http://localhost:{SERVICE_PORT}/worker_stats').json()
+        assert result['write']['tasks'] and result['read']['tasks'], f'wrong stats returned ! got {result}'
+
+        # TEST the active pragmas are read on a read lane
+        result = session.get(f'http://localhost:{SERVICE_PORT}/active_pragmas').json()['journal_mode']
+        expected = 'wal'
+        assert result == expected, f'wrong value returned ! expected  {expected}, got {result}'
+        worker_stats = session.get(f'http://localhost:{SERVICE_PORT}/worker_stats').json()
+        result = (worker_stats['write']['tasks'], worker_stats['read']['tasks'])
+        expected = (result_before['write']['tasks'], result_before['read']['tasks'] + 1)
+        assert result == expected, f'wrong value returned ! expected  {expected}, got {result}'
+
+        # TEST a task still queued at its deadline is rejected
+        result = session.post(f'http://localhost:{SERVICE_PORT}/insert_record',
+                              json={'table_name': 'my_db_table_name',
+                                    'column_names': ['my_column_name1', 'my_column_name2'],
+                                    'column_values': [1, 1],
+                                    'priority': 'bulk',
+                                    'deadline_s': 0}).status_code
+        expected = 504
+        assert result == expected, f'wrong value returned ! expected  {expected}, got {result}'
+
+        # TEST the msgpack + zstd wire format, JSON stays the default
+        result = session.get(f'http://localhost:{SERVICE_PORT}/get_records',
+                             json={'table_name': 'my_db_table_name'},
+                             headers={'Accept': 'application/msgpack', 'Accept-Encoding': 'zstd'})
+        assert result.headers['Content-Type'] == 'application/msgpack', f'wrong headers returned ! got {result.headers}'
+        result = decode_response(result.content,
+                                 result.headers['Content-Type'],
+                                 get_undecoded_content_encoding(result.headers.get('Content-Encoding')))
+        expected = session.get(f'http://localhost:{SERVICE_PORT}/get_records',
+                               json={'table_name': 'my_db_table_name'}).json()
+        assert result == expected, f'wrong value returned ! expected  {expected}, got {result}'
+
+        # TEST the streamed records
+        result = session.get(f'http://localhost:{SERVICE_PORT}/iter_records',
+                             json={'table_name': 'my_db_table_name',
+                                   'select_values': ['my_column_name1'],
+                                   'chunk_size': 1}).text
+        expected = '{"records":[[10]]}\n{"records":[[8]]}\n{"status":"ok","rows":2}\n'
+        assert result == expected, f'wrong value returned ! expected  {expected}, got {result}'
+
+        # TEST stalled stream consumers do not starve the interactive reads, the streams over the limit are rejected
+        session.post(f'http://localhost:{SERVICE_PORT}/insert_records',
+                     json={'table_name': 'my_db_table_name',
+                           'column_names': ['my_column_name1', 'my_column_name2'],
+                           'rows': [[i, i] for i in range(20)]})
+        # the singleton, already created by the service
+        backend = ServiceBackend(database_path='database.db', timeout=60)
+        stalled_streams = []
+        for _ in range(backend.worker.num_read_threads):
+            records_chunks = backend.iter_records(table_name='my_db_table_name',
+                                                  chunk_size=1,
+                                                  max_buffered_chunks=1)
+            try:
+                next(records_chunks)
+                stalled_streams.append(records_chunks)
+            except DbStreamLimitError:
+                pass
+        result = len(stalled_streams)
+        expected = backend.worker.num_stream_threads
+        assert result == expected, f'wrong value returned ! expected  {expected}, got {result}'
+        result = session.get(f'http://localhost:{SERVICE_PORT}/iter_records',
+                             json={'table_name': 'my_db_table_name'}).status_code
+        expected = 503
+        assert result == expected, f'wrong value returned ! expected  {expected}, got {result}'
+        result = len(session.get(f'http://localhost:{SERVICE_PORT}/get_records',
+                                 json={'table_name': 'my_db_table_name'},
+                                 timeout=5).json())
+        expected = 22
+        assert result == expected, f'wrong value returned ! expected  {expected}, got {result}'
+        for records_chunks in stalled_streams:
+            records_chunks.close()
+
         # TEST db backup
         session.post(f'http://localhost:{SERVICE_PORT}/backup_db')
 
+    # TEST the instrumentation reports the sqlite lock wait of the writes, not the queue wait of the tasks
+    import sqlite3
+    instrumentation = QueryInstrumentation()
+    worker = SqliteDbWorker(database_path='lock_wait_test.db',
+                            timeout=60,
+                            num_threads=2,
+                            instrumentation=instrumentation)
+    worker.execute(lambda db: db.create_table(table_name='my_lock_table',
+                                              columns_definition=[SqLiteColumnDef(column_name='v',
+                                                                                  column_type='INTEGER')]))
+    other_con = sqlite3.connect('lock_wait_test.db', check_same_thread=False)
+    other_con.execute('BEGIN IMMEDIATE')
+    threading.Timer(0.3, other_con.commit).start()
+    worker.execute(lambda db: db.append_in_table(table_name='my_lock_table',
+                                                 column_names=['v'],
+                                                 column_values=[1]))
+    worker.execute_read(lambda db: db.return_records(table_name='my_lock_table'))
+    result = instrumentation.get_stats()
+    assert result['append_in_table']['my_lock_table']['lock_wait_s_total'] >= 0.2, f'wrong stats returned ! got {result}'
+    assert result['return_records']['my_lock_table']['lock_wait_s_total'] == 0.0, f'wrong stats returned ! got {result}'
+    worker.shutdown()
+    other_con.close()
+    for filename in ['lock_wait_test.db', 'lock_wait_test.db-wal', 'lock_wait_test.db-shm']:
+        if os.path.exists(filename):
+            os.remove(filename)
+
     print('All tests are PASSED !')
\ No newline at end of file
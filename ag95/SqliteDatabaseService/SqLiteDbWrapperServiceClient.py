@@ -1,10 +1,45 @@
 import requests
+from contextlib import contextmanager
+from copy import copy
+from ag95.SqliteDatabaseService.SqLiteDbWireFormat import (all_wire_formats,
+                                                           all_wire_compressions,
+                                                           WIRE_FORMAT_CONTENT_TYPES,
+                                                           get_available_wire_formats,
+                                                           get_available_wire_compressions,
+                                                           decode_response,
+                                                           get_undecoded_content_encoding,
+                                                           iter_stream_frames)
 from typing import (List,
                     AnyStr,
+                    Iterator,
                     Optional,
                     Literal,
                     Dict)
 
+class SqLiteDbServiceBatch:
+    """
+    Collects operations for the service /batch endpoint, see SqLiteDbWrapperServiceClient.batch().
+
+    The methods have the same names and arguments as the ones of the client (insert_record, insert_records,
+    update_record, update_records, delete_record, delete_records, clear_old_records, get_records, get_aggregated)
+    but only queue the operation; the results are available in 'results' once the batch is sent.
+    """
+
+    def __init__(self):
+        self.operations = []
+        self.results = None
+
+    def __getattr__(self, operation_name: str):
+        if operation_name.startswith('_'):
+            raise AttributeError(operation_name)
+
+        def add_operation(**kwargs):
+            # the service validates the operation names and the arguments
+            self.operations.append({'op': operation_name, **kwargs})
+            return len(self.operations) - 1
+
+        return add_operation
+
 class SqLiteDbWrapperServiceClient:
     """
     A client library for interacting with the SqLiteDbWrapperService.
@@ -18,16 +53,37 @@ class SqLiteDbWrapperServiceClient:
         client.insert_record(...)
     """
 
-    def __init__(self, host: str = '127.0.0.1', port: int = 5834):
+    def __init__(self,
+                 host: str = '127.0.0.1',
+                 port: int = 5834,
+                 priority: Optional[Literal['interactive', 'bulk', 'maintenance']] = None,
+                 deadline_s: Optional[float] = None,
+                 wire_format: all_wire_formats = 'json',
+                 compression: Optional[all_wire_compressions] = None):
         """
         Initializes the client.
 
         Args:
             host (str): The hostname or IP address of the service.
             port (int): The port the service is running on.
+            priority (str): Optional priority class of all the requests: 'interactive', 'bulk' or 'maintenance'.
+                            By default the service picks one per operation (the bulk operations are 'bulk').
+            deadline_s (float): Optional deadline of all the requests; a request still queued on the service
+                                after deadline_s is rejected (HTTP 504).
+            wire_format (str): The format of the records returned by the service: 'json' or 'msgpack' (compact binary).
+            compression (str): Optional compression of the large responses: 'zstd' or 'gzip'.
         """
+        if wire_format not in get_available_wire_formats():
+            raise ValueError(f'Unavailable wire format {wire_format}, available: {get_available_wire_formats()}')
+        if compression is not None and compression not in get_available_wire_compressions():
+            raise ValueError(f'Unavailable compression {compression}, available: {get_available_wire_compressions()}')
+
         self.base_url = f"http://{host}:{port}"
         self.session = requests.Session()
+        # the service falls back to JSON/ no compression for the formats it does not support
+        self.session.headers['Accept'] = WIRE_FORMAT_CONTENT_TYPES[wire_format] + ('' if wire_format == 'json' else ', application/json;q=0.5')
+        self.session.headers['Accept-Encoding'] = compression or 'identity'
+        self.task_options = {key: value for key, value in (('priority', priority), ('deadline_s', deadline_s)) if value is not None}
 
     def __enter__(self):
         """Enables use of the 'with' statement."""
@@ -43,19 +99,38 @@ class SqLiteDbWrapperServiceClient:
             self.session.close()
             self.session = None
 
+    def with_options(self,
+                     priority: Optional[Literal['interactive', 'bulk', 'maintenance']] = None,
+                     deadline_s: Optional[float] = None) -> 'SqLiteDbWrapperServiceClient':
+        """
+        Returns a client sharing this client's session, sending its requests with the given priority/ deadline.
+
+        Usage:
+        client.with_options(priority='bulk', deadline_s=30).insert_records(...)
+        """
+        client = copy(self)
+        client.task_options = {**self.task_options,
+                               **{key: value for key, value in (('priority', priority), ('deadline_s', deadline_s)) if value is not None}}
+        return client
+
     def _request(self, method: str, endpoint: str, **kwargs):
         """Helper method to handle requests and errors."""
         if not self.session:
             raise RuntimeError("Session is closed. Cannot make requests.")
 
+        if self.task_options and kwargs.get('json') is not None:
+            kwargs['json'] = {**kwargs['json'], **self.task_options}
+
         url = self.base_url + endpoint
         try:
             # Set a reasonable timeout for all requests
             kwargs.setdefault('timeout', 30)
             response = self.session.request(method, url, **kwargs)
             response.raise_for_status()  # Raises an HTTPError for bad responses (4xx or 5xx)
-            if response.text:
-                return response.json()
+            if response.content:
+                return decode_response(response.content,
+                                       response.headers.get('Content-Type'),
+                                       get_undecoded_content_encoding(response.headers.get('Content-Encoding')))
             return {'status': 'ok'}  # Return a default success status for POSTs with no body
         except requests.exceptions.RequestException as e:
             print(f"Error communicating with the service: {e}")
@@ -65,6 +140,39 @@ class SqLiteDbWrapperServiceClient:
         """Retrieves all table names and their column definitions."""
         return self._request('get', '/tables_columns')
 
+    def get_active_pragmas(self) -> Dict:
+        """Retrieves the PRAGMA values active on the service connections (journal_mode, synchronous, etc.)."""
+        return self._request('get', '/active_pragmas')
+
+    def get_instrumentation_stats(self) -> Dict:
+        """
+        Retrieves the latency statistics of the service, if started with an instrumentation.
+
+        Returns:
+            Dict: {'stats': {operation: {table_name: {count, p50_s, p95_s, p99_s, rows_total, lock_wait_s_total, ...}}},
+                   'slow_queries': [{operation, table_name, duration_s, sql, ...}]}
+        """
+        return self._request('get', '/instrumentation_stats')
+
+    def get_worker_stats(self) -> Dict:
+        """
+        Retrieves the statistics of the service worker lanes.
+
+        Returns:
+            Dict: {'write': {threads, queue_depth, tasks, errors, wait_s_avg, wait_s_max, batches, batch_size_avg, batch_size_max},
+                   'read': {threads, queue_depth, tasks, errors, wait_s_avg, wait_s_max}}
+        """
+        return self._request('get', '/worker_stats')
+
+    def get_result_cache_stats(self) -> Dict:
+        """
+        Retrieves the counters of the service result cache, if started with one.
+
+        Returns:
+            Dict: {'hits', 'misses', 'hit_ratio', 'expired', 'evicted', 'invalidations', 'entries', 'bytes'}
+        """
+        return self._request('get', '/result_cache_stats')
+
     def insert_record(self, table_name: AnyStr, column_names: List, column_values: List) -> Dict:
         """Inserts a new record into a table."""
         payload = {
@@ -74,24 +182,173 @@ class SqLiteDbWrapperServiceClient:
         }
         return self._request('post', '/insert_record', json=payload)
 
+    def insert_records(self,
+                       table_name: AnyStr,
+                       column_names: List,
+                       rows: List[List],
+                       timestamp_per_row: bool = False) -> Dict:
+        """
+        Inserts many records into a table in a single transaction.
+
+        Args:
+            table_name (str): Target table name.
+            column_names (list): The column names, in the same order as the values of each row.
+            rows (list): A list of rows, each row being a list of values.
+            timestamp_per_row (bool): Stamp each row individually instead of once per batch.
+        """
+        payload = {
+            'table_name': table_name,
+            'column_names': column_names,
+            'rows': rows,
+            'timestamp_per_row': timestamp_per_row
+        }
+        return self._request('post', '/insert_records', json=payload)
+
     def get_records(self,
                     table_name: AnyStr,
                     select_values: Optional[List[AnyStr]] = None,
                     where_statement: Optional[str] = None,
                     order: Optional[Literal['DESC', 'ASC']] = None,
                     order_by: AnyStr = 'ID',
-                    limit: Optional[int] = None) -> List:
-        """Retrieves records from a table with optional filtering and ordering."""
+                    limit: Optional[int] = None,
+                    where_filters: Optional[List] = None) -> List:
+        """
+        Retrieves records from a table with optional filtering and ordering.
+
+        Args:
+            where_filters (Optional[List]): [(column, operator, value), ...] AND-ed together and bound as parameters,
+                                            e.g. [('my_column_name1', '>', 5), ('ID', 'IN', [1, 2])].
+                                            Preferred over where_statement, the service can reuse the prepared statement.
+        """
         payload = {
             'table_name': table_name,
             'select_values': select_values,
             'where_statement': where_statement,
             'order': order,
             'order_by': order_by,
-            'limit': limit
+            'limit': limit,
+            'where_filters': where_filters
         }
         return self._request('get', '/get_records', json=payload)
 
+    def iter_records(self,
+                     table_name: AnyStr,
+                     select_values: Optional[List[AnyStr]] = None,
+                     where_statement: Optional[str] = None,
+                     order: Optional[Literal['DESC', 'ASC']] = None,
+                     order_by: AnyStr = 'ID',
+                     limit: Optional[int] = None,
+                     where_filters: Optional[List] = None,
+                     chunk_size: int = 1000,
+                     yield_chunks: bool = False) -> Iterator:
+        """
+        Streams records from a table, the rows are yielded as the service fetches them (chunk_size rows at a time),
+        so neither the service nor the client holds the whole result.
+
+        Same arguments as get_records(); yields the rows one by one, or lists of rows if yield_chunks.
+        Raises a RuntimeError if the service fails or the stream is interrupted before its end.
+        Closing the iterator early (break, etc.) closes the stream and stops the service read.
+        """
+        if not self.session:
+            raise RuntimeError("Session is closed. Cannot make requests.")
+
+        payload = {
+            'table_name': table_name,
+            'select_values': select_values,
+            'where_statement': where_statement,
+            'order': order,
+            'order_by': order_by,
+            'limit': limit,
+            'where_filters': where_filters,
+            'chunk_size': chunk_size,
+            **self.task_options
+        }
+        # the stream is never compressed, the frames are decoded as they arrive
+        with self.session.get(self.base_url + '/iter_records',
+                              json=payload,
+                              headers={'Accept-Encoding': 'identity'},
+                              stream=True,
+                              timeout=30) as response:
+            response.raise_for_status()
+            completed = False
+            for frame in iter_stream_frames(response.raw, response.headers.get('Content-Type')):
+                if 'records' in frame:
+                    if yield_chunks:
+                        yield frame['records']
+                    else:
+                        yield from frame['records']
+                elif frame.get('status') == 'ok':
+                    completed = True
+                else:
+                    raise RuntimeError(f"The service failed while streaming the records: {frame.get('message')}")
+            if not completed:
+                raise RuntimeError("The records stream was interrupted before its end.")
+
+    def get_records_page(self,
+                         table_name: AnyStr,
+                         select_values: Optional[List[AnyStr]] = None,
+                         where_statement: Optional[str] = None,
+                         order: Literal['DESC', 'ASC'] = 'ASC',
+                         order_by: AnyStr = 'ID',
+                         page_size: int = 1000,
+                         page_cursor: Optional[str] = None,
+                         where_filters: Optional[List] = None) -> Dict:
+        """
+        Retrieves one page of records using keyset pagination.
+
+        Returns a dict with the 'records' of the page and the 'next_page_cursor',
+        which must be passed as page_cursor to get the next page (None on the last page).
+        where_filters: same as get_records(), the same filters must be passed for every page.
+        """
+        payload = {
+            'table_name': table_name,
+            'select_values': select_values,
+            'where_statement': where_statement,
+            'order': order,
+            'order_by': order_by,
+            'page_size': page_size,
+            'page_cursor': page_cursor,
+            'where_filters': where_filters
+        }
+        return self._request('get', '/get_records_page', json=payload)
+
+    def get_aggregated(self,
+                       table_name: AnyStr,
+                       columns: List[AnyStr],
+                       bucket_s: int,
+                       agg: List[AnyStr] = ('avg', 'min', 'max', 'last'),
+                       since: Optional[int] = None,
+                       until: Optional[int] = None,
+                       where_statement: Optional[str] = None,
+                       timestamp_column_name: AnyStr = 'TIMESTAMP') -> List:
+        """
+        Retrieves time bucketed aggregates (downsampled data), computed by the database.
+
+        Args:
+            table_name (str): Target table name.
+            columns (list): The columns to aggregate.
+            bucket_s (int): The bucket size in seconds.
+            agg (list): The aggregates, any of 'avg', 'min', 'max', 'sum', 'count', 'first', 'last'.
+            since (int): Optional unix timestamp, inclusive.
+            until (int): Optional unix timestamp, exclusive.
+            where_statement (str): Optional extra filter.
+            timestamp_column_name (str): Timestamp column name (default: 'TIMESTAMP').
+
+        Returns:
+            A list of rows: [bucket start, column1 agg1, column1 agg2, ..., column2 agg1, ...].
+        """
+        payload = {
+            'table_name': table_name,
+            'columns': columns,
+            'bucket_s': bucket_s,
+            'agg': list(agg),
+            'since': since,
+            'until': until,
+            'where_statement': where_statement,
+            'timestamp_column_name': timestamp_column_name
+        }
+        return self._request('get', '/get_aggregated', json=payload)
+
     def update_record(self,
                       table_name: AnyStr,
                       record_ID: int,
@@ -106,30 +363,93 @@ class SqLiteDbWrapperServiceClient:
         }
         return self._request('post', '/update_record', json=payload)
 
+    def update_records(self,
+                       table_name: AnyStr,
+                       records: Dict[int, Dict],
+                       skip_new_empty_entries: bool = False) -> Dict:
+        """
+        Updates many existing records of a table in a single transaction.
+
+        Args:
+            table_name (str): Target table name.
+            records (dict): Maps each record ID to the dict of its new column values.
+            skip_new_empty_entries (bool): Ignore the new values that are empty.
+        """
+        payload = {
+            'table_name': table_name,
+            'records': records,
+            'skip_new_empty_entries': skip_new_empty_entries
+        }
+        return self._request('post', '/update_records', json=payload)
+
     def delete_record(self, table_name: AnyStr, record_ID: int) -> Dict:
         """Deletes a record from a table by its ID."""
         payload = {'table_name': table_name, 'record_ID': record_ID}
         return self._request('post', '/delete_record', json=payload)
 
+    def delete_records(self, table_name: AnyStr, record_IDs: List[int]) -> Dict:
+        """Deletes many records from a table by their IDs, in a single transaction."""
+        payload = {'table_name': table_name, 'record_IDs': record_IDs}
+        return self._request('post', '/delete_records', json=payload)
+
     def clear_old_records(self,
                           table_name: AnyStr,
                           since_time_in_past_s: int,
-                          timestamp_column_name: AnyStr = 'TIMESTAMP') -> Dict:
+                          timestamp_column_name: AnyStr = 'TIMESTAMP',
+                          batch_size: Optional[int] = None,
+                          sleep_between_batches_s: float = 0) -> Dict:
         """
         Deletes records older than a given time window.
+        The number of deleted records is returned as 'rows_removed'.
 
         Args:
             table_name (str): Target table name.
             since_time_in_past_s (int): Age threshold in seconds.
             timestamp_column_name (str): Timestamp column name (default: 'TIMESTAMP').
+            batch_size (int): If set, delete in batches of this size, committing between the batches.
+            sleep_between_batches_s (float): Pause between the batches, to let the other writers in.
         """
         payload = {
             'table_name': table_name,
             'since_time_in_past_s': since_time_in_past_s,
-            'timestamp_column_name': timestamp_column_name
+            'timestamp_column_name': timestamp_column_name,
+            'batch_size': batch_size,
+            'sleep_between_batches_s': sleep_between_batches_s
         }
         return self._request('post', '/clear_old_records', json=payload)
 
+    def execute_batch(self, operations: List[Dict], atomic: bool = True) -> List[Dict]:
+        """
+        Runs many operations in a single HTTP request, in a single transaction on the service.
+
+        Args:
+            operations (list): [{'op': 'insert_record', 'table_name': ..., 'column_names': ..., 'column_values': ...}, ...]
+                               Each operation takes the same arguments as the client method of the same name.
+            atomic (bool): If True, a failing operation rolls back the whole batch and an HTTPError is raised.
+                           If False, only the failing operations are rolled back and reported as errors.
+
+        Returns:
+            A list with one {'status': 'ok', 'result': ...} or {'status': 'error', 'message': ...} per operation.
+        """
+        payload = {'operations': operations, 'atomic': atomic}
+        return self._request('post', '/batch', json=payload)['results']
+
+    @contextmanager
+    def batch(self, atomic: bool = True):
+        """
+        Collects the operations called inside the 'with' block and sends them as a single batch on exit.
+
+        Usage:
+        with client.batch() as batch:
+            batch.insert_record(table_name=..., column_names=..., column_values=...)
+            batch.update_record(table_name=..., record_ID=..., data=...)
+        print(batch.results)
+        """
+        batch = SqLiteDbServiceBatch()
+        yield batch
+        if batch.operations:
+            batch.results = self.execute_batch(operations=batch.operations, atomic=atomic)
+
     def backup_db(self, output_filepath: str = 'database_BAK.db') -> Dict:
         """Triggers a database backup on the service."""
         payload = {'output_filepath': output_filepath}
@@ -207,6 +527,17 @@ if __name__ == '__main__':
             )
             print("✅ Test 3: Insert Record successful")
 
+            # 3b. Test Insert Records (bulk)
+            result = client.insert_records(
+                table_name='my_test_table',
+                column_names=['col_A', 'col_B'],
+                rows=[[1, 'a'], [2, 'b']]
+            )
+            assert result['rows_inserted'] == 2, f"Expected 2 inserted rows, got {result}"
+            client.delete_record(table_name='my_test_table', record_ID=2)
+            client.delete_record(table_name='my_test_table', record_ID=3)
+            print("✅ Test 3b: Insert Records successful")
+
             # 4. Test Get Records
             records = client.get_records(table_name='my_test_table')
             assert len(records) == 1, "Should be 1 record"
@@ -222,6 +553,16 @@ if __name__ == '__main__':
             assert records_subset == expected_subset, f"Expected {expected_subset}, got {records_subset}"
             print("✅ Test 5: Get Specific Columns successful")
 
+            # 5b. Test Get Records Page with where filters
+            page = client.get_records_page(table_name='my_test_table',
+                                           select_values=['col_A'],
+                                           where_filters=[('col_A', '>', 100)])
+            assert page == {'records': [[123]], 'next_page_cursor': None}, f"Unexpected {page}"
+            page = client.get_records_page(table_name='my_test_table',
+                                           where_filters=[('col_A', '<', 100)])
+            assert page['records'] == [], f"Unexpected {page}"
+            print("✅ Test 5b: Get Records Page successful")
+
             # 6. Test Update Record
             client.update_record(table_name='my_test_table', record_ID=1, data={'col_B': 'world'})
             updated_records = client.get_records(table_name='my_test_table')
@@ -234,6 +575,47 @@ if __name__ == '__main__':
             assert final_records == [], "Delete failed, record still exists"
             print("✅ Test 7: Delete Record successful")
 
+            # 7b. Test Batch
+            with client.batch() as batch:
+                batch.insert_record(table_name='my_test_table', column_names=['col_A', 'col_B'], column_values=[1, 'a'])
+                batch.insert_records(table_name='my_test_table', column_names=['col_A', 'col_B'], rows=[[2, 'b'], [3, 'c']])
+                batch.get_records(table_name='my_test_table', select_values=['col_A'])
+            expected_results = [{'status': 'ok', 'result': None},
+                                {'status': 'ok', 'result': 2},
+                                {'status': 'ok', 'result': [[1], [2], [3]]}]
+            assert batch.results == expected_results, f"Expected {expected_results}, got {batch.results}"
+            results = client.execute_batch([{'op': 'delete_records', 'table_name': 'my_test_table', 'record_IDs': [4]},
+                                            {'op': 'delete_records', 'table_name': 'missing_table', 'record_IDs': [5]}],
+                                           atomic=False)
+            assert results[0] == {'status': 'ok', 'result': 1} and results[1]['status'] == 'error', f"Unexpected {results}"
+            print("✅ Test 7b: Batch successful")
+
+            # 7c. Test Priority & Deadline
+            client.with_options(priority='bulk', deadline_s=10).insert_record(table_name='my_test_table',
+                                                                             column_names=['col_A', 'col_B'],
+                                                                             column_values=[4, 'd'])
+            try:
+                client.with_options(deadline_s=0).get_records(table_name='my_test_table')
+                assert False, "An expired request was executed"
+            except requests.exceptions.HTTPError as e:
+                assert e.response.status_code == 504, f"Expected HTTP 504, got {e.response.status_code}"
+            print("✅ Test 7c: Priority & Deadline successful")
+
+            # 7d. Test the msgpack + zstd wire format
+            with SqLiteDbWrapperServiceClient(port=TEST_SERVICE_PORT, wire_format='msgpack', compression='zstd') as binary_client:
+                binary_records = binary_client.get_records(table_name='my_test_table')
+            assert binary_records == client.get_records(table_name='my_test_table'), f"Unexpected {binary_records}"
+            print("✅ Test 7d: Binary wire format successful")
+
+            # 7e. Test the streamed records, JSON lines and msgpack frames
+            expected_records = client.get_records(table_name='my_test_table')
+            streamed_records = list(client.iter_records(table_name='my_test_table', chunk_size=1))
+            assert streamed_records == expected_records, f"Unexpected {streamed_records}"
+            with SqLiteDbWrapperServiceClient(port=TEST_SERVICE_PORT, wire_format='msgpack') as binary_client:
+                streamed_chunks = list(binary_client.iter_records(table_name='my_test_table', chunk_size=2, yield_chunks=True))
+            assert sum(streamed_chunks, []) == expected_records and len(streamed_chunks[0]) == 2, f"Unexpected {streamed_chunks}"
+            print("✅ Test 7e: Streamed records successful")
+
             # 8. Test DB Backup
             client.backup_db(output_filepath=TEST_BACKUP_FILE)
             assert os.path.exists(TEST_BACKUP_FILE), "Backup file was not created"
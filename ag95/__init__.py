@@ -28,6 +28,8 @@ try:
     from .General.filepaths_from_folderpath import extract_filenames_from_filepath
     from .General.filepaths_from_folderpath import extract_filenames_from_folderpath
     from .General.shorten_long_strings import shorten_long_str
+    from .General.query_instrumentation import QueryInstrumentation
+    from .General.sql_where_builder import compile_where_filters
 except:
     pass
 
@@ -41,9 +43,16 @@ except:
 # ############## SqliteDatabase #################
 try:
     from .SqliteDatabase.SqLiteDbWrapper import (SqLiteDbWrapper,
-                                                 SqLiteColumnDef)
+                                                 SqLiteColumnDef,
+                                                 SqLiteIndexDef,
+                                                 SqLiteRollupDef)
     from .SqliteDatabase.SqLiteDbMigration import SqLiteDbMigration
     from .SqliteDatabase.SqLiteDbBackup import SqLiteDbbackup
+    from .SqliteDatabase.SqLiteDbConnectionPool import SqLiteDbConnectionPool
+    from .SqliteDatabase.SqLiteDbBufferedWriter import SqLiteDbBufferedWriter
+    from .SqliteDatabase.SqLiteDbResultCache import SqLiteDbResultCache
+    from .SqliteDatabase.AsyncSqLiteDbWrapper import AsyncSqLiteDbWrapper
+    from .SqliteDatabase.SqLiteDbPartitionedWrapper import SqLiteDbPartitionedWrapper
 except:
     pass
 
@@ -66,8 +75,10 @@ except:
 # ############## DuckDbDatabase #################
 try:
     from .DuckDbDatabase.DuckDbWrapper import (DuckDbWrapper,
-                                               DuckColumnDef)
+                                               DuckColumnDef,
+                                               DuckRollupDef)
     from .DuckDbDatabase.DuckDbMigration import DuckDbMigration
+    from .DuckDbDatabase.AsyncDuckDbWrapper import AsyncDuckDbWrapper
     from .DuckDbDatabase.DuckDbbackup import DuckDbbackup
 except:
     pass
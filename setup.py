@@ -29,7 +29,9 @@ setup(
             'concurrent_log_handler',
             'flask',
             'waitress',
-            'requests'
+            'requests',
+            'msgpack',
+            'zstandard'
         ],
         "GenericDatabase": [
             'concurrent_log_handler'
@@ -53,11 +55,18 @@ setup(
         "IO": [],
         "Colors": [],
         "EmailHandler": [],
+        # optional, the columnar output of the Sqlite/ DuckDb wrappers is returned as NumPy arrays if installed
+        "columnar": [
+            'numpy'
+        ],
         "all": ['concurrent_log_handler',
                 'duckdb',
                 'plotly',
                 'keyring',
-                'requests']
+                'requests',
+                'msgpack',
+                'zstandard',
+                'numpy']
     },
     keywords=['python', 'ag95']
 )
\ No newline at end of file